@@ -0,0 +1,139 @@
+"""
+Admission control for the detection endpoints.
+
+Decoding a capture and running it through the model takes far longer than
+any page route, and without a limit a burst of captures ties up every
+server thread while /, /inventory and the rest wait behind them.
+AdmissionGate runs that work on a small bounded executor instead:
+
+- at most `concurrency` jobs run at once and at most `queue` more wait for
+  a slot; anything beyond that is turned away at once (HTTP 429)
+- a job that can't start within `queue_timeout` seconds is cancelled
+  (HTTP 503), so a request never hangs on a saturated model
+- both answers carry a Retry-After estimated from recent job times
+
+Request threads only wait on admitted jobs, so the number of threads
+detection can hold is bounded by concurrency + queue and page routes keep
+the rest. Configured with LABCV_DETECT_CONCURRENCY, LABCV_DETECT_QUEUE and
+LABCV_DETECT_QUEUE_TIMEOUT.
+"""
+
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Overloaded(Exception):
+    """The gate turned a job away; carries the HTTP status and Retry-After seconds."""
+
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """A bounded executor that rejects work it can't start soon."""
+
+    def __init__(self, concurrency=4, queue=16, queue_timeout=10.0, name='labcv-detect'):
+        self.concurrency = max(1, int(concurrency))
+        self.queue = max(0, int(queue))
+        self.queue_timeout = float(queue_timeout)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=name)
+        self._admission = threading.BoundedSemaphore(self.concurrency + self.queue)
+        self._lock = threading.Lock()
+        self._running = 0
+        self._waiting = 0
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.completed = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def retry_after(self):
+        """Seconds until a new job would likely get a slot (1-30)."""
+        with self._lock:
+            per_job = self.run_seconds / self.completed if self.completed else 1.0
+            backlog = self._running + self._waiting
+        return max(1, min(30, math.ceil(per_job * backlog / self.concurrency)))
+
+    def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the executor and return its result.
+
+        Raises Overloaded (429) when the queue is full and Overloaded (503)
+        when the job doesn't start within queue_timeout. Exceptions from fn
+        propagate unchanged.
+        """
+        if not self._admission.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise Overloaded(429, "Too many detection requests right now. Please try again shortly.",
+                             self.retry_after())
+        started = threading.Event()
+        submitted_at = time.perf_counter()
+
+        def job():
+            began = time.perf_counter()
+            with self._lock:
+                self._waiting -= 1
+                self._running += 1
+                self.wait_seconds += began - submitted_at
+            started.set()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self.completed += 1
+                    self.run_seconds += time.perf_counter() - began
+
+        with self._lock:
+            self.admitted += 1
+            self._waiting += 1
+        future = self._executor.submit(job)
+        future.add_done_callback(lambda _: self._admission.release())
+
+        if not started.wait(self.queue_timeout) and future.cancel():
+            with self._lock:
+                self._waiting -= 1
+                self.admitted -= 1
+                self.timed_out += 1
+            raise Overloaded(503, "Detection is busy. Please try again in a few seconds.", self.retry_after())
+        return future.result()
+
+    def reset_stats(self):
+        with self._lock:
+            self._reset_stats()
+
+    def stats(self):
+        with self._lock:
+            started = self.completed + self._running
+            return {
+                'concurrency': self.concurrency,
+                'queue': self.queue,
+                'queue_timeout_seconds': self.queue_timeout,
+                'running': self._running,
+                'waiting': self._waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'completed': self.completed,
+                'avg_wait_ms': (self.wait_seconds / started * 1000.0) if started else 0.0,
+                'avg_run_ms': (self.run_seconds / self.completed * 1000.0) if self.completed else 0.0,
+            }
+
+
+def gate_from_env():
+    """Build an AdmissionGate from LABCV_DETECT_CONCURRENCY / _QUEUE / _QUEUE_TIMEOUT."""
+    return AdmissionGate(
+        concurrency=int(os.environ.get('LABCV_DETECT_CONCURRENCY', os.environ.get('LABCV_BATCH_SIZE', '4'))),
+        queue=int(os.environ.get('LABCV_DETECT_QUEUE', '16')),
+        queue_timeout=float(os.environ.get('LABCV_DETECT_QUEUE_TIMEOUT', '10')),
+    )
@@ -1,18 +1,128 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, stream_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, g
+from flask import before_render_template, template_rendered
 import sqlite3
-from ultralytics import YOLO
+import threading
 import cv2
 import numpy as np
 import base64
 import datetime
+import json
+import multiprocessing
+import sys
+import time
+from admission import Overloaded, gate_from_env
+from inference import ModelLoader, scheduler_from_env
+from backends import load_backend_from_env
+from frame_cache import cache_from_env
+from streaming import StreamHub, StreamFull
+from tiling import cameras_from_env
+from tracking import EquipmentTracker
+import balances
+import bulk
+import db
+from db import get_db
+import metrics
+import migrations
+import rollups
+import search
+import worker_pool
+from inventory_cache import InventoryCache
+from pipeline import Letterbox, class_filter, letterbox_from_env, options_from_env
+from pagination import KeysetPage, decode_cursor, keyset_condition, order_by, page_size_arg
+from profiler import profiler_from_env
 
 # Load YOLO model once - use relative path
 model_path = os.path.join(os.path.dirname(__file__), "after_dsmtf.pt")
-model = YOLO(model_path)
+
+# LABCV_INFERENCE_WORKERS moves the model into separate processes; see worker_pool.py
+INFERENCE_WORKERS = worker_pool.workers_from_env()
+
+def _load_model():
+    # ultralytics/torch are only imported by the background loader thread so
+    # that importing app stays fast. LABCV_BACKEND picks torch, onnx or openvino.
+    if INFERENCE_WORKERS:
+        return worker_pool.pool_from_env(model_path, INFERENCE_WORKERS)
+    return load_backend_from_env(model_path)
+
+def _warm_up_model(m):
+    m([np.zeros((240, 320, 3), dtype=np.uint8)])
+
+# The model loads on a background thread; see /readyz
+model_loader = ModelLoader(_load_model, warmup=_warm_up_model)
+
+# Letterboxing, confidence/NMS limits and the inventory class filter; see pipeline.py
+letterbox = letterbox_from_env()
+detection_options = options_from_env()
+
+def model_options(model):
+    """Keyword arguments for the next model call: only classes that are inventory items."""
+    return detection_options.kwargs(class_filter(model.names, CLASS_TO_EQUIPMENT, get_inventory_dict()))
+
+def _predict(frames):
+    model = model_loader.model
+    return model(frames, **model_options(model))
+
+# Frames from concurrent captures are batched into a single model call
+scheduler = scheduler_from_env(_predict)
 
 app = Flask(__name__)
 app.secret_key = 'secret'
+db.init_app(app)
+
+# ---------- Metrics ----------
+# Exported at /metrics; see metrics.py
+registry = metrics.Registry()
+REQUEST_LATENCY = registry.histogram(
+    'labcv_http_request_duration_seconds', "Time to handle a request, by route template.",
+    labels=('method', 'route', 'status'))
+DETECTION_STAGES = registry.histogram(
+    'labcv_detection_stage_seconds', "Time spent in each stage of handling a capture.", labels=('stage',))
+TEMPLATE_RENDER = registry.histogram(
+    'labcv_template_render_seconds', "Time to render a template.", labels=('template',))
+REQUEST_QUERIES = registry.histogram(
+    'labcv_request_db_queries', "SQLite statements executed per request.", labels=('route',),
+    buckets=metrics.COUNT_BUCKETS)
+REQUEST_QUERY_TIME = registry.histogram(
+    'labcv_request_db_seconds', "Time spent in SQLite per request.", labels=('route',))
+
+# Sampling profiler, toggled at runtime with POST /debug/profiler by the
+# addresses in LABCV_PROFILER_CLIENTS (default: this machine only)
+profiler = profiler_from_env()
+PROFILER_CLIENTS = {addr.strip() for addr in os.environ.get('LABCV_PROFILER_CLIENTS', '127.0.0.1,::1').split(',')
+                    if addr.strip()}
+
+@app.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    db.start_tally()
+
+@app.after_request
+def _remember_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def _observe_request(exception=None):
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    status = g.pop('response_status', 500 if exception is not None else 200)
+    REQUEST_LATENCY.observe(time.perf_counter() - started, method=request.method, route=route, status=status)
+    queries, seconds = db.stop_tally()
+    REQUEST_QUERIES.observe(queries, route=route)
+    REQUEST_QUERY_TIME.observe(seconds, route=route)
+
+@before_render_template.connect_via(app)
+def _template_started(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def _template_finished(sender, template, context, **extra):
+    started = g.get('render_started')
+    if started:
+        TEMPLATE_RENDER.observe(time.perf_counter() - started.pop(), template=template.name)
 
 # Map YOLO class names to actual inventory names
 CLASS_TO_EQUIPMENT = {
@@ -29,62 +139,71 @@ CLASS_TO_EQUIPMENT = {
 }
 
 # ---------- DB Setup ----------
-def init_db():
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
+db_ready = threading.Event()
 
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS students (
-            student_id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            course TEXT,
-            year_level INTEGER,
-            number_of_equipment INTEGER DEFAULT 0
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS equipment_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id TEXT NOT NULL,
-            equipment_name TEXT NOT NULL,
-            action TEXT CHECK(action IN ('borrow', 'return')),
-            timestamp TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS inventory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            quantity INTEGER DEFAULT 0
-        )
-    ''')
-    
-    # Add the new column to existing tables if it doesn't already exist
-    try:
-        c.execute("ALTER TABLE students ADD COLUMN number_of_equipment INTEGER DEFAULT 0")
-    except:
-        pass  # Column already exists
-    
-    conn.commit()
-    conn.close()
+def init_db():
+    """Bring the schema up to date (see migrations.py)."""
+    migrations.migrate(get_db())
+    db_ready.set()
 
 # ---------- Helper Functions ----------
+# Shared inventory snapshot; see inventory_cache.py
+inventory_cache = InventoryCache(lambda: db.pool.connect())
+
 def get_inventory():
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
-    c.execute("SELECT id, name, quantity FROM inventory ORDER BY name ASC")
-    items = c.fetchall()
-    conn.close()
-    return items
+    return inventory_cache.items()
 
 def get_inventory_dict():
     """Return dict: equipment_name -> quantity"""
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
-    c.execute("SELECT name, quantity FROM inventory")
-    items = c.fetchall()
-    conn.close()
-    return {name: qty for name, qty in items}
+    return inventory_cache.as_dict()
+
+class TransactionError(Exception):
+    """A borrow/return cart that can't be recorded; the message is shown to the user."""
+
+def record_transaction(conn, student_id, action, items):
+    """Record a borrow/return cart atomically. Returns the total quantity.
+
+    `items` is a list of (equipment_name, quantity). The student and every
+    item are validated with one query each, all log rows are written with a
+    single executemany (with equipment_balance and the usage rollups updated
+    alongside), and the whole cart runs in one BEGIN IMMEDIATE transaction so
+    concurrent kiosks can't interleave partial carts.
+    """
+    total_quantity = sum(qty for _, qty in items)
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not conn.execute("SELECT 1 FROM students WHERE student_id=?", (student_id,)).fetchone():
+            raise TransactionError("Student not found. Please register first.")
+
+        missing = conn.execute(
+            "SELECT value FROM json_each(?) WHERE value NOT IN (SELECT name FROM inventory) LIMIT 1",
+            (json.dumps([name for name, _ in items]),)).fetchone()
+        if missing:
+            raise TransactionError(f"Equipment '{missing[0]}' not found in inventory.")
+
+        try:
+            conn.executemany(
+                "INSERT INTO equipment_log (student_id, equipment_name, action, quantity) VALUES (?, ?, ?, ?)",
+                [(student_id, name, action, qty) for name, qty in items])
+            balances.apply(conn, student_id, action, items)
+            rollups.catch_up(conn)
+        except sqlite3.Error as e:
+            raise TransactionError(f"Error logging transaction: {str(e)}") from e
+
+        # Update student's equipment count
+        if action == "borrow":
+            conn.execute("UPDATE students SET number_of_equipment = COALESCE(number_of_equipment, 0) + ? "
+                         "WHERE student_id=?", (total_quantity, student_id))
+        elif action == "return":
+            conn.execute("UPDATE students SET number_of_equipment = MAX(0, COALESCE(number_of_equipment, 0) - ?) "
+                         "WHERE student_id=?", (total_quantity, student_id))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return total_quantity
 
 # ---------- Routes ----------
 @app.route('/')
@@ -99,11 +218,11 @@ def register():
         course = request.form['course']
         year = request.form['year_level']
 
-        conn = sqlite3.connect("database.db")
+        conn = get_db()
         c = conn.cursor()
-        c.execute("INSERT OR IGNORE INTO students VALUES (?, ?, ?, ?)", (sid, name, course, year))
+        c.execute("INSERT OR IGNORE INTO students (student_id, name, course, year_level) VALUES (?, ?, ?, ?)",
+                  (sid, name, course, year))
         conn.commit()
-        conn.close()
         flash("Student registered successfully!")
         return redirect(url_for('register'))
 
@@ -111,8 +230,9 @@ def register():
 
 @app.route('/borrow_return', methods=['GET', 'POST'])
 def borrow_return():
-    inventory = get_inventory()
-    inventory_dict = get_inventory_dict()
+    snapshot = inventory_cache.snapshot()
+    inventory = snapshot.items
+    inventory_dict = snapshot.by_name
     detected_items = request.args.get('detected')
     if detected_items:
         detected_items = detected_items.split(',')
@@ -145,99 +265,223 @@ def borrow_return():
             flash("Invalid quantity entered.")
             return redirect(url_for('borrow_return'))
 
-        conn = sqlite3.connect("database.db")
-        c = conn.cursor()
-        
-        # Verify student exists
-        c.execute("SELECT number_of_equipment FROM students WHERE student_id=?", (student_id,))
-        student_row = c.fetchone()
-        if not student_row:
-            flash("Student not found. Please register first.")
-            conn.close()
+        try:
+            total_quantity = record_transaction(get_db(), student_id, action,
+                                                list(zip(equipment_names, quantities)))
+        except TransactionError as e:
+            flash(str(e))
             return redirect(url_for('borrow_return'))
-        
-        current_student_items = student_row[0] or 0
-        total_quantity = sum(quantities)
-        
-        # Verify all equipment exists
-        for equipment_name in equipment_names:
-            c.execute("SELECT quantity FROM inventory WHERE name=?", (equipment_name,))
-            if not c.fetchone():
-                flash(f"Equipment '{equipment_name}' not found in inventory.")
-                conn.close()
-                return redirect(url_for('borrow_return'))
-        
-        # Process all equipment items in one transaction
-        success = True
-        for equipment_name, quantity in zip(equipment_names, quantities):
-            try:
-                # Log the action
-                c.execute("INSERT INTO equipment_log (student_id, equipment_name, action) VALUES (?, ?, ?)",
-                          (student_id, equipment_name, action))
-            except Exception as e:
-                flash(f"Error logging transaction: {str(e)}")
-                success = False
-                break
-        
-        if success:
-            # Update student's equipment count
-            if action == "borrow":
-                new_count = current_student_items + total_quantity
-                c.execute("UPDATE students SET number_of_equipment=? WHERE student_id=?", 
-                          (new_count, student_id))
-            elif action == "return":
-                new_count = max(0, current_student_items - total_quantity)
-                c.execute("UPDATE students SET number_of_equipment=? WHERE student_id=?", 
-                          (new_count, student_id))
-            
-            conn.commit()
-            conn.close()
-            
-            # Redirect to summary page with transaction details
-            from urllib.parse import urlencode
-            summary_data = urlencode({
-                'student_id': student_id,
-                'action': action,
-                'items': ','.join(equipment_names),
-                'quantities': ','.join(map(str, quantities)),
-                'total': total_quantity
-            })
-            return redirect(url_for('transaction_summary', **{
-                'student_id': student_id,
-                'action': action,
-                'items': ','.join(equipment_names),
-                'quantities': ','.join(map(str, quantities)),
-                'total': total_quantity
-            }))
-        
-        conn.commit()
-        conn.close()
-        return redirect(url_for('borrow_return'))
+
+        # Redirect to summary page with transaction details
+        return redirect(url_for('transaction_summary', **{
+            'student_id': student_id,
+            'action': action,
+            'items': ','.join(equipment_names),
+            'quantities': ','.join(map(str, quantities)),
+            'total': total_quantity
+        }))
 
     return render_template("borrow_return.html",
                            inventory=inventory,
                            inventory_dict=inventory_dict,
                            detected_items=detected_items)
 
-@app.route('/process_capture', methods=['POST'])
-def process_capture():
-    image_data = request.form['image_data'].split(",")[1]
-    nparr = np.frombuffer(base64.b64decode(image_data), np.uint8)
-    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+# ---------- Detection Helpers ----------
+RAW_FRAME_CONVERSIONS = {
+    'bgr': None,
+    'rgb': cv2.COLOR_RGB2BGR,
+    'rgba': cv2.COLOR_RGBA2BGR,
+    'bgra': cv2.COLOR_BGRA2BGR,
+}
+
+def decode_frame_body(data, content_type, headers):
+    """Decode a binary frame upload into a BGR image.
+
+    Encoded images (image/jpeg, image/png, ...) are wrapped in a zero-copy numpy
+    view and handed straight to cv2.imdecode. Raw buffers
+    (application/octet-stream) are reinterpreted in place as HxWxC using the
+    X-Frame-Width, X-Frame-Height and X-Frame-Format (bgr, rgb, rgba, bgra)
+    headers; only non-BGR formats pay for one colour conversion.
+    Raises ValueError for anything that can't be decoded.
+    """
+    if not data:
+        raise ValueError("Empty frame body.")
+    buf = np.frombuffer(data, np.uint8)
+    content_type = (content_type or '').split(';')[0].strip().lower()
+
+    if content_type.startswith('image/'):
+        frame = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Could not decode image.")
+        return frame
+
+    if content_type == 'application/octet-stream':
+        fmt = headers.get('X-Frame-Format', 'rgb').lower()
+        if fmt not in RAW_FRAME_CONVERSIONS:
+            raise ValueError(f"Unsupported raw frame format '{fmt}'.")
+        try:
+            width = int(headers['X-Frame-Width'])
+            height = int(headers['X-Frame-Height'])
+        except (KeyError, ValueError):
+            raise ValueError("Raw frames need X-Frame-Width and X-Frame-Height headers.")
+        channels = len(fmt)
+        if width <= 0 or height <= 0 or buf.size != width * height * channels:
+            raise ValueError("Raw frame size does not match the given dimensions.")
+        frame = buf.reshape(height, width, channels)
+        conversion = RAW_FRAME_CONVERSIONS[fmt]
+        return frame if conversion is None else cv2.cvtColor(frame, conversion)
+
+    raise ValueError(f"Unsupported content type '{content_type}'.")
+
+FRAME_HEADERS = ('X-Frame-Width', 'X-Frame-Height', 'X-Frame-Format')
+
+# Near-duplicate captures from the same kiosk reuse the last result; see frame_cache.py
+frame_cache = cache_from_env()
+
+def kiosk_id():
+    """Which kiosk sent this request (X-Kiosk-Id, else the client address)."""
+    return request.headers.get('X-Kiosk-Id') or request.remote_addr or ''
+
+# Tiled / region-of-interest inference for high-resolution cameras; see tiling.py
+cameras = cameras_from_env()
+
+def infer_frames(frames):
+    """Frames through the worker pool if enabled, else the in-process scheduler, as one batch.
+
+    Returns a list of (class, confidence, xyxy) rows per frame, in that
+    frame's coordinates.
+    """
+    transforms = [None] * len(frames)
+    if letterbox is not None:
+        with DETECTION_STAGES.time(stage='letterbox'):
+            frames, transforms = zip(*[letterbox(frame, slot) for slot, frame in enumerate(frames)])
+    model = model_loader.model
+    # 'inference' includes the wait for a batch slot in the scheduler or pool
+    with DETECTION_STAGES.time(stage='inference'):
+        if isinstance(model, worker_pool.InferencePool):
+            model.configure(**model_options(model))
+            results = model(list(frames))
+        else:
+            results = scheduler.submit_many(list(frames))
+    with DETECTION_STAGES.time(stage='rescale'):
+        # Keep only the boxes, not the frame and tensors a full result holds on to
+        rows = []
+        for r, transform in zip(results, transforms):
+            boxes = worker_pool.result_rows(r)
+            if transform is not None:
+                boxes = [(cls, conf, Letterbox.unmap(xyxy, transform)) for cls, conf, xyxy in boxes]
+            rows.append(boxes)
+    return rows
+
+def run_model(frame, kiosk=None, camera=None):
+    """One frame through the model, tiled if its camera is set up for that.
+
+    Returns a worker_pool.PoolResult with boxes in frame coordinates. With a
+    `kiosk`, near-duplicates of that kiosk's recent frames are answered from
+    frame_cache. `camera` picks the tiling settings and defaults to `kiosk`.
+    Tiled and ROI cameras skip the cache: its hash is taken from a 64x64
+    copy of the whole frame, where the small items tiling is there to find
+    change too few bits to tell a retake from a new scene.
+    """
+    settings = cameras.get(kiosk if camera is None else camera)
+    key = None
+    if kiosk is not None and frame_cache.enabled and not settings.active:
+        with DETECTION_STAGES.time(stage='frame_hash'):
+            key = frame_cache.key(frame)
+        cached = frame_cache.lookup(kiosk, key)
+        if cached is not None:
+            return cached
+
+    started = time.perf_counter()
+    if settings.active:
+        height, width = frame.shape[:2]
+        with DETECTION_STAGES.time(stage='tiling'):
+            windows = settings.windows(width, height)
+            crops = [settings.crop(frame, window) for window in windows]
+        per_window = infer_frames(crops) if crops else []
+        with DETECTION_STAGES.time(stage='merge'):
+            rows = settings.merge(per_window, windows, width, height)[:detection_options.max_det]
+    else:
+        rows = infer_frames([frame])[0]
+    result = worker_pool.PoolResult(rows)
+    if key is not None:
+        frame_cache.store(kiosk, key, result, time.perf_counter() - started)
+    return result
 
-    results = model(frame)
+def detect_equipment(frame, kiosk=None, camera=None):
+    """Run one frame through the shared scheduler or worker pool.
+
+    Returns (equipment, detections): the inventory names that were detected and
+    a JSON-friendly list of every box the model found.
+    """
+    r = run_model(frame, kiosk, camera)
+    names = model_loader.model.names
+    with DETECTION_STAGES.time(stage='inventory'):
+        inventory_dict = get_inventory_dict()
+
+    started = time.perf_counter()
+    detections = []
     detected_classes = set()
-    for r in results:
-        for box in r.boxes:
-            cls_id = int(box.cls[0])
-            detected_classes.add(model.names[cls_id])
+    for box in r.boxes:
+        cls = names[int(box.cls[0])]
+        detected_classes.add(cls)
+        equipment = CLASS_TO_EQUIPMENT.get(cls)
+        detections.append({
+            'class': cls,
+            'equipment': equipment if equipment in inventory_dict else None,
+            'confidence': float(box.conf[0]),
+            'box': [float(v) for v in box.xyxy[0]],
+        })
+    DETECTION_STAGES.observe(time.perf_counter() - started, stage='postprocess')
 
     # Map class names to inventory names
     detected_equipment = []
-    inventory_dict = get_inventory_dict()
     for cls in detected_classes:
         if cls in CLASS_TO_EQUIPMENT and CLASS_TO_EQUIPMENT[cls] in inventory_dict:
             detected_equipment.append(CLASS_TO_EQUIPMENT[cls])
+    return detected_equipment, detections
+
+def equipment_counts(detections):
+    """Number of detected instances per inventory item."""
+    counts = {}
+    for d in detections:
+        if d['equipment']:
+            counts[d['equipment']] = counts.get(d['equipment'], 0) + 1
+    return counts
+
+def model_unavailable_message():
+    """Start loading the model if needed and describe why it can't be used yet."""
+    model_loader.start()
+    if model_loader.error is not None:
+        return f"Detection model failed to load: {model_loader.error}"
+    return "Detection model is warming up. Please try again in a few seconds."
+
+# Captures are decoded and detected on a bounded executor so a burst of them
+# can't take every server thread from the page routes; see admission.py
+detect_gate = gate_from_env()
+
+def overloaded_headers(e):
+    return {'Retry-After': str(e.retry_after)}
+
+def _detect_capture(image_data, kiosk):
+    with DETECTION_STAGES.time(stage='decode_base64'):
+        nparr = np.frombuffer(base64.b64decode(image_data), np.uint8)
+    with DETECTION_STAGES.time(stage='imdecode'):
+        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    return detect_equipment(frame, kiosk)
+
+@app.route('/process_capture', methods=['POST'])
+def process_capture():
+    if not model_loader.ready:
+        flash(model_unavailable_message())
+        return redirect(url_for("borrow_return"))
+
+    image_data = request.form['image_data'].split(",")[1]
+    try:
+        detected_equipment, _ = detect_gate.run(_detect_capture, image_data, kiosk_id())
+    except Overloaded as e:
+        flash(e.message)
+        return redirect(url_for("borrow_return"))
 
     if detected_equipment:
         flash("Detected: " + ", ".join(detected_equipment))
@@ -246,9 +490,274 @@ def process_capture():
         flash("No valid equipment detected in inventory.")
         return redirect(url_for("borrow_return"))
 
+def _detect_body(data, content_type, headers, kiosk):
+    with DETECTION_STAGES.time(stage='decode_body'):
+        frame = decode_frame_body(data, content_type, headers)
+    return detect_equipment(frame, kiosk)
+
+@app.route('/detect', methods=['POST'])
+def detect():
+    """Binary capture upload: the request body is the frame itself.
+
+    Accepts a JPEG/PNG body, or a raw pixel buffer sent as
+    application/octet-stream with X-Frame-Width/X-Frame-Height/X-Frame-Format
+    headers, and answers with the detections as JSON. Answers 429 or 503
+    with Retry-After when detection is saturated.
+    """
+    if not model_loader.ready:
+        return jsonify({'error': model_unavailable_message()}), 503, {'Retry-After': '2'}
+
+    headers = {name: request.headers[name] for name in FRAME_HEADERS if name in request.headers}
+    try:
+        detected_equipment, detections = detect_gate.run(
+            _detect_body, request.get_data(cache=False), request.content_type, headers, kiosk_id())
+    except Overloaded as e:
+        return jsonify({'error': e.message}), e.status, overloaded_headers(e)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'equipment': detected_equipment,
+        'counts': equipment_counts(detections),
+        'detections': detections,
+    })
+
+# ---------- Live Detection Stream ----------
+
+# Streams run the model on every Nth frame and track boxes in between
+KEYFRAME_INTERVAL = int(os.environ.get('LABCV_KEYFRAME_INTERVAL', '5'))
+
+def _process_stream_frame(item, state):
+    data, content_type, headers, camera = item
+    frame = decode_frame_body(data, content_type, headers)
+    tracker = state.get('tracker')
+    if tracker is None:
+        tracker = state['tracker'] = EquipmentTracker(
+            lambda f: detect_equipment(f, camera=camera)[1], keyframe_interval=KEYFRAME_INTERVAL)
+    return tracker.update(frame)
+
+stream_hub = StreamHub(
+    _process_stream_frame,
+    workers=int(os.environ.get('LABCV_STREAM_WORKERS', '2')),
+    max_fps=float(os.environ.get('LABCV_STREAM_MAX_FPS', '5')),
+    max_clients=int(os.environ.get('LABCV_STREAM_MAX_CLIENTS', '16')),
+)
+# A stream's hub state lives in one process, so the production server sends
+# these paths to a single worker (see serve.py)
+PINNED_PATHS = ('/stream/',)
+# Server threads kept free of event streams for frame posts and page routes
+STREAM_THREAD_RESERVE = 2
+
+def limit_stream_clients(threads):
+    """Cap stream clients below a server's thread count.
+
+    Every /stream/<id>/events connection holds a server thread for as long
+    as the kiosk listens (two in production when it is forwarded to the
+    stream worker), so a hub allowed as many clients as there are threads
+    would leave none for the frame posts that feed it.
+    """
+    limit = max(1, threads - STREAM_THREAD_RESERVE)
+    if stream_hub.max_clients > limit:
+        print(f"Limiting live streams to {limit} client(s) for {threads} server thread(s); "
+              f"raise FLASK_THREADS for more.", file=sys.stderr, flush=True)
+        stream_hub.max_clients = limit
+    return stream_hub.max_clients
+
+@app.route('/stream/<client_id>/frame', methods=['POST'])
+def stream_frame(client_id):
+    """Offer the newest camera frame for a live stream (same body formats as /detect)."""
+    if not model_loader.ready:
+        return jsonify({'error': model_unavailable_message()}), 503, {'Retry-After': '2'}
+
+    headers = {name: request.headers[name] for name in FRAME_HEADERS if name in request.headers}
+    item = (request.get_data(cache=False), request.content_type, headers, kiosk_id())
+    try:
+        accepted = stream_hub.push(client_id, item)
+    except StreamFull as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    return jsonify({'accepted': accepted}), 202
+
+@app.route('/stream/<client_id>/events')
+def stream_events(client_id):
+    """Server-Sent Events: one message per detection result for this client."""
+    try:
+        stream_hub.open(client_id)
+    except StreamFull as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+
+    def generate():
+        try:
+            for result in stream_hub.events(client_id):
+                if result is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"data: {json.dumps(result)}\n\n"
+        finally:
+            stream_hub.close(client_id)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/stream/stats')
+def stream_stats():
+    return jsonify(stream_hub.stats())
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the server is up and answering requests."""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: the database is migrated and the model is loaded and warmed up."""
+    model_loader.start()
+    ready = db_ready.is_set() and model_loader.ready
+    body = {
+        'ready': ready,
+        'database': 'ready' if db_ready.is_set() else 'pending',
+        'model': model_loader.status(),
+    }
+    return jsonify(body), (200 if ready else 503)
+
+def pipeline_stats():
+    """Pre/postprocessing settings and the average time of every detection stage."""
+    body = detection_options.describe()
+    body['letterbox'] = letterbox.size if letterbox is not None else None
+    if model_loader.ready:
+        names = model_loader.model.names
+        body['classes'] = [names[i] for i in class_filter(names, CLASS_TO_EQUIPMENT, get_inventory_dict())]
+    body['stages_ms'] = {key[0]: total / count * 1000.0
+                         for key, (_, total, count) in sorted(DETECTION_STAGES.snapshot().items()) if count}
+    return body
+
+@app.route('/inference/stats')
+def inference_stats():
+    """Queue depth and batch-size statistics for tuning the batch scheduler."""
+    stats = scheduler.stats()
+    if model_loader.ready:
+        stats['backend'] = model_loader.model.describe()
+        if isinstance(model_loader.model, worker_pool.InferencePool):
+            stats['pool'] = model_loader.model.stats()
+    stats['frame_cache'] = frame_cache.stats()
+    stats['admission'] = detect_gate.stats()
+    stats['pipeline'] = pipeline_stats()
+    stats['cameras'] = cameras.describe()
+    return jsonify(stats)
+
+@app.route('/db/stats')
+def db_stats():
+    """Connection pool and query timing statistics."""
+    stats = db.stats()
+    stats['inventory_cache'] = inventory_cache.stats()
+    return jsonify(stats)
+
+@registry.collector
+def _runtime_metrics():
+    """Scheduler, stream, pool and cache counters, read at scrape time."""
+    inference = scheduler.stats()
+    streams = stream_hub.stats()
+    pool = db.stats()
+    cache = inventory_cache.stats()
+    prof = profiler.status()
+    cached = frame_cache.stats()
+    gate = detect_gate.stats()
+    family = metrics.family
+    pool_lines = []
+    if model_loader.ready and isinstance(model_loader.model, worker_pool.InferencePool):
+        workers = model_loader.model.stats()
+        pool_lines = (
+            family('labcv_inference_workers_alive', 'gauge', "Inference worker processes running.",
+                   [(None, workers['alive'])])
+            + family('labcv_inference_worker_in_flight', 'gauge', "Frames being processed per worker.",
+                     [({'worker': w['index']}, w['in_flight']) for w in workers['workers']])
+            + family('labcv_inference_worker_restarts_total', 'counter', "Crashed workers replaced.",
+                     [({'worker': w['index']}, w['restarts']) for w in workers['workers']])
+        )
+    return (
+        family('labcv_model_ready', 'gauge', "1 once the model is loaded and warmed up.",
+               [(None, model_loader.ready)])
+        + family('labcv_inference_queue_depth', 'gauge', "Frames waiting for the batch scheduler.",
+                 [(None, inference['queue_depth'])])
+        + family('labcv_inference_queue_depth_max', 'gauge', "Deepest the scheduler queue has been.",
+                 [(None, inference['max_queue_depth'])])
+        + family('labcv_inference_frames_total', 'counter', "Frames run through the model.",
+                 [(None, inference['frames'])])
+        + family('labcv_inference_errors_total', 'counter', "Batches that raised an error.",
+                 [(None, inference['errors'])])
+        + family('labcv_inference_queue_wait_seconds_total', 'counter', "Time frames spent waiting for a batch.",
+                 [(None, inference['queue_wait_seconds_total'])])
+        + family('labcv_inference_seconds_total', 'counter', "Time spent in model calls.",
+                 [(None, inference['inference_seconds_total'])])
+        + metrics.histogram_family(
+            'labcv_inference_batch_size', "Frames per model call.",
+            [(int(size), n) for size, n in inference['batch_size_histogram'].items()], inference['frames'])
+        + family('labcv_frame_cache_lookups_total', 'counter', "Frame cache lookups by result.",
+                 [({'result': 'hit'}, cached['hits']), ({'result': 'miss'}, cached['misses'])])
+        + family('labcv_frame_cache_saved_seconds_total', 'counter', "Inference time skipped by frame cache hits.",
+                 [(None, cached['saved_inference_seconds'])])
+        + family('labcv_frame_cache_entries', 'gauge', "Results held in the frame cache.",
+                 [(None, cached['entries'])])
+        + family('labcv_detect_in_progress', 'gauge', "Detection jobs by state.",
+                 [({'state': 'running'}, gate['running']), ({'state': 'waiting'}, gate['waiting'])])
+        + family('labcv_detect_admissions_total', 'counter', "Detection requests by admission outcome.",
+                 [({'outcome': 'admitted'}, gate['admitted']), ({'outcome': 'rejected'}, gate['rejected']),
+                  ({'outcome': 'timed_out'}, gate['timed_out'])])
+        + family('labcv_stream_clients', 'gauge', "Connected live detection streams.",
+                 [(None, streams['clients'])])
+        + family('labcv_stream_frames_total', 'counter', "Live stream frames by outcome.",
+                 [({'outcome': k}, streams[k]) for k in ('received', 'processed', 'dropped')])
+        + family('labcv_db_queries_total', 'counter', "SQLite statements executed.", [(None, pool['queries'])])
+        + family('labcv_db_query_seconds_total', 'counter', "Time spent in SQLite statements.",
+                 [(None, pool['query_ms_total'] / 1000.0)])
+        + family('labcv_db_connections_opened_total', 'counter', "SQLite connections opened.",
+                 [(None, pool['connections_opened'])])
+        + family('labcv_db_pool_idle', 'gauge', "Idle pooled connections.", [(None, pool['idle'])])
+        + family('labcv_inventory_cache_lookups_total', 'counter', "Inventory cache lookups by result.",
+                 [({'result': 'hit'}, cache['hits']), ({'result': 'miss'}, cache['misses'])])
+        + family('labcv_profiler_running', 'gauge', "1 while the sampling profiler is on.",
+                 [(None, prof['running'])])
+        + family('labcv_profiler_samples_total', 'counter', "Stack samples taken by the profiler.",
+                 [(None, prof['samples'])])
+        + pool_lines
+    )
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Everything above in the Prometheus text format."""
+    return Response(registry.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.route('/debug/profiler', methods=['GET', 'POST'])
+def debug_profiler():
+    """Status and hottest functions; POST action=start|stop|reset toggles sampling.
+
+    `?format=collapsed` returns the stacks for flamegraph.pl/speedscope.
+    Only PROFILER_CLIENTS may use it: sampling slows every request down.
+    """
+    if request.remote_addr not in PROFILER_CLIENTS:
+        return jsonify({'error': "The profiler is only available from this machine."}), 403
+    if request.method == 'POST':
+        params = request.get_json(silent=True) or request.values
+        action = params.get('action')
+        if action == 'start':
+            interval_ms = params.get('interval_ms')
+            try:
+                profiler.start(float(interval_ms) / 1000.0 if interval_ms else None)
+            except ValueError:
+                return jsonify({'error': "'interval_ms' must be a number."}), 400
+        elif action == 'stop':
+            profiler.stop()
+        elif action == 'reset':
+            profiler.reset()
+        else:
+            return jsonify({'error': "'action' must be start, stop or reset."}), 400
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    body = profiler.status()
+    body['top'] = profiler.top(request.args.get('limit', 20, type=int))
+    return jsonify(body)
+
 @app.route('/inventory', methods=['GET', 'POST'])
 def inventory():
-    conn = sqlite3.connect("database.db")
+    conn = get_db()
     c = conn.cursor()
     if request.method == 'POST':
         action = request.form.get('action')
@@ -259,6 +768,7 @@ def inventory():
                 try:
                     c.execute("INSERT INTO inventory (name, quantity) VALUES (?, ?)", (name, quantity))
                     conn.commit()
+                    inventory_cache.invalidate()
                     flash("Equipment added successfully.")
                 except sqlite3.IntegrityError:
                     flash("Equipment already exists.")
@@ -267,29 +777,113 @@ def inventory():
             quantity = int(request.form['quantity'])
             c.execute("UPDATE inventory SET quantity=? WHERE id=?", (quantity, item_id))
             conn.commit()
+            inventory_cache.invalidate()
             flash("Quantity updated.")
         elif action == 'delete':
             item_id = request.form['item_id']
             c.execute("DELETE FROM inventory WHERE id=?", (item_id,))
             conn.commit()
+            inventory_cache.invalidate()
             flash("Equipment deleted.")
         return redirect(url_for('inventory'))
 
-    c.execute("SELECT id, name, quantity FROM inventory ORDER BY name ASC")
-    items = c.fetchall()
-    conn.close()
-    return render_template('inventory.html', items=items)
+    return render_template('inventory.html', items=get_inventory())
+
+@app.route('/balances/student/<student_id>')
+def student_balances(student_id):
+    """Items a student currently holds, from the materialized balance table."""
+    items = balances.by_student(get_db(), student_id)
+    return jsonify({'student_id': student_id,
+                    'items': [{'equipment': name, 'outstanding': qty} for name, qty in items],
+                    'total': sum(qty for _, qty in items)})
+
+@app.route('/balances/equipment/<path:equipment_name>')
+def equipment_balances(equipment_name):
+    """Students currently holding an item."""
+    holders = balances.by_equipment(get_db(), equipment_name)
+    return jsonify({'equipment': equipment_name,
+                    'holders': [{'student_id': sid, 'outstanding': qty} for sid, qty in holders],
+                    'total': sum(qty for _, qty in holders)})
+
+@app.route('/analytics/usage')
+def analytics_usage():
+    """Borrow/return volumes from the rollup tables, never the raw log.
+
+    Query args: by=equipment|course, period=day|week, action, start/end
+    (YYYY-MM-DD, inclusive; start defaults to 30 days ago, UTC). Read-only:
+    the rollups are kept current on the write paths.
+    """
+    by = request.args.get('by', 'equipment')
+    period = request.args.get('period', 'day')
+    if by not in rollups.DIMENSIONS or period not in rollups.PERIODS:
+        return jsonify({'error': f"by must be one of {list(rollups.DIMENSIONS)} "
+                                 f"and period one of {list(rollups.PERIODS)}"}), 400
+    # Log timestamps are CURRENT_TIMESTAMP, i.e. UTC
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    start = request.args.get('start') or (today - datetime.timedelta(days=30)).isoformat()
+    end = request.args.get('end') or None
+    action = request.args.get('action') or None
+
+    conn = get_db()
+    rows = rollups.usage(conn, by, period, action, start, end)
+    return jsonify({
+        'by': by,
+        'period': period,
+        'start': start,
+        'end': end,
+        'last_log_id': rollups.last_log_id(conn),
+        'rows': [{'period': p, by: key, 'action': act, 'entries': entries, 'quantity': qty}
+                 for p, key, act, entries, qty in rows],
+    })
+
+@app.route('/search/names')
+def search_names():
+    """Ranked equipment/student name suggestions for ?q= (optionally &kind=equipment|student)."""
+    kind = request.args.get('kind')
+    if kind not in (None, '', 'equipment', 'student'):
+        return jsonify({'error': "kind must be 'equipment' or 'student'"}), 400
+    matches = search.search(get_db(), request.args.get('q', ''), kind or None,
+                            limit=page_size_arg(request.args.get('limit'), default=20))
+    return jsonify({'matches': [{'kind': k, 'ref': ref, 'name': name} for k, ref, name in matches]})
+
+@app.route('/import/<table>', methods=['POST'])
+def bulk_import(table):
+    """Stream a CSV/JSONL upload (multipart 'file' or the raw body) into a table.
+
+    Query args: format=csv|jsonl (default: from the file name, else csv),
+    mode=skip|update for existing students/inventory rows.
+    """
+    upload = request.files.get('file')
+    fmt = request.args.get('format') or bulk.format_for(upload.filename if upload else None)
+    mode = request.args.get('mode', 'skip')
+    if table not in bulk.TABLES or fmt not in bulk.FORMATS or mode not in bulk.TABLES[table][2]:
+        return jsonify({'error': f"Unknown table, format or mode. Tables: {list(bulk.TABLES)}, "
+                                 f"formats: {list(bulk.FORMATS)}, modes: {list(bulk.MODES)}"}), 400
+
+    source = bulk.text_stream(upload.stream if upload else request.stream)
+    report = bulk.import_rows(get_db(), table, bulk.iter_records(source, fmt), mode)
+    return jsonify(report.as_dict())
+
+@app.route('/export/<table>')
+def bulk_export(table):
+    """Stream a table as CSV or JSONL (?format=) straight from the cursor."""
+    fmt = request.args.get('format', 'csv')
+    if table not in bulk.EXPORT_QUERIES or fmt not in bulk.FORMATS:
+        return jsonify({'error': f"Tables: {list(bulk.EXPORT_QUERIES)}, formats: {list(bulk.FORMATS)}"}), 400
+    filename = f"{table}.{fmt}"
+    return Response(stream_with_context(bulk.export_rows(get_db(), table, fmt)),
+                    mimetype=bulk.MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
 @app.route('/records', methods=['GET', 'POST'])
 def records():
     logs = []
     if request.method == 'POST':
         student_id = request.form['student_id']
-        conn = sqlite3.connect("database.db")
+        conn = get_db()
         c = conn.cursor()
-        c.execute("SELECT equipment_name, action, timestamp FROM equipment_log WHERE student_id=? ORDER BY timestamp DESC", (student_id,))
+        c.execute(RECORDS_QUERY, (student_id,))
         logs = c.fetchall()
-        conn.close()
     return render_template('records.html', logs=logs)
 
 
@@ -303,11 +897,10 @@ def transaction_summary():
     total = int(request.args.get('total', 0))
     
     # Get student details
-    conn = sqlite3.connect("database.db")
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT name, course, year_level, number_of_equipment FROM students WHERE student_id=?", (student_id,))
     student_data = c.fetchone()
-    conn.close()
     
     if not student_data:
         flash("Student not found.")
@@ -340,80 +933,230 @@ def transaction_summary():
     return render_template('transaction_summary.html', **context)
 
 
-@app.route('/admin/logs', methods=['GET', 'POST'])
-def admin_logs():
-    """Display transaction logs with filtering and sorting options."""
-    filters = {
-        'student_id': request.args.get('student_id', '').strip(),
-        'equipment': request.args.get('equipment', '').strip(),
-        'action': request.args.get('action', ''),
-        'sort': request.args.get('sort', 'timestamp_desc')
-    }
-    
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
-    
-    # Build query with filters
+# Keyset sort keys for each admin_logs sort mode; every key ends in the row id
+# so it is unique, and each matches one of the equipment_log indexes.
+ADMIN_LOG_SORT_KEYS = {
+    'timestamp_desc': [('e.timestamp', 'DESC'), ('e.id', 'DESC')],
+    'timestamp_asc': [('e.timestamp', 'ASC'), ('e.id', 'ASC')],
+    'student_id': [('e.student_id', 'ASC'), ('e.timestamp', 'ASC'), ('e.id', 'ASC')],
+    'action': [('e.action', 'ASC'), ('e.timestamp', 'DESC'), ('e.id', 'DESC')],
+}
+ADMIN_LOG_SORTS = tuple(ADMIN_LOG_SORT_KEYS)
+# Position of each sort column in an admin_logs row
+ADMIN_LOG_COLUMNS = {'e.id': 0, 'e.student_id': 1, 'e.action': 4, 'e.timestamp': 5}
+# Up to this many names matching an equipment filter are read one name at a
+# time in index order and merged; more names cover so much of the log that
+# walking the sort index finds a page quickly.
+ADMIN_LOG_MERGE_NAMES = 32
+
+def build_admin_log_query(filters, after=None, limit=None, equipment_names=()):
+    """Build the admin log query and its parameters for the given filters.
+
+    `after` is a decoded keyset cursor (the sort key of the last row already
+    shown) and `limit` caps the number of rows returned. `equipment_names`
+    are the names matching filters['equipment'] (search.matching_names()).
+    """
     query = """
-        SELECT e.id, e.student_id, s.name, e.equipment_name, e.action, e.timestamp
+        SELECT e.id, e.student_id, s.name, e.equipment_name, e.action, e.timestamp, e.quantity
         FROM equipment_log e
         LEFT JOIN students s ON e.student_id = s.student_id
         WHERE 1=1
     """
+    conditions = ''
     params = []
     
     if filters['student_id']:
-        query += " AND e.student_id = ?"
+        conditions += " AND e.student_id = ?"
         params.append(filters['student_id'])
     
-    if filters['equipment']:
-        query += " AND e.equipment_name LIKE ?"
-        params.append(f"%{filters['equipment']}%")
-    
     if filters['action']:
-        query += " AND e.action = ?"
+        conditions += " AND e.action = ?"
         params.append(filters['action'])
     
-    # Apply sorting
-    if filters['sort'] == 'timestamp_asc':
-        query += " ORDER BY e.timestamp ASC"
-    elif filters['sort'] == 'student_id':
-        query += " ORDER BY e.student_id ASC"
-    elif filters['sort'] == 'action':
-        query += " ORDER BY e.action ASC, e.timestamp DESC"
-    else:  # timestamp_desc is default
-        query += " ORDER BY e.timestamp DESC"
+    # Apply sorting; timestamp_desc is the default. A column pinned by an
+    # equality filter is constant, so it is left out of the ORDER BY and the
+    # keyset condition; a range on it would hide the index order of the rest.
+    sort_key = ADMIN_LOG_SORT_KEYS.get(filters['sort'], ADMIN_LOG_SORT_KEYS['timestamp_desc'])
+    pinned = {'e.student_id'} if filters['student_id'] else set()
+    if filters['action']:
+        pinned.add('e.action')
+    if after is not None:
+        after = [value for (column, _), value in zip(sort_key, after) if column not in pinned]
+    sort_key = [(column, direction) for column, direction in sort_key if column not in pinned]
+    if after is not None:
+        condition, cursor_params = keyset_condition(sort_key, after)
+        conditions += " AND " + condition
+        params.extend(cursor_params)
     
-    c.execute(query, params)
-    logs = c.fetchall()
+    if not filters['equipment']:
+        query += conditions + order_by(sort_key)
+    else:
+        names = list(equipment_names) or [None]   # NULL matches no row
+        if len(names) <= ADMIN_LOG_MERGE_NAMES:
+            # One arm per name, each read in order from an (equipment_name, ...)
+            # index; SQLite merges the arms and stops once the page is full.
+            # A student's own rows are few, so with a student filter the arms
+            # read them in order through the student indexes instead.
+            name_condition = " AND +e.equipment_name = ?" if filters['student_id'] else " AND e.equipment_name = ?"
+            arm = query + name_condition + conditions
+            query = " UNION ALL ".join([arm] * len(names)) + " ORDER BY " + ", ".join(
+                f"{ADMIN_LOG_COLUMNS[column] + 1} {direction}" for column, direction in sort_key)
+            params = [value for name in names for value in [name] + params]
+        else:
+            # Unary + keeps SQLite on the sort index instead of sorting every match
+            query += f" AND +e.equipment_name IN ({', '.join('?' * len(names))})" + conditions + order_by(sort_key)
+            params = names + params
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return query, params
+
+def admin_log_key(sort):
+    """Function returning the keyset cursor values of an admin_logs row."""
+    positions = [ADMIN_LOG_COLUMNS[column] for column, _ in ADMIN_LOG_SORT_KEYS[sort]]
+    return lambda row: [row[i] for i in positions]
+
+RECORDS_QUERY = "SELECT equipment_name, action, timestamp FROM equipment_log WHERE student_id=? ORDER BY timestamp DESC"
+# Student filter choices from search_name's (kind, ref) index, already in order
+STUDENT_CHOICES_QUERY = "SELECT ref FROM search_name WHERE kind = 'student' ORDER BY ref"
+HISTORY_SORT_KEY = [('timestamp', 'DESC'), ('id', 'DESC')]
+HISTORY_QUERY = "SELECT student_id, equipment_name, action, timestamp, id FROM equipment_log"
+
+def build_history_query(after=None, limit=None):
+    query = HISTORY_QUERY
+    params = []
+    if after is not None:
+        condition, params = keyset_condition(HISTORY_SORT_KEY, after)
+        query += " WHERE " + condition
+    query += order_by(HISTORY_SORT_KEY)
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return query, params
+
+def stream_requested():
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+def route_queries():
+    """Every equipment_log/students query the routes can issue, as (label, sql, params).
+
+    Used by migrations.check_query_plans() to make sure none of them reads
+    a whole table or index, or sorts a whole result, as the log grows.
+    """
+    yield 'records', RECORDS_QUERY, ('S1',)
+    for after in (None, ['2025-01-01 00:00:00', 10]):
+        query, params = build_history_query(after, 51)
+        yield f'history after={after}', query, tuple(params)
+    yield 'balances by student', balances.BY_STUDENT_QUERY, ('S1',)
+    yield 'balances by equipment', balances.BY_EQUIPMENT_QUERY, ('Beaker',)
+    for by in rollups.DIMENSIONS:
+        for period in rollups.PERIODS:
+            query, params = rollups.usage_query(by, period, 'borrow', '2025-01-01', '2025-01-31')
+            yield f'analytics {by} per {period}', query, tuple(params)
+    yield 'admin_logs students', STUDENT_CHOICES_QUERY, ()
+    for term in ('be', 'beak'):
+        sql, params = search.matching_refs(term, 'equipment')
+        yield f'name search {term!r}', sql, tuple(params)
+    many_names = [f'Item {i}' for i in range(ADMIN_LOG_MERGE_NAMES + 1)]
+    for student_id, equipment, names in (('', '', ()), ('S1', '', ()), ('', 'beak', ['Beaker', 'Glass Beaker']),
+                                         ('S1', 'beak', ['Beaker']), ('', 'item', many_names)):
+        for action in ('', 'borrow'):
+            for sort, sort_key in ADMIN_LOG_SORT_KEYS.items():
+                filters = {'student_id': student_id, 'equipment': equipment, 'action': action, 'sort': sort}
+                cursor = ['S1' if c == 'e.student_id' else 'borrow' if c == 'e.action' else
+                          10 if c == 'e.id' else '2025-01-01 00:00:00' for c, _ in sort_key]
+                for after in (None, cursor):
+                    query, params = build_admin_log_query(filters, after, 51, names)
+                    yield f"admin_logs {filters} after={after}", query, tuple(params)
+
+@app.route('/admin/logs', methods=['GET', 'POST'])
+def admin_logs():
+    """Display transaction logs with filtering and sorting options."""
+    filters = {
+        'student_id': request.args.get('student_id', '').strip(),
+        'equipment': request.args.get('equipment', '').strip(),
+        'action': request.args.get('action', ''),
+        'sort': request.args.get('sort', 'timestamp_desc')
+    }
     
-    # Get unique values for filter dropdowns
-    c.execute("SELECT DISTINCT student_id FROM students ORDER BY student_id")
-    all_students = c.fetchall()
+    if filters['sort'] not in ADMIN_LOG_SORT_KEYS:
+        filters['sort'] = 'timestamp_desc'
+    page_size = page_size_arg(request.args.get('per_page'))
+    after = decode_cursor(request.args.get('after'), len(ADMIN_LOG_SORT_KEYS[filters['sort']]))
     
-    c.execute("SELECT DISTINCT equipment_name FROM equipment_log ORDER BY equipment_name")
-    all_equipment = c.fetchall()
+    conn = get_db()
+    names = search.matching_names(conn, filters['equipment'], 'equipment') if filters['equipment'] else ()
     
-    conn.close()
+    # One extra row tells the page whether there is a next page
+    query, params = build_admin_log_query(filters, after, page_size + 1, names)
+    rows = conn.execute(query, params)
+    page = KeysetPage(rows, page_size, admin_log_key(filters['sort']),
+                      after=request.args.get('after') if after else None,
+                      streamed=stream_requested())
     
-    return render_template('admin_logs.html', 
-                         logs=logs,
-                         filters=filters,
-                         students=[s[0] for s in all_students],
-                         equipment=[eq[0] for eq in all_equipment])
+    # Filter dropdowns: students from the name index, equipment from the inventory cache
+    context = dict(page=page,
+                   filters=filters,
+                   students=[row[0] for row in conn.execute(STUDENT_CHOICES_QUERY)],
+                   equipment=[name for _, name, _ in inventory_cache.items()])
+    if page.streamed:
+        return Response(stream_template('admin_logs.html', **context))
+    page.load()
+    return render_template('admin_logs.html', **context)
 
 @app.route('/history')
 def history():
-    conn = sqlite3.connect("database.db")
-    c = conn.cursor()
-    c.execute("SELECT student_id, equipment_name, action, timestamp FROM equipment_log ORDER BY timestamp DESC")
-    logs = c.fetchall()
-    conn.close()
-    return render_template('history.html', logs=logs)
+    page_size = page_size_arg(request.args.get('per_page'))
+    after = decode_cursor(request.args.get('after'), len(HISTORY_SORT_KEY))
+    conn = get_db()
+    query, params = build_history_query(after, page_size + 1)
+    page = KeysetPage(conn.execute(query, params), page_size, lambda row: [row[3], row[4]],
+                      after=request.args.get('after') if after else None,
+                      streamed=stream_requested())
+    if page.streamed:
+        return Response(stream_template('history.html', page=page))
+    return render_template('history.html', page=page.load())
+
+# ---------- Startup ----------
+# Creating the tables is cheap, so do it on import; the model is loaded lazily.
+with app.app_context():
+    init_db()
+
+# ---------- Production Server ----------
+def prepare_for_fork():
+    """Load what serve.py's workers share, then drop per-process state before forking."""
+    if INFERENCE_WORKERS:
+        raise RuntimeError("LABCV_INFERENCE_WORKERS can't be combined with the pre-fork server: "
+                           "the pool's pipes and threads don't survive a fork. Use one or the other.")
+    model_loader.start()
+    if not model_loader.wait():
+        print(f"Model failed to load: {model_loader.error}", file=sys.stderr, flush=True)
+    # Background threads must not hold locks while we fork
+    global _profile_workers
+    _profile_workers = profiler.running
+    profiler.stop()
+    # SQLite connections must not cross a fork
+    inventory_cache.close()
+    db.pool.close_all()
+
+_profile_workers = False
+
+def after_fork():
+    """Per-process setup in a freshly forked worker."""
+    db.configure(db.pool.path)
+    if _profile_workers:
+        profiler.start()
 
 # ---------- Run Server ----------
 if __name__ == '__main__':
-    init_db()
+    multiprocessing.freeze_support()  # inference workers in the bundled executable
+    model_loader.start()
+    if os.environ.get('FLASK_SERVER', 'development').lower() == 'production':
+        import serve
+        config = serve.server_config()
+        limit_stream_clients(config['threads'])
+        config['pinned'] = PINNED_PATHS
+        raise SystemExit(serve.run(app, config, preload=prepare_for_fork, post_fork=after_fork))
     host = os.environ.get('FLASK_HOST', '127.0.0.1')
     port = int(os.environ.get('FLASK_PORT', '5000'))
     debug = os.environ.get('FLASK_DEBUG', 'False').lower() in ('1', 'true', 'yes')
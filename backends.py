@@ -0,0 +1,161 @@
+"""
+CPU inference backends for the YOLO model.
+
+PyTorch is the slowest way to run after_dsmtf.pt on the CPU-only kiosks.
+This module exports the weights once to ONNX or OpenVINO IR (optionally
+INT8-quantised), caches the artifacts next to the weights and loads the
+requested variant through ultralytics, so every backend returns the same
+Results objects (`r.boxes` with `cls`, `conf`, `xyxy`) that app.py consumes.
+
+Backend, input size and precision are chosen with environment variables:
+
+    LABCV_BACKEND   torch (default), onnx or openvino
+    LABCV_IMGSZ     model input size in pixels (default 640)
+    LABCV_INT8      1/true to use an INT8-quantised export
+    LABCV_THREADS   intra-op CPU threads (default: library default)
+"""
+
+import os
+import shutil
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+
+# Calibration images for INT8 exports
+DATA_YAML = os.path.join(os.path.dirname(__file__), 'dataset (trivial)', 'data.yaml')
+
+
+class BackendError(RuntimeError):
+    """Raised for an unknown backend or a failed export."""
+
+
+class InferenceBackend:
+    """A loaded model plus the settings it should be called with.
+
+    Calling it with a frame or list of frames returns ultralytics Results,
+    exactly like calling the YOLO object directly.
+    """
+
+    def __init__(self, model, name, imgsz, int8=False, source=None):
+        self.model = model
+        self.name = name
+        self.imgsz = imgsz
+        self.int8 = int8
+        self.source = source
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def __call__(self, frames, **kwargs):
+        kwargs.setdefault('imgsz', self.imgsz)
+        kwargs.setdefault('verbose', False)
+        return self.model(frames, **kwargs)
+
+    def describe(self):
+        return {
+            'backend': self.name,
+            'imgsz': self.imgsz,
+            'int8': self.int8,
+            'source': os.path.basename(self.source) if self.source else None,
+        }
+
+
+def _truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def export_path(weights, backend, imgsz, int8=False):
+    """Where the cached artifact for this configuration lives, next to the weights."""
+    stem, _ = os.path.splitext(weights)
+    suffix = f'.{imgsz}' + ('.int8' if int8 else '')
+    if backend == 'onnx':
+        return f'{stem}{suffix}.onnx'
+    if backend == 'openvino':
+        return f'{stem}{suffix}_openvino_model'
+    raise BackendError(f"Backend '{backend}' has no exported artifact.")
+
+
+def _is_fresh(artifact, weights):
+    """An export is reusable if it exists and is newer than the weights."""
+    return os.path.exists(artifact) and os.path.getmtime(artifact) >= os.path.getmtime(weights)
+
+
+def _quantize_onnx(src, dst):
+    # onnxruntime is only needed for INT8 ONNX exports
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(src, dst, weight_type=QuantType.QUInt8)
+
+
+def export(weights, backend, imgsz, int8=False):
+    """Export the weights for a backend unless a fresh cached copy exists.
+
+    Returns the path of the artifact to load.
+    """
+    artifact = export_path(weights, backend, imgsz, int8)
+    if _is_fresh(artifact, weights):
+        return artifact
+
+    from ultralytics import YOLO
+    model = YOLO(weights)
+    try:
+        if backend == 'onnx':
+            exported = model.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+            if int8:
+                _quantize_onnx(exported, artifact)
+                os.remove(exported)
+            else:
+                shutil.move(exported, artifact)
+        elif backend == 'openvino':
+            exported = model.export(format='openvino', imgsz=imgsz, dynamic=True,
+                                    int8=int8, data=DATA_YAML if int8 else None)
+            if os.path.exists(artifact):
+                shutil.rmtree(artifact)
+            shutil.move(exported, artifact)
+        else:
+            raise BackendError(f"Backend '{backend}' has no exported artifact.")
+    except BackendError:
+        raise
+    except Exception as e:
+        raise BackendError(f"Exporting {os.path.basename(weights)} to {backend} failed: {e}") from e
+    return artifact
+
+
+def set_threads(threads):
+    """Limit intra-op CPU threads for torch and the runtimes that read OMP_NUM_THREADS."""
+    if not threads:
+        return
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(int(threads))
+    except ImportError:
+        pass
+
+
+def load_backend(weights, backend='torch', imgsz=640, int8=False, threads=None):
+    """Load the model for the given backend, exporting it first if needed."""
+    if backend not in BACKENDS:
+        raise BackendError(f"Unknown backend '{backend}'. Choose one of: {', '.join(BACKENDS)}.")
+    if backend == 'torch' and int8:
+        raise BackendError("INT8 is only available for the onnx and openvino backends.")
+
+    set_threads(threads)
+    from ultralytics import YOLO
+    source = weights if backend == 'torch' else export(weights, backend, imgsz, int8)
+    model = YOLO(source, task='detect')
+    return InferenceBackend(model, backend, imgsz, int8=int8, source=source)
+
+
+def backend_config_from_env():
+    """Read LABCV_BACKEND / LABCV_IMGSZ / LABCV_INT8 / LABCV_THREADS."""
+    threads = os.environ.get('LABCV_THREADS')
+    return {
+        'backend': os.environ.get('LABCV_BACKEND', 'torch').lower(),
+        'imgsz': int(os.environ.get('LABCV_IMGSZ', '640')),
+        'int8': _truthy(os.environ.get('LABCV_INT8', 'False')),
+        'threads': int(threads) if threads else None,
+    }
+
+
+def load_backend_from_env(weights):
+    return load_backend(weights, **backend_config_from_env())
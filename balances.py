@@ -0,0 +1,144 @@
+"""
+Materialized outstanding balances per (student, equipment).
+
+students.number_of_equipment only holds one total per student, so "who is
+holding which items" used to mean replaying all of equipment_log. The
+equipment_balance table keeps the answer instead: one row per student and
+item with a non-zero outstanding quantity, updated by record_transaction()
+in the same transaction as the log insert. Lookups by student use the
+primary key and lookups by equipment use idx_balance_equipment, so they
+cost the same however long the log grows.
+
+A return never takes a balance below zero, matching how
+number_of_equipment is clamped; rebuild() replays the log with the same
+rule, so `verify` reports any drift between the table and the log.
+
+Usage:
+    python balances.py --verify     # compare the table with a replay of the log
+    python balances.py --rebuild    # recompute the table from the log
+"""
+
+import argparse
+import sqlite3
+
+
+def create_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS equipment_balance (
+            student_id TEXT NOT NULL,
+            equipment_name TEXT NOT NULL,
+            outstanding INTEGER NOT NULL CHECK(outstanding >= 0),
+            PRIMARY KEY (student_id, equipment_name)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_balance_equipment ON equipment_balance (equipment_name, student_id)")
+
+
+def apply(conn, student_id, action, items):
+    """Apply one cart to the balances inside the caller's transaction.
+
+    `items` is a list of (equipment_name, quantity).
+    """
+    if action == 'borrow':
+        conn.executemany('''
+            INSERT INTO equipment_balance (student_id, equipment_name, outstanding) VALUES (?, ?, ?)
+            ON CONFLICT (student_id, equipment_name) DO UPDATE SET outstanding = outstanding + excluded.outstanding
+        ''', [(student_id, name, qty) for name, qty in items])
+    elif action == 'return':
+        conn.executemany(
+            "UPDATE equipment_balance SET outstanding = MAX(0, outstanding - ?) "
+            "WHERE student_id=? AND equipment_name=?",
+            [(qty, student_id, name) for name, qty in items])
+        conn.execute("DELETE FROM equipment_balance WHERE student_id=? AND outstanding=0", (student_id,))
+
+
+def replay(conn):
+    """Recompute {(student_id, equipment_name): outstanding} from equipment_log."""
+    totals = {}
+    for student_id, name, action, qty in conn.execute(
+            "SELECT student_id, equipment_name, action, quantity FROM equipment_log ORDER BY id"):
+        key = (student_id, name)
+        if action == 'borrow':
+            totals[key] = totals.get(key, 0) + qty
+        elif action == 'return':
+            totals[key] = max(0, totals.get(key, 0) - qty)
+    return {key: qty for key, qty in totals.items() if qty > 0}
+
+
+def write(conn, totals):
+    """Replace the table contents with `totals`, inside the caller's transaction."""
+    conn.execute("DELETE FROM equipment_balance")
+    conn.executemany("INSERT INTO equipment_balance (student_id, equipment_name, outstanding) VALUES (?, ?, ?)",
+                     [(sid, name, qty) for (sid, name), qty in totals.items()])
+
+
+def rebuild(conn):
+    """Recompute the whole table from the log in one transaction. Returns the row count."""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        totals = replay(conn)
+        write(conn, totals)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(totals)
+
+
+def verify(conn):
+    """List (student_id, equipment_name, stored, expected) for every mismatching balance."""
+    expected = replay(conn)
+    stored = {(sid, name): qty for sid, name, qty in
+              conn.execute("SELECT student_id, equipment_name, outstanding FROM equipment_balance")}
+    return [(sid, name, stored.get((sid, name), 0), expected.get((sid, name), 0))
+            for sid, name in sorted(set(expected) | set(stored))
+            if stored.get((sid, name), 0) != expected.get((sid, name), 0)]
+
+
+# ---------- Lookups ----------
+BY_STUDENT_QUERY = ("SELECT equipment_name, outstanding FROM equipment_balance "
+                    "WHERE student_id=? ORDER BY equipment_name")
+BY_EQUIPMENT_QUERY = ("SELECT student_id, outstanding FROM equipment_balance "
+                      "WHERE equipment_name=? ORDER BY student_id")
+
+
+def by_student(conn, student_id):
+    """[(equipment_name, outstanding)] currently held by a student."""
+    return conn.execute(BY_STUDENT_QUERY, (student_id,)).fetchall()
+
+
+def by_equipment(conn, equipment_name):
+    """[(student_id, outstanding)] currently holding an item."""
+    return conn.execute(BY_EQUIPMENT_QUERY, (equipment_name,)).fetchall()
+
+
+def main(argv=None):
+    import migrations
+    from db import default_db_path
+
+    parser = argparse.ArgumentParser(description="Verify or rebuild the equipment_balance table.")
+    parser.add_argument('--db', default=default_db_path())
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--verify', action='store_true', help="report drift from the log (default)")
+    group.add_argument('--rebuild', action='store_true', help="recompute the table from the log")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrations.migrate(conn)
+        if args.rebuild:
+            print(f"Rebuilt equipment_balance: {rebuild(conn)} outstanding balance(s).")
+            return 0
+        problems = verify(conn)
+        for sid, name, stored, expected in problems:
+            print(f"{sid} / {name}: stored {stored}, log says {expected}")
+        print(f"{len(problems)} mismatch(es)." if problems else "equipment_balance matches equipment_log.")
+        return 1 if problems else 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,483 @@
+"""
+Offline batch detection over folders of photos and recorded video.
+
+Auditors reconcile recorded bench footage and photo folders against
+equipment_log. This CLI runs them through the same model, preprocessing
+and CLASS_TO_EQUIPMENT mapping as the server, without HTTP:
+
+- frames flow through a chain of generators: images are decoded on a small
+  thread pool, videos on a reader thread, both with a bounded look-ahead,
+  so memory stays flat however long the footage is
+- frames are grouped into batches and run through the model together
+  (a camera's tiling settings apply with --camera, see tiling.py)
+- each frame, or each --segment seconds of video, becomes one record of
+  equipment counts, written as JSON Lines or CSV (one column per item)
+- a checkpoint next to the output records how far the run got; running
+  the same command again resumes from there
+- throughput goes to stderr while running and as a summary at the end
+
+Usage:
+    python batch_detect.py footage/ photos/ -o audit.jsonl
+    python batch_detect.py bench.mp4 --segment 10 --stride 5 -o bench.csv
+    python batch_detect.py bench.mp4 --camera bench-4k -o bench.jsonl   # run again to resume
+"""
+
+import argparse
+import collections
+import csv
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+FORMATS = ('jsonl', 'csv')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v')
+
+
+class BatchError(Exception):
+    """Bad input paths or a checkpoint that doesn't match the command."""
+
+
+# ---------- Sources ----------
+def _kind(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return 'image'
+    if ext in VIDEO_EXTENSIONS:
+        return 'video'
+    return None
+
+
+def list_sources(paths):
+    """Image and video files under `paths`, folders walked in sorted order."""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                sources.extend(os.path.join(root, name) for name in sorted(files) if _kind(name))
+        elif os.path.isfile(path):
+            if _kind(path) is None:
+                raise BatchError(f"{path} is neither an image nor a video file.")
+            sources.append(path)
+        else:
+            raise BatchError(f"{path} does not exist.")
+    return sources
+
+
+class Frame:
+    """One decoded image or video frame and where it came from."""
+
+    __slots__ = ('source_index', 'source', 'index', 'time', 'image')
+
+    def __init__(self, source_index, source, index, time, image):
+        self.source_index = source_index
+        self.source = source
+        self.index = index
+        self.time = time
+        self.image = image
+
+
+def read_image(path):
+    # np.fromfile + imdecode also copes with non-ASCII paths on Windows
+    return cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def video_frames(source_index, path, start=0, stride=1):
+    """Every `stride`-th frame of a video from frame `start` on; skipped frames aren't decoded."""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise BatchError(f"Can't open video {path}.")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+        index = 0
+        while capture.grab():
+            if index >= start and index % stride == 0:
+                ok, image = capture.retrieve()
+                if ok:
+                    yield Frame(source_index, path, index, index / fps if fps else None, image)
+            index += 1
+    finally:
+        capture.release()
+
+
+# ---------- Generator plumbing ----------
+def prefetch(iterable, size):
+    """Run `iterable` on a background thread, at most `size` items ahead of the consumer."""
+    items = queue.Queue(maxsize=max(1, size))
+    stop = threading.Event()
+    done = object()
+
+    def put(entry):
+        """Queue an entry unless the consumer has gone away; returns False if it has."""
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as e:
+            put((done, e))
+
+    thread = threading.Thread(target=produce, name='labcv-batch-reader', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def bounded_map(fn, iterable, workers, window):
+    """fn over `iterable` on `workers` threads, in order, with at most `window` results pending."""
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='labcv-batch-decode') as pool:
+        pending = collections.deque()
+        for item in iterable:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_frames(sources, start=(0, 0), stride=1, decoders=4, prefetch_frames=8):
+    """Decoded frames of every source from checkpoint position `start` = (source, frame) on."""
+    first_source, first_frame = start
+
+    def load(item):
+        index, path = item
+        image = read_image(path)
+        if image is None:
+            print(f"Skipping {path}: not a readable image", file=sys.stderr)
+        return Frame(index, path, 0, None, image)
+
+    i = first_source
+    while i < len(sources):
+        if _kind(sources[i]) == 'video':
+            frames = video_frames(i, sources[i], first_frame if i == first_source else 0, stride)
+            yield from prefetch(frames, prefetch_frames)
+            i += 1
+            continue
+        run = []  # consecutive images are decoded in parallel
+        while i < len(sources) and _kind(sources[i]) == 'image':
+            if not (i == first_source and first_frame > 0):
+                run.append((i, sources[i]))
+            i += 1
+        for frame in bounded_map(load, run, decoders, prefetch_frames):
+            if frame.image is not None:
+                yield frame
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ---------- Records ----------
+def equipment_counts(rows, names, class_to_equipment):
+    """{inventory name: instances} for one frame's (class, confidence, xyxy) rows."""
+    counts = {}
+    for cls, _, _ in rows:
+        equipment = class_to_equipment.get(names[int(cls)])
+        if equipment:
+            counts[equipment] = counts.get(equipment, 0) + 1
+    return counts
+
+
+def frame_record(frame, counts, detections):
+    return {
+        'source': frame.source,
+        'frame': frame.index,
+        'time': round(frame.time, 3) if frame.time is not None else None,
+        'detections': detections,
+        'equipment': counts,
+    }
+
+
+class Segments:
+    """Fold frame counts into fixed-length video segments.
+
+    A segment's count per item is the most seen in any one of its frames,
+    i.e. how many were on the bench at once. Images are one segment each.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = float(seconds)
+        self.current = None
+
+    def _key(self, frame):
+        if frame.time is None:
+            return (frame.source_index, frame.index)
+        return (frame.source_index, int(frame.time // self.seconds))
+
+    def add(self, frame, counts):
+        """Fold in one frame; returns the segment it closed, if any."""
+        key = self._key(frame)
+        closed = None
+        if self.current is not None and self.current['key'] != key:
+            closed = self.flush()
+        if self.current is None:
+            start = None if frame.time is None else key[1] * self.seconds
+            self.current = {'key': key, 'source': frame.source, 'start': start, 'frames': 0, 'equipment': {}}
+        segment = self.current
+        segment['frames'] += 1
+        segment['last'] = frame.index
+        for name, n in counts.items():
+            segment['equipment'][name] = max(segment['equipment'].get(name, 0), n)
+        return closed
+
+    def flush(self):
+        """Close the open segment and return its record (None if there is none)."""
+        segment, self.current = self.current, None
+        if segment is None:
+            return None
+        start = segment['start']
+        return {
+            'source': segment['source'],
+            'start': start,
+            'end': None if start is None else start + self.seconds,
+            'frames': segment['frames'],
+            'equipment': segment['equipment'],
+        }
+
+
+class RecordWriter:
+    """Append records as JSON Lines or CSV (one column per inventory item)."""
+
+    def __init__(self, stream, fmt, fields, equipment):
+        self.stream = stream
+        self.fmt = fmt
+        self.fields = list(fields)
+        self.equipment = sorted(equipment)
+        if fmt == 'csv' and stream.tell() == 0:
+            self._write_csv(self.fields + self.equipment)
+
+    def _write_csv(self, values):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(values)
+        self.stream.write(buffer.getvalue())
+
+    def write(self, record):
+        if self.fmt == 'jsonl':
+            self.stream.write(json.dumps(record) + '\n')
+        else:
+            counts = record['equipment']
+            self._write_csv([record.get(f) if record.get(f) is not None else '' for f in self.fields]
+                            + [counts.get(name, 0) for name in self.equipment])
+
+
+# ---------- Checkpoints ----------
+def load_checkpoint(path, config):
+    """The saved state for this exact command, or None to start over."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    if state.get('config') != config:
+        raise BatchError(f"Checkpoint {path} was written for different inputs or options; "
+                         "delete it (and the output) to start over.")
+    return state
+
+
+def save_checkpoint(path, state):
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(state, f)
+    os.replace(temporary, path)
+
+
+# ---------- Run ----------
+def run(sources, detect, names, class_to_equipment, output, fmt='jsonl', segment=None, batch_size=8,
+        stride=1, decoders=4, checkpoint=None, checkpoint_every=100, progress=10.0, log=sys.stderr):
+    """Detect over every source and write records to `output`; returns throughput stats.
+
+    `detect(images)` returns one list of (class, confidence, xyxy) rows per
+    image. With a `checkpoint` path, a previous run of the same command is
+    resumed: the output is cut back to the last checkpointed record and
+    reading restarts at the frame after it.
+    """
+    config = {'sources': [os.path.abspath(s) for s in sources], 'format': fmt, 'segment': segment,
+              'stride': stride}
+    state = load_checkpoint(checkpoint, config) if checkpoint else None
+    if state is None:
+        state = {'config': config, 'source': 0, 'frame': 0, 'offset': 0, 'records': 0, 'complete': False}
+    if state['complete']:
+        print(f"{output} is already complete ({state['records']} record(s)).", file=log)
+        return {'frames': 0, 'records': 0, 'seconds': 0.0, 'fps': 0.0, 'resumed': True}
+    resumed = state['offset'] > 0 or state['source'] > 0 or state['frame'] > 0
+    if os.path.exists(output):
+        os.truncate(output, state['offset'])
+
+    fields = ('source', 'start', 'end', 'frames') if segment else ('source', 'frame', 'time', 'detections')
+    segments = Segments(segment) if segment else None
+    started = time.perf_counter()
+    wait_seconds = inference_seconds = 0.0
+    frames = records = since_checkpoint = 0
+    previous_records = state['records']
+    next_report = started + progress if progress else None
+
+    with open(output, 'a', encoding='utf-8', newline='') as out:
+        writer = RecordWriter(out, fmt, fields, set(class_to_equipment.values()))
+
+        def emit(record, position):
+            nonlocal records, since_checkpoint
+            writer.write(record)
+            records += 1
+            since_checkpoint += 1
+            if checkpoint and since_checkpoint >= checkpoint_every:
+                mark(position)
+
+        def mark(position, complete=False):
+            """Checkpoint: everything before `position` = (source, frame) is in the output."""
+            nonlocal since_checkpoint
+            out.flush()
+            state.update(source=position[0], frame=position[1], offset=out.tell(),
+                         records=previous_records + records, complete=complete)
+            since_checkpoint = 0
+            if checkpoint:
+                save_checkpoint(checkpoint, state)
+
+        stream = iter(batched(iter_frames(sources, (state['source'], state['frame']), stride, decoders),
+                              batch_size))
+        last = None
+        while True:
+            waited = time.perf_counter()
+            batch = next(stream, None)
+            wait_seconds += time.perf_counter() - waited
+            if batch is None:
+                break
+            t0 = time.perf_counter()
+            results = detect([frame.image for frame in batch])
+            inference_seconds += time.perf_counter() - t0
+
+            for frame, rows in zip(batch, results):
+                frame.image = None  # don't keep decoded frames alive longer than needed
+                counts = equipment_counts(rows, names, class_to_equipment)
+                frames += 1
+                if segments is None:
+                    emit(frame_record(frame, counts, len(rows)), (frame.source_index, frame.index + 1))
+                else:
+                    if last is not None and last.source_index != frame.source_index:
+                        closed = segments.flush()
+                        if closed:
+                            emit(closed, (frame.source_index, 0))
+                    closed = segments.add(frame, counts)
+                    if closed:
+                        # Resume with the frame that opened the new segment
+                        emit(closed, (frame.source_index, frame.index))
+                last = frame
+
+            now = time.perf_counter()
+            if next_report is not None and now >= next_report:
+                next_report = now + progress
+                print(f"{frames} frame(s), {frames / (now - started):.1f} frames/s, "
+                      f"source {last.source_index + 1}/{len(sources)}", file=log, flush=True)
+
+        if segments is not None:
+            closed = segments.flush()
+            if closed:
+                writer.write(closed)
+                records += 1
+        mark((len(sources), 0), complete=True)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'frames': frames,
+        'records': records,
+        'seconds': elapsed,
+        'fps': frames / elapsed if elapsed else 0.0,
+        'decode_wait_seconds': wait_seconds,
+        'inference_seconds': inference_seconds,
+        'resumed': resumed,
+    }
+
+
+def format_for(path):
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run equipment detection over image folders and video files.")
+    parser.add_argument('inputs', nargs='+', help="image/video files or folders")
+    parser.add_argument('-o', '--output', required=True, help="JSONL or CSV file to write")
+    parser.add_argument('--format', choices=FORMATS, help="default: from the output extension, else jsonl")
+    parser.add_argument('--segment', type=float, default=None,
+                        help="one record per this many seconds of video instead of per frame")
+    parser.add_argument('--stride', type=int, default=1, help="only run every Nth video frame")
+    parser.add_argument('--batch', type=int, default=int(os.environ.get('LABCV_BATCH_SIZE', '8')))
+    parser.add_argument('--decoders', type=int, default=4, help="image decoding threads")
+    parser.add_argument('--camera', default=None, help="apply this camera's tiling/ROI settings")
+    parser.add_argument('--checkpoint', default=None, help="default: <output>.checkpoint.json")
+    parser.add_argument('--checkpoint-every', type=int, default=100, help="records between checkpoints")
+    parser.add_argument('--progress', type=float, default=10.0, help="seconds between progress lines (0 = off)")
+    args = parser.parse_args(argv)
+
+    try:
+        sources = list_sources(args.inputs)
+    except BatchError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if not sources:
+        print("No images or videos found.", file=sys.stderr)
+        return 2
+
+    import app as labcv
+    import worker_pool
+
+    labcv.model_loader.start()
+    if not labcv.model_loader.wait():
+        print(f"Model failed to load: {labcv.model_loader.error}", file=sys.stderr)
+        return 1
+    settings = labcv.cameras.get(args.camera)
+
+    def detect(images):
+        if args.camera is not None and settings.active:
+            return [worker_pool.result_rows(labcv.run_model(image, camera=args.camera)) for image in images]
+        return labcv.infer_frames(images)
+
+    try:
+        stats = run(sources, detect, labcv.model_loader.model.names, labcv.CLASS_TO_EQUIPMENT, args.output,
+                    fmt=args.format or format_for(args.output), segment=args.segment,
+                    batch_size=max(1, args.batch), stride=max(1, args.stride), decoders=args.decoders,
+                    checkpoint=args.checkpoint or args.output + '.checkpoint.json',
+                    checkpoint_every=max(1, args.checkpoint_every), progress=args.progress)
+    except BatchError as e:
+        print(e, file=sys.stderr)
+        return 2
+    print(f"{stats['frames']} frame(s) -> {stats['records']} record(s) in {stats['seconds']:.1f}s "
+          f"({stats['fps']:.1f} frames/s; waited {stats.get('decode_wait_seconds', 0.0):.1f}s for decoding, "
+          f"{stats.get('inference_seconds', 0.0):.1f}s in the model)"
+          + (" [resumed]" if stats['resumed'] else ""))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,406 @@
+"""
+Route-level load and latency benchmark on a synthetic database.
+
+test_integration.py checks behaviour against the small real database.db;
+this measures the app at production sizes. It builds a synthetic database
+(students, inventory and millions of equipment_log rows) in a temp
+directory, points the app's connection pool at it and drives
+
+    /borrow_return  /history  /admin/logs  /records  /inventory  /process_capture
+
+from several concurrent clients, either in-process through the Flask test
+client or over HTTP against a local threaded server. /process_capture uses
+a stub model by default so the numbers reflect the web/database path; pass
+--real-model to load the weights instead.
+
+Per-route latency percentiles, throughput and error counts are saved as
+JSON so runs can be compared.
+
+Usage:
+    python bench_routes.py --log-rows 1000000 --concurrency 4 --seconds 10
+    python bench_routes.py --http --routes history admin_logs
+    python bench_routes.py --compare before.json after.json
+"""
+
+import argparse
+import base64
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import cv2
+import numpy as np
+
+from benchmark import percentiles
+import balances
+import migrations
+import rollups
+import search
+
+DEFAULT_DIR = os.path.join(tempfile.gettempdir(), 'labcv_bench')
+EQUIPMENT = ['Graduated Cylinder', 'Beaker', 'Compass', 'Digital Balance', 'Erlenmeyer Flask', 'Funnel',
+             'Horseshoe Magnet', 'Test Tube Rack', 'Triple Beam Balance', 'Tripod']
+COURSES = ['BSCS', 'BSIT', 'BSEd', 'BSChem', 'BSBio', 'BSPhys']
+
+
+# ---------- Synthetic database ----------
+def database_path(directory, students, items, log_rows, seed):
+    return os.path.join(directory, f'bench_{students}s_{items}i_{log_rows}l_{seed}.db')
+
+
+def build_database(path, students=5000, items=50, log_rows=1000000, seed=1, days=365, chunk=50000):
+    """Create a migrated database of the given size with reproducible contents."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    migrations.migrate(conn)
+
+    names = (EQUIPMENT + [f'Item {i:04d}' for i in range(max(0, items - len(EQUIPMENT)))])[:items]
+    student_ids = [f'B{i:06d}' for i in range(students)]
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO inventory (name, quantity) VALUES (?, ?)",
+                     [(name, rng.randint(5, 100)) for name in names])
+    search.defer_students(conn)
+    conn.executemany("INSERT INTO students (student_id, name, course, year_level) VALUES (?, ?, ?, ?)",
+                     [(sid, f'Student {i}', rng.choice(COURSES), rng.randint(1, 4))
+                      for i, sid in enumerate(student_ids)])
+    search.index_students(conn, student_ids)
+    conn.commit()
+
+    start = datetime.datetime(2025, 1, 1)
+    step = days * 86400.0 / max(log_rows, 1)
+    for offset in range(0, log_rows, chunk):
+        rows = []
+        for i in range(offset, min(offset + chunk, log_rows)):
+            ts = start + datetime.timedelta(seconds=i * step)
+            rows.append((rng.choice(student_ids), rng.choice(names), rng.choice(('borrow', 'return')),
+                         ts.strftime('%Y-%m-%d %H:%M:%S'), rng.randint(1, 3)))
+        conn.execute("BEGIN")
+        conn.executemany("INSERT INTO equipment_log (student_id, equipment_name, action, timestamp, quantity) "
+                         "VALUES (?, ?, ?, ?, ?)", rows)
+        conn.commit()
+        print(f"   {min(offset + chunk, log_rows):,} / {log_rows:,} log rows", end='\r', flush=True)
+    print()
+    balances.rebuild(conn)
+    rollups.rebuild(conn)
+    # Statistics as the app leaves them at startup, so the bench sees the plans production gets
+    migrations.migrate(conn)
+    conn.close()
+    return path
+
+
+def prepare_database(args):
+    os.makedirs(args.dir, exist_ok=True)
+    path = database_path(args.dir, args.students, args.items, args.log_rows, args.seed)
+    if os.path.exists(path) and not args.rebuild:
+        print(f"Reusing {path}")
+        return path
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    print(f"Building {path} ({args.students:,} students, {args.items} items, {args.log_rows:,} log rows)")
+    started = time.perf_counter()
+    build_database(path, args.students, args.items, args.log_rows, args.seed)
+    print(f"Built in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+# ---------- Stub model ----------
+class StubBox:
+    def __init__(self, cls_id, conf):
+        self.cls = [cls_id]
+        self.conf = [conf]
+        self.xyxy = [[10.0, 20.0, 110.0, 220.0]]
+
+
+class StubResult:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StubModel:
+    """Returns a fixed beaker + funnel detection without running any network."""
+    names = {0: 'beaker', 1: 'funnel'}
+
+    def __call__(self, frames, **kwargs):
+        return [StubResult([StubBox(0, 0.9), StubBox(1, 0.8)]) for _ in frames]
+
+
+def capture_payload():
+    frame = np.full((480, 640, 3), 127, dtype=np.uint8)
+    ok, jpeg = cv2.imencode('.jpg', frame)
+    return 'data:image/jpeg;base64,' + base64.b64encode(jpeg.tobytes()).decode()
+
+
+# ---------- Scenarios ----------
+class Scenario:
+    """Builds random requests against the synthetic data: (method, path, form)."""
+
+    def __init__(self, conn, seed):
+        self.rng = random.Random(seed)
+        self.students = [r[0] for r in conn.execute("SELECT student_id FROM students ORDER BY RANDOM() LIMIT 2000")]
+        self.equipment = [r[0] for r in conn.execute("SELECT name FROM inventory")]
+        self.capture = capture_payload()
+
+    def borrow_return(self):
+        items = self.rng.sample(self.equipment, self.rng.randint(1, min(5, len(self.equipment))))
+        return 'POST', '/borrow_return', {
+            'student_id': self.rng.choice(self.students),
+            'action': self.rng.choice(('borrow', 'return')),
+            'equipment_names': items,
+            'quantities': [str(self.rng.randint(1, 3)) for _ in items],
+        }
+
+    def history(self):
+        return 'GET', '/history', None
+
+    def admin_logs(self):
+        params = {'sort': self.rng.choice(('timestamp_desc', 'timestamp_asc', 'student_id', 'action'))}
+        choice = self.rng.random()
+        if choice < 0.3:
+            params['student_id'] = self.rng.choice(self.students)
+        elif choice < 0.6:
+            params['equipment'] = self.rng.choice(self.equipment)[1:5].lower()
+        elif choice < 0.8:
+            params['action'] = self.rng.choice(('borrow', 'return'))
+        return 'GET', '/admin/logs?' + urllib.parse.urlencode(params), None
+
+    def records(self):
+        return 'POST', '/records', {'student_id': self.rng.choice(self.students)}
+
+    def inventory(self):
+        return 'GET', '/inventory', None
+
+    def process_capture(self):
+        return 'POST', '/process_capture', {'image_data': self.capture}
+
+
+ROUTES = ('borrow_return', 'history', 'admin_logs', 'records', 'inventory', 'process_capture')
+
+
+# ---------- Clients ----------
+class TestClientDriver:
+    """Requests through Flask's test client (no sockets)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def session(self):
+        client = self.app.test_client()
+
+        def send(method, path, form):
+            if method == 'GET':
+                response = client.get(path)
+            else:
+                response = client.post(path, data=form)
+            response.get_data()
+            return response.status_code
+        return send
+
+    def close(self):
+        pass
+
+
+class HttpDriver:
+    """Requests over HTTP to a threaded werkzeug server on localhost."""
+
+    def __init__(self, app):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def session(self):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+
+        def send(method, path, form):
+            body = urllib.parse.urlencode(form, doseq=True) if form else None
+            headers = {'Content-Type': 'application/x-www-form-urlencoded'} if form else {}
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        return send
+
+    def close(self):
+        self.server.shutdown()
+
+
+def run_route(driver, scenario, route, seconds, concurrency):
+    """Hit one route from `concurrency` clients for `seconds`. Returns a result dict."""
+    build = getattr(scenario, route)
+    lock = threading.Lock()
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        send = driver.session()
+        local, local_status = [], {}
+        while time.perf_counter() < deadline:
+            with lock:
+                method, path, form = build()
+            started = time.perf_counter()
+            try:
+                status = send(method, path, form)
+            except Exception as e:
+                status = type(e).__name__
+            local.append((time.perf_counter() - started) * 1000.0)
+            local_status[status] = local_status.get(status, 0) + 1
+        with lock:
+            latencies.extend(local)
+            for status, count in local_status.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    errors = sum(count for status, count in statuses.items()
+                 if not isinstance(status, int) or status >= 400)
+    return {
+        'route': route,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'latency_ms': percentiles(latencies),
+        'errors': errors,
+        'statuses': {str(k): v for k, v in sorted(statuses.items(), key=str)},
+    }
+
+
+def run_suite(args):
+    path = prepare_database(args)
+    import app as app_module
+    import db
+    from inference import ModelLoader
+
+    # Repoint the connection pool (and the inventory cache's watcher) at the
+    # synthetic database; both are restored afterwards
+    previous_db, previous_loader = db.pool.path, app_module.model_loader
+    db.configure(path)
+    app_module.inventory_cache.close()
+    if not args.real_model:
+        app_module.model_loader = ModelLoader(StubModel)
+    app_module.model_loader.start()
+
+    driver = None
+    results = []
+    try:
+        if not app_module.model_loader.wait(args.model_timeout):
+            sys.exit(f"Model did not load: {app_module.model_loader.error}")
+        conn = sqlite3.connect(path)
+        scenario = Scenario(conn, args.seed)
+        conn.close()
+
+        driver = HttpDriver(app_module.app) if args.http else TestClientDriver(app_module.app)
+        for route in args.routes:
+            run_route(driver, scenario, route, min(1.0, args.seconds), 1)  # warm caches
+            result = run_route(driver, scenario, route, args.seconds, args.concurrency)
+            results.append(result)
+            print(f"{route:>16}: {result['rps']:8.1f} req/s  p50 {result['latency_ms']['p50']:7.2f} ms  "
+                  f"p95 {result['latency_ms']['p95']:7.2f} ms  p99 {result['latency_ms']['p99']:7.2f} ms  "
+                  f"errors {result['errors']}", flush=True)
+    finally:
+        if driver:
+            driver.close()
+        db.configure(previous_db)
+        app_module.inventory_cache.close()
+        app_module.model_loader = previous_loader
+
+    return {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'students': args.students,
+            'items': args.items,
+            'log_rows': args.log_rows,
+            'concurrency': args.concurrency,
+            'seconds': args.seconds,
+            'transport': 'http' if args.http else 'test_client',
+            'model': 'real' if args.real_model else 'stub',
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'cpu_count': os.cpu_count(),
+        },
+        'routes': results,
+    }
+
+
+# ---------- Comparison ----------
+def compare(old_path, new_path, tolerance):
+    """Print per-route deltas; returns the number of regressions found."""
+    with open(old_path) as f:
+        old = {r['route']: r for r in json.load(f)['routes']}
+    with open(new_path) as f:
+        new = {r['route']: r for r in json.load(f)['routes']}
+
+    regressions = 0
+    for route in [r for r in ROUTES if r in old and r in new]:
+        o, n = old[route], new[route]
+        rps_change = (n['rps'] - o['rps']) / o['rps'] if o['rps'] else 0.0
+        p95_change = ((n['latency_ms']['p95'] - o['latency_ms']['p95']) / o['latency_ms']['p95']
+                      if o['latency_ms']['p95'] else 0.0)
+        flags = []
+        if rps_change < -tolerance:
+            flags.append('throughput')
+        if p95_change > tolerance:
+            flags.append('p95')
+        if n['errors'] > o['errors']:
+            flags.append('errors')
+        regressions += bool(flags)
+        print(f"{route}: {o['rps']:.1f} -> {n['rps']:.1f} req/s ({rps_change:+.1%}), "
+              f"p95 {o['latency_ms']['p95']:.2f} -> {n['latency_ms']['p95']:.2f} ms ({p95_change:+.1%})"
+              + (f"  REGRESSION: {', '.join(flags)}" if flags else ''))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the web routes on a synthetic database.")
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--log-rows', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--dir', default=DEFAULT_DIR, help="where synthetic databases are kept and reused")
+    parser.add_argument('--rebuild', action='store_true', help="regenerate the database even if it exists")
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES))
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0, help="measurement time per route")
+    parser.add_argument('--http', action='store_true', help="go through a local HTTP server instead of the test client")
+    parser.add_argument('--real-model', action='store_true', help="load the real weights for /process_capture")
+    parser.add_argument('--model-timeout', type=float, default=120.0)
+    parser.add_argument('--output', default=None, help="JSON file to write (default: bench_routes_<timestamp>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="diff two result files and exit")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="relative slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(args.compare[0], args.compare[1], args.tolerance) else 0
+
+    report = run_suite(args)
+    output = args.output or f"bench_routes_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {len(report['routes'])} routes to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
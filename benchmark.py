@@ -0,0 +1,312 @@
+"""
+Inference benchmark and accuracy-vs-speed harness.
+
+Runs the detection model over the bundled dataset and reports, for every
+combination of backend, input size, batch size and thread count:
+
+- decode / preprocess / inference / postprocess latency (p50, p95, p99)
+- end-to-end frames per second
+- mAP@0.5 and mAP@0.5:0.95 against the YOLO label files, matching classes
+  by name through data.yaml
+
+Results are written as JSON so two runs can be compared.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --backend torch onnx --imgsz 320 640 --batch 1 4 --threads 2 4
+    python benchmark.py --compare before.json after.json
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from backends import BACKENDS, load_backend
+from tracking import iou_matrix
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_DIR = os.path.join(BASE_DIR, 'dataset (trivial)')
+DEFAULT_WEIGHTS = os.path.join(BASE_DIR, 'after_dsmtf.pt')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+STAGES = ('decode', 'preprocess', 'inference', 'postprocess')
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+# ---------- Dataset ----------
+def load_class_names(dataset_dir):
+    """Class list from the dataset's data.yaml."""
+    import yaml
+    with open(os.path.join(dataset_dir, 'data.yaml')) as f:
+        return list(yaml.safe_load(f)['names'])
+
+
+def list_images(dataset_dir, splits):
+    images = []
+    for split in splits:
+        image_dir = os.path.join(dataset_dir, split, 'images')
+        if not os.path.isdir(image_dir):
+            continue
+        for name in sorted(os.listdir(image_dir)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(os.path.join(image_dir, name))
+    return images
+
+
+def label_path(image_path):
+    image_dir, name = os.path.split(image_path)
+    return os.path.join(os.path.dirname(image_dir), 'labels', os.path.splitext(name)[0] + '.txt')
+
+
+def read_labels(path, width, height, class_names):
+    """Ground-truth boxes as (class_name, xyxy pixels) from a YOLO label file."""
+    labels = []
+    if not os.path.exists(path):
+        return labels
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            cls = class_names[int(parts[0])]
+            cx, cy, w, h = (float(v) for v in parts[1:5])
+            labels.append((cls, [(cx - w / 2) * width, (cy - h / 2) * height,
+                                 (cx + w / 2) * width, (cy + h / 2) * height]))
+    return labels
+
+
+# ---------- Metrics ----------
+def percentiles(values):
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'mean': 0.0}
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        'p50': float(np.percentile(arr, 50)),
+        'p95': float(np.percentile(arr, 95)),
+        'p99': float(np.percentile(arr, 99)),
+        'mean': float(arr.mean()),
+    }
+
+
+def average_precision(recall, precision):
+    """Area under the precision/recall curve (all-point interpolation)."""
+    r = np.concatenate(([0.0], recall, [1.0]))
+    p = np.concatenate(([1.0], precision, [0.0]))
+    p = np.flip(np.maximum.accumulate(np.flip(p)))
+    idx = np.where(r[1:] != r[:-1])[0]
+    return float(np.sum((r[idx + 1] - r[idx]) * p[idx + 1]))
+
+
+def compute_map(samples, class_names):
+    """mAP over the dataset's classes.
+
+    `samples` is a list of (predictions, labels) per image where predictions
+    are (class_name, confidence, xyxy) and labels are (class_name, xyxy).
+    Returns mAP@0.5, mAP@0.5:0.95 and AP@0.5 per class.
+    """
+    per_class = {}
+    aps = np.zeros((len(class_names), len(IOU_THRESHOLDS)))
+    for ci, cls in enumerate(class_names):
+        n_labels = 0
+        scores = []
+        hits = []  # per image: (predictions x thresholds) matched flags
+        for predictions, labels in samples:
+            gt = np.array([box for name, box in labels if name == cls], dtype=np.float32).reshape(-1, 4)
+            preds = sorted((p for p in predictions if p[0] == cls), key=lambda p: -p[1])
+            n_labels += len(gt)
+            if not preds:
+                continue
+            boxes = np.array([p[2] for p in preds], dtype=np.float32).reshape(-1, 4)
+            ious = iou_matrix(boxes, gt)
+            matched = np.zeros((len(preds), len(IOU_THRESHOLDS)), dtype=bool)
+            for ti, threshold in enumerate(IOU_THRESHOLDS):
+                used = np.zeros(len(gt), dtype=bool)
+                for pi in range(len(preds)):
+                    candidates = np.where(~used & (ious[pi] >= threshold))[0]
+                    if len(candidates):
+                        used[candidates[np.argmax(ious[pi, candidates])]] = True
+                        matched[pi, ti] = True
+            scores.extend(p[1] for p in preds)
+            hits.append(matched)
+        if n_labels == 0:
+            continue
+        if not scores:
+            per_class[cls] = 0.0
+            continue
+        order = np.argsort(-np.asarray(scores), kind='stable')
+        matched = np.concatenate(hits)[order]
+        tp = np.cumsum(matched, axis=0)
+        fp = np.cumsum(~matched, axis=0)
+        for ti in range(len(IOU_THRESHOLDS)):
+            recall = tp[:, ti] / n_labels
+            precision = tp[:, ti] / np.maximum(tp[:, ti] + fp[:, ti], 1)
+            aps[ci, ti] = average_precision(recall, precision)
+        per_class[cls] = float(aps[ci, 0])
+
+    evaluated = [class_names.index(c) for c in per_class]
+    if not evaluated:
+        return {'map50': 0.0, 'map50_95': 0.0, 'per_class_ap50': {}}
+    return {
+        'map50': float(aps[evaluated, 0].mean()),
+        'map50_95': float(aps[evaluated].mean()),
+        'per_class_ap50': per_class,
+    }
+
+
+# ---------- Benchmark ----------
+def run_config(weights, images, class_names, backend, imgsz, batch, threads, conf, warmup=2):
+    """Benchmark one configuration. Returns a JSON-friendly result dict."""
+    model = load_backend(weights, backend=backend, imgsz=imgsz, threads=threads)
+    names = model.names
+
+    dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    for _ in range(warmup):
+        model([dummy] * batch, conf=conf)
+
+    timings = {stage: [] for stage in STAGES}
+    frame_latency = []
+    samples = []
+    started = time.perf_counter()
+    for i in range(0, len(images), batch):
+        paths = images[i:i + batch]
+        t0 = time.perf_counter()
+        frames = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                data = f.read()
+            frames.append(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR))
+        decode_ms = (time.perf_counter() - t0) * 1000.0 / len(paths)
+
+        results = model(frames, conf=conf)
+        batch_ms = (time.perf_counter() - t0) * 1000.0
+
+        for path, frame, r in zip(paths, frames, results):
+            timings['decode'].append(decode_ms)
+            for stage in ('preprocess', 'inference', 'postprocess'):
+                timings[stage].append(float(r.speed.get(stage) or 0.0))
+            frame_latency.append(batch_ms / len(paths))
+
+            predictions = [
+                (names[int(c)], float(s), [float(v) for v in box])
+                for c, s, box in zip(r.boxes.cls, r.boxes.conf, r.boxes.xyxy)
+            ]
+            h, w = frame.shape[:2]
+            samples.append((predictions, read_labels(label_path(path), w, h, class_names)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'config': {'backend': backend, 'imgsz': imgsz, 'batch': batch, 'threads': threads},
+        'images': len(images),
+        'fps': len(images) / elapsed if elapsed else 0.0,
+        'latency_ms': percentiles(frame_latency),
+        'stages_ms': {stage: percentiles(values) for stage, values in timings.items()},
+        'accuracy': compute_map(samples, class_names),
+    }
+
+
+def run_sweep(args):
+    class_names = load_class_names(args.dataset)
+    images = list_images(args.dataset, args.splits)
+    if args.limit:
+        images = images[:args.limit]
+    if not images:
+        sys.exit(f"No images found under {args.dataset} for splits {args.splits}.")
+
+    runs = []
+    for backend, imgsz, batch, threads in itertools.product(args.backend, args.imgsz, args.batch, args.threads):
+        threads = threads or None
+        print(f"-> backend={backend} imgsz={imgsz} batch={batch} threads={threads or 'default'}", flush=True)
+        result = run_config(args.weights, images, class_names, backend, imgsz, batch, threads, args.conf)
+        runs.append(result)
+        print(f"   {result['fps']:.1f} FPS, p50 {result['latency_ms']['p50']:.1f} ms, "
+              f"p95 {result['latency_ms']['p95']:.1f} ms, mAP50 {result['accuracy']['map50']:.3f}", flush=True)
+
+    return {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'weights': os.path.basename(args.weights),
+            'splits': args.splits,
+            'images': len(images),
+            'conf': args.conf,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+        },
+        'runs': runs,
+    }
+
+
+# ---------- Comparison ----------
+def config_key(run):
+    c = run['config']
+    return (c['backend'], c['imgsz'], c['batch'], c['threads'])
+
+
+def compare(old_path, new_path, tolerance):
+    """Print per-config deltas; returns the number of regressions found."""
+    with open(old_path) as f:
+        old = {config_key(r): r for r in json.load(f)['runs']}
+    with open(new_path) as f:
+        new = {config_key(r): r for r in json.load(f)['runs']}
+
+    regressions = 0
+    for key in sorted(set(old) & set(new), key=str):
+        o, n = old[key], new[key]
+        fps_change = (n['fps'] - o['fps']) / o['fps'] if o['fps'] else 0.0
+        p95_change = ((n['latency_ms']['p95'] - o['latency_ms']['p95']) / o['latency_ms']['p95']
+                      if o['latency_ms']['p95'] else 0.0)
+        map_change = n['accuracy']['map50'] - o['accuracy']['map50']
+        flags = []
+        if fps_change < -tolerance:
+            flags.append('FPS')
+        if p95_change > tolerance:
+            flags.append('p95')
+        if map_change < -0.01:
+            flags.append('mAP')
+        regressions += bool(flags)
+        print(f"{key}: FPS {o['fps']:.1f} -> {n['fps']:.1f} ({fps_change:+.1%}), "
+              f"p95 {o['latency_ms']['p95']:.1f} -> {n['latency_ms']['p95']:.1f} ms ({p95_change:+.1%}), "
+              f"mAP50 {o['accuracy']['map50']:.3f} -> {n['accuracy']['map50']:.3f}"
+              + (f"  REGRESSION: {', '.join(flags)}" if flags else ''))
+    for key in sorted(set(old) ^ set(new), key=str):
+        print(f"{key}: only in {'old' if key in old else 'new'} run")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark detection speed and accuracy on the bundled dataset.")
+    parser.add_argument('--weights', default=DEFAULT_WEIGHTS)
+    parser.add_argument('--dataset', default=DATASET_DIR)
+    parser.add_argument('--splits', nargs='+', default=['test', 'valid'])
+    parser.add_argument('--backend', nargs='+', default=['torch'], choices=BACKENDS)
+    parser.add_argument('--imgsz', nargs='+', type=int, default=[640])
+    parser.add_argument('--batch', nargs='+', type=int, default=[1])
+    parser.add_argument('--threads', nargs='+', type=int, default=[0], help="0 = library default")
+    parser.add_argument('--conf', type=float, default=0.001, help="confidence threshold used for mAP")
+    parser.add_argument('--limit', type=int, default=0, help="only use the first N images")
+    parser.add_argument('--output', default=None, help="JSON file to write (default: bench_<timestamp>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="diff two result files and exit")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="relative slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(args.compare[0], args.compare[1], args.tolerance) else 0
+
+    report = run_sweep(args)
+    output = args.output or f"bench_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {len(report['runs'])} runs to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
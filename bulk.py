@@ -0,0 +1,391 @@
+"""
+Streaming bulk import and export for students, inventory and the log.
+
+Imports read CSV (with a header row) or JSON Lines one row at a time,
+validate each row as it arrives and write valid rows with executemany in
+chunked BEGIN IMMEDIATE transactions, so memory stays flat and a bad row
+only costs an entry in the error report. Exports stream rows from a cursor
+with fetchmany() and never hold the full result.
+
+Log rows must name an existing student and inventory item, and a
+timestamp, if given, must read YYYY-MM-DD HH:MM:SS (UTC). Each chunk
+updates equipment_balance, students.number_of_equipment and the usage
+rollups in its own transaction, so a failure leaves none of its rows
+behind. Student chunks are added to the name search index with one
+statement per chunk (see search.py). The CLI migrates the database
+first, so it works on a fresh one.
+
+Usage:
+    python bulk.py import students students.csv
+    python bulk.py import inventory equipment.jsonl --mode update
+    python bulk.py export equipment_log --format jsonl -o log.jsonl
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import balances
+import rollups
+import search
+
+FORMATS = ('csv', 'jsonl')
+MODES = ('skip', 'update')
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+# As CURRENT_TIMESTAMP writes it, so date(timestamp) works in the rollups
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+# ---------- Row validation ----------
+def _text(row, field, required=True):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"'{field}' is required")
+    return value or None
+
+
+def _int(row, field, default=None, minimum=None):
+    value = row.get(field)
+    if value is None or str(value).strip() == '':
+        if default is None:
+            return None
+        return default
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"'{field}' must be an integer, got {value!r}")
+    if minimum is not None and number < minimum:
+        raise ValueError(f"'{field}' must be at least {minimum}")
+    return number
+
+
+def _student(row):
+    return (_text(row, 'student_id'), _text(row, 'name'), _text(row, 'course', required=False),
+            _int(row, 'year_level'))
+
+
+def _inventory(row):
+    return (_text(row, 'name'), _int(row, 'quantity', default=0, minimum=0))
+
+
+def _timestamp(row, field):
+    value = _text(row, field, required=False)
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT).strftime(TIMESTAMP_FORMAT)
+    except ValueError:
+        raise ValueError(f"'{field}' must be a UTC time like 2025-01-31 14:05:00, got {value!r}")
+
+
+def _log(row):
+    action = _text(row, 'action')
+    if action not in ('borrow', 'return'):
+        raise ValueError(f"'action' must be 'borrow' or 'return', got {action!r}")
+    return (_text(row, 'student_id'), _text(row, 'equipment_name'), action,
+            _timestamp(row, 'timestamp'), _int(row, 'quantity', default=1, minimum=1))
+
+
+# table -> (columns, validator, insert SQL per mode)
+TABLES = {
+    'students': (
+        ('student_id', 'name', 'course', 'year_level'),
+        _student,
+        {
+            'skip': "INSERT OR IGNORE INTO students (student_id, name, course, year_level) VALUES (?, ?, ?, ?)",
+            'update': """INSERT INTO students (student_id, name, course, year_level) VALUES (?, ?, ?, ?)
+                         ON CONFLICT (student_id) DO UPDATE SET
+                         name = excluded.name, course = excluded.course, year_level = excluded.year_level""",
+        },
+    ),
+    'inventory': (
+        ('name', 'quantity'),
+        _inventory,
+        {
+            'skip': "INSERT OR IGNORE INTO inventory (name, quantity) VALUES (?, ?)",
+            'update': """INSERT INTO inventory (name, quantity) VALUES (?, ?)
+                         ON CONFLICT (name) DO UPDATE SET quantity = excluded.quantity""",
+        },
+    ),
+    'equipment_log': (
+        ('student_id', 'equipment_name', 'action', 'timestamp', 'quantity'),
+        _log,
+        {
+            # Log rows are never deduplicated; a missing timestamp means "now"
+            'skip': """INSERT INTO equipment_log (student_id, equipment_name, action, timestamp, quantity)
+                       VALUES (?1, ?2, ?3, COALESCE(?4, CURRENT_TIMESTAMP), ?5)""",
+        },
+    ),
+}
+
+EXPORT_QUERIES = {
+    'students': ("SELECT student_id, name, course, year_level, number_of_equipment FROM students ORDER BY student_id",
+                 ('student_id', 'name', 'course', 'year_level', 'number_of_equipment')),
+    'inventory': ("SELECT name, quantity FROM inventory ORDER BY name", ('name', 'quantity')),
+    'equipment_log': ("SELECT id, student_id, equipment_name, action, timestamp, quantity FROM equipment_log ORDER BY id",
+                      ('id', 'student_id', 'equipment_name', 'action', 'timestamp', 'quantity')),
+}
+
+
+# ---------- Reading ----------
+def format_for(filename, default='csv'):
+    ext = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}.get(ext, default)
+
+
+def iter_records(text_stream, fmt):
+    """Yield (line_number, dict) per input row, or (line_number, error string)."""
+    if fmt == 'csv':
+        reader = csv.DictReader(text_stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(text_stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, f"invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, "each line must be a JSON object"
+                continue
+            yield line_number, record
+    else:
+        raise ValueError(f"Unknown format '{fmt}'. Choose one of: {', '.join(FORMATS)}.")
+
+
+def text_stream(binary):
+    """Wrap an uploaded byte stream for line-by-line decoding (BOM tolerant)."""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+# ---------- Import ----------
+class ImportReport:
+    """Counts and per-row errors for one import."""
+
+    def __init__(self, table):
+        self.table = table
+        self.rows = 0
+        self.written = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def as_dict(self):
+        return {
+            'table': self.table,
+            'rows': self.rows,
+            'written': self.written,
+            'skipped': self.rows - self.written - self.error_count,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'errors_truncated': self.error_count > len(self.errors),
+        }
+
+
+def _unknown_refs(conn, table, chunk):
+    """(line_number, message) for each log row naming a student or item that doesn't exist."""
+    if table != 'equipment_log':
+        return []
+    def missing(column, source):
+        names = sorted({values[column] for _, values in chunk})
+        return {name for (name,) in conn.execute(
+            f"SELECT value FROM json_each(?) WHERE value NOT IN ({source})", (json.dumps(names),))}
+    students = missing(0, "SELECT student_id FROM students")
+    items = missing(1, "SELECT name FROM inventory")
+    errors = []
+    for line_number, (student_id, name, *_) in chunk:
+        if student_id in students:
+            errors.append((line_number, f"student '{student_id}' not found"))
+        elif name in items:
+            errors.append((line_number, f"equipment '{name}' not found in inventory"))
+    return errors
+
+
+def _apply_log_rows(conn, table, rows):
+    """Update the balances, students.number_of_equipment and rollups as record_transaction() does."""
+    if table == 'equipment_log':
+        for student_id, name, action, _, qty in rows:
+            balances.apply(conn, student_id, action, [(name, qty)])
+        # In file order, so a return is clamped at zero after the borrows before it
+        conn.executemany("""UPDATE students SET number_of_equipment = CASE ?1
+                                WHEN 'borrow' THEN COALESCE(number_of_equipment, 0) + ?2
+                                ELSE MAX(0, COALESCE(number_of_equipment, 0) - ?2) END
+                            WHERE student_id = ?3""",
+                         [(action, qty, student_id) for student_id, _, action, _, qty in rows])
+        rollups.catch_up(conn)
+
+
+def _write_rows(conn, table, sql, chunk):
+    """Write valid rows of `chunk` in one transaction. Returns (written, reference errors).
+
+    Any error rolls the whole transaction back and propagates.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        errors = _unknown_refs(conn, table, chunk)
+        rejected = {line_number for line_number, _ in errors}
+        rows = [values for line_number, values in chunk if line_number not in rejected]
+        if table == 'students':
+            search.defer_students(conn)
+        # rowcount excludes trigger writes and ignored duplicates
+        written = conn.executemany(sql, rows).rowcount if rows else 0
+        if table == 'students':
+            search.index_students(conn, [values[0] for values in rows])
+        _apply_log_rows(conn, table, rows)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return written, errors
+
+
+def _write_chunk(conn, table, sql, chunk, report):
+    """Write one chunk in a transaction; on error retry it row by row."""
+    try:
+        written, errors = _write_rows(conn, table, sql, chunk)
+    except sqlite3.Error:
+        # Isolate the bad rows so they don't sink the whole chunk
+        written, errors = 0, []
+        for line_number, values in chunk:
+            try:
+                row_written, row_errors = _write_rows(conn, table, sql, [(line_number, values)])
+            except sqlite3.Error as e:
+                errors.append((line_number, str(e)))
+                continue
+            written += row_written
+            errors.extend(row_errors)
+    report.written += written
+    for line_number, message in sorted(errors):
+        report.error(line_number, message)
+
+
+def import_rows(conn, table, records, mode='skip', chunk_size=CHUNK_SIZE):
+    """Validate and insert (line_number, record) pairs in chunked transactions.
+
+    Returns an ImportReport.
+    """
+    if table not in TABLES:
+        raise ValueError(f"Unknown table '{table}'. Choose one of: {', '.join(TABLES)}.")
+    _, validate, statements = TABLES[table]
+    if mode not in statements:
+        raise ValueError(f"Mode '{mode}' is not available for {table}.")
+    sql = statements[mode]
+
+    report = ImportReport(table)
+    if conn.in_transaction:
+        conn.commit()
+    chunk = []
+    for line_number, record in records:
+        report.rows += 1
+        if isinstance(record, str):
+            report.error(line_number, record)
+            continue
+        try:
+            chunk.append((line_number, validate(record)))
+        except ValueError as e:
+            report.error(line_number, str(e))
+            continue
+        if len(chunk) >= chunk_size:
+            _write_chunk(conn, table, sql, chunk, report)
+            chunk = []
+    if chunk:
+        _write_chunk(conn, table, sql, chunk, report)
+    return report
+
+
+# ---------- Export ----------
+def export_rows(conn, table, fmt='csv', batch_size=1000):
+    """Yield the table as CSV or JSON Lines text, a batch of rows at a time."""
+    if table not in EXPORT_QUERIES:
+        raise ValueError(f"Unknown table '{table}'. Choose one of: {', '.join(EXPORT_QUERIES)}.")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Choose one of: {', '.join(FORMATS)}.")
+    sql, columns = EXPORT_QUERIES[table]
+    cursor = conn.execute(sql)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n') if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        if writer:
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                buffer.write(json.dumps(dict(zip(columns, row))) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+MIMETYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def main(argv=None):
+    import migrations
+    from db import default_db_path
+
+    parser = argparse.ArgumentParser(description="Bulk import/export for students, inventory and the log.")
+    parser.add_argument('--db', default=default_db_path())
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    importer = commands.add_parser('import', help="load rows from a CSV or JSONL file ('-' for stdin)")
+    importer.add_argument('table', choices=list(TABLES))
+    importer.add_argument('path')
+    importer.add_argument('--format', choices=FORMATS, help="default: from the file extension, else csv")
+    importer.add_argument('--mode', choices=MODES, default='skip', help="skip or update existing rows")
+    importer.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    exporter = commands.add_parser('export', help="write a table as CSV or JSONL")
+    exporter.add_argument('table', choices=list(EXPORT_QUERIES))
+    exporter.add_argument('--format', choices=FORMATS, default='csv')
+    exporter.add_argument('-o', '--output', default='-', help="output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrations.migrate(conn)
+        if args.command == 'import':
+            fmt = args.format or format_for(args.path)
+            source = text_stream(sys.stdin.buffer) if args.path == '-' else open(args.path, encoding='utf-8-sig', newline='')
+            with source:
+                report = import_rows(conn, args.table, iter_records(source, fmt), args.mode, args.chunk_size)
+            result = report.as_dict()
+            print(f"{args.table}: {result['rows']} row(s), {result['written']} written, "
+                  f"{result['skipped']} skipped, {result['error_count']} error(s)")
+            for error in result['errors']:
+                print(f"  line {error['line']}: {error['error']}", file=sys.stderr)
+            return 1 if result['error_count'] else 0
+
+        out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8', newline='')
+        try:
+            for text in export_rows(conn, args.table, args.format):
+                out.write(text)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,245 @@
+"""
+SQLite connection layer for LabCV.
+
+Routes used to open a fresh `sqlite3.connect("database.db")` (relative to the
+working directory, default rollback journal) for every query helper. This
+module keeps a small pool of tuned connections instead:
+
+- one connection per request, checked out on first use by get_db() and
+  returned to the pool when the app context tears down
+- long-lived background threads (stream workers, schedulers) keep their
+  own thread-local connection
+- WAL journal, synchronous=NORMAL, a larger page cache, mmap I/O and a busy
+  timeout are applied to every connection
+- prepared statements are reused through sqlite3's per-connection
+  statement cache
+- query counts and timings are collected for /db/stats, and per thread
+  between start_tally() and stop_tally() (one request, for /metrics)
+
+The database file defaults to database.db next to app.py (next to the
+executable in the bundled backend) and can be moved with LABCV_DB_PATH.
+"""
+
+import os
+import sys
+import threading
+import time
+
+import sqlite3
+from flask import g, has_app_context
+
+
+def default_db_path():
+    if getattr(sys, 'frozen', False):
+        base = os.path.dirname(sys.executable)
+    else:
+        base = os.path.dirname(os.path.abspath(__file__))
+    return os.environ.get('LABCV_DB_PATH', os.path.join(base, 'database.db'))
+
+
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),        # ~16 MB page cache
+    ('mmap_size', 268435456),      # 256 MB memory-mapped reads
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),
+)
+
+
+class QueryStats:
+    """Thread-safe counters for connections and query timings."""
+
+    def __init__(self, top=10):
+        self.top = top
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connections_opened = 0
+            self.checkouts = 0
+            self.reused = 0
+            self.queries = 0
+            self.query_seconds = 0.0
+            self.slowest_seconds = 0.0
+            self.by_statement = {}
+
+    def record_query(self, sql, seconds):
+        key = ' '.join(sql.split())[:200]
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+            self.slowest_seconds = max(self.slowest_seconds, seconds)
+            entry = self.by_statement.setdefault(key, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def record_checkout(self, reused):
+        with self._lock:
+            self.checkouts += 1
+            if reused:
+                self.reused += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def snapshot(self):
+        with self._lock:
+            statements = sorted(self.by_statement.items(), key=lambda kv: -kv[1][1])[:self.top]
+            return {
+                'connections_opened': self.connections_opened,
+                'checkouts': self.checkouts,
+                'reused': self.reused,
+                'queries': self.queries,
+                'query_ms_total': self.query_seconds * 1000.0,
+                'query_ms_avg': (self.query_seconds / self.queries * 1000.0) if self.queries else 0.0,
+                'query_ms_max': self.slowest_seconds * 1000.0,
+                'slowest_statements': [
+                    {'sql': sql, 'count': count, 'ms_total': total * 1000.0}
+                    for sql, (count, total) in statements
+                ],
+            }
+
+
+_tally = threading.local()
+
+
+def start_tally():
+    """Start counting the queries run on this thread."""
+    _tally.counts = [0, 0.0]
+
+
+def stop_tally():
+    """Stop counting and return (queries, seconds) since start_tally()."""
+    counts = getattr(_tally, 'counts', None)
+    _tally.counts = None
+    return tuple(counts) if counts else (0, 0.0)
+
+
+def _record(conn, sql, seconds):
+    conn.stats.record_query(sql, seconds)
+    counts = getattr(_tally, 'counts', None)
+    if counts is not None:
+        counts[0] += 1
+        counts[1] += seconds
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record(self.connection, sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(self.connection, sql, time.perf_counter() - started)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors report their query timings."""
+
+    stats = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ConnectionPool:
+    """A bounded pool of tuned connections to one database file."""
+
+    def __init__(self, path, max_idle=8, statement_cache=256):
+        self.path = path
+        self.max_idle = max_idle
+        self.statement_cache = statement_cache
+        self.stats = QueryStats()
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, factory=TimedConnection,
+                               cached_statements=self.statement_cache, check_same_thread=False)
+        conn.stats = self.stats
+        for name, value in PRAGMAS:
+            conn.execute(f"PRAGMA {name}={value}")
+        self.stats.record_connect()
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        self.stats.record_checkout(reused=conn is not None)
+        return conn if conn is not None else self.connect()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()  # never hand out a connection with someone else's writes
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def idle_count(self):
+        with self._lock:
+            return len(self._idle)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+pool = ConnectionPool(default_db_path())
+_thread_local = threading.local()
+
+
+def get_db():
+    """Connection for the current request, or for the current background thread."""
+    if has_app_context():
+        if 'db' not in g:
+            g.db = pool.acquire()
+        return g.db
+    conn = getattr(_thread_local, 'conn', None)
+    if conn is None or getattr(_thread_local, 'path', None) != pool.path:
+        conn = _thread_local.conn = pool.connect()
+        _thread_local.path = pool.path
+    return conn
+
+
+def release_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def configure(path):
+    """Point the pool at another database file (used by tests and benchmarks)."""
+    global pool
+    pool.close_all()
+    pool = ConnectionPool(path)
+    return pool
+
+
+def stats():
+    snapshot = pool.stats.snapshot()
+    snapshot['path'] = pool.path
+    snapshot['idle'] = pool.idle_count()
+    return snapshot
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db)
@@ -57,7 +57,9 @@ function startPython() {
 
 function waitForServer(port, timeout = 30000) {
   const start = Date.now();
-  const url = `http://127.0.0.1:${port}/`;
+  // /healthz answers as soon as Flask is serving; the model keeps loading in
+  // the background and its progress is reported by /readyz.
+  const url = `http://127.0.0.1:${port}/healthz`;
   return new Promise((resolve, reject) => {
     const check = () => {
       http.get(url, (res) => {
@@ -0,0 +1,167 @@
+"""
+Near-duplicate frame cache in front of the detection model.
+
+When a capture misses an item, students tend to retake almost the same
+photo, and the kiosk camera panel re-sends frames of a scene that hasn't
+changed. DetectionCache keys model results by a perceptual hash of the
+decoded frame so a near-identical frame from the same kiosk gets the
+previous detections back without running YOLO:
+
+- the hash is the sign pattern of the low-frequency DCT coefficients of a
+  small grayscale copy of the frame (hash_size x hash_size bits), so small
+  exposure changes and JPEG noise barely move it, while an item entering
+  or leaving the picture flips many bits
+- a lookup scans the kiosk's entries for the closest one whose similarity
+  (share of equal hash bits) is at least `min_similarity` and that is
+  younger than `ttl` seconds
+- entries are evicted least-recently-used once `max_entries` is reached
+
+Sensor noise alone changes roughly a tenth of the bits of a plain bench
+scene, while an added or removed item changes a third or more, hence the
+0.85 default. Configured with LABCV_FRAME_CACHE_SIZE (0 disables),
+LABCV_FRAME_CACHE_SIMILARITY and LABCV_FRAME_CACHE_TTL.
+"""
+
+import collections
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+def frame_hash(frame, hash_size=16):
+    """Perceptual (DCT) hash of a BGR or grayscale frame, as an int of hash_size**2 bits."""
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    side = hash_size * 4
+    small = cv2.resize(frame, (side, side), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:hash_size, :hash_size].flatten()
+    bits = low > np.median(low[1:])  # the DC term would skew the median
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def distance(a, b):
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count('1')
+
+
+class _Entry:
+    __slots__ = ('scope', 'key', 'value', 'stored_at', 'seconds')
+
+    def __init__(self, scope, key, value, stored_at, seconds):
+        self.scope = scope
+        self.key = key
+        self.value = value
+        self.stored_at = stored_at
+        self.seconds = seconds
+
+
+class DetectionCache:
+    """LRU cache of model results keyed by (scope, perceptual hash).
+
+    `scope` keeps kiosks apart; `seconds` passed to store() is the inference
+    time the entry stands for, which is what each hit reports as saved.
+    """
+
+    def __init__(self, max_entries=256, min_similarity=0.85, ttl=10.0, hash_size=16, clock=time.monotonic):
+        self.max_entries = max(0, int(max_entries))
+        self.min_similarity = float(min_similarity)
+        # Most differing bits a match may have
+        self.max_distance = int((1.0 - self.min_similarity) * hash_size * hash_size)
+        self.ttl = float(ttl)
+        self.hash_size = hash_size
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()   # id -> _Entry, oldest first
+        self._ids = 0
+        self._reset_stats()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def key(self, frame):
+        return frame_hash(frame, self.hash_size)
+
+    def lookup(self, scope, key):
+        """The cached value for a frame close enough to `key`, or None."""
+        started = time.perf_counter()
+        now = self.clock()
+        with self._lock:
+            best = None
+            for entry_id, entry in list(self._entries.items()):
+                if now - entry.stored_at > self.ttl:
+                    del self._entries[entry_id]
+                    self.expired += 1
+                    continue
+                if entry.scope != scope:
+                    continue
+                d = distance(entry.key, key)
+                if d <= self.max_distance and (best is None or d < best[1]):
+                    best = (entry_id, d)
+            if best is None:
+                self.misses += 1
+                value = None
+            else:
+                entry = self._entries[best[0]]
+                self._entries.move_to_end(best[0])
+                self.hits += 1
+                self.saved_seconds += entry.seconds
+                value = entry.value
+            self.lookup_seconds += time.perf_counter() - started
+            return value
+
+    def store(self, scope, key, value, seconds=0.0):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._ids += 1
+            self._entries[self._ids] = _Entry(scope, key, value, self.clock(), seconds)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+        self.lookup_seconds = 0.0
+
+    def reset_stats(self):
+        with self._lock:
+            self._reset_stats()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'min_similarity': self.min_similarity,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'saved_inference_seconds': self.saved_seconds,
+                'avg_lookup_us': (self.lookup_seconds / lookups * 1e6) if lookups else 0.0,
+            }
+
+
+def cache_from_env():
+    """Build a DetectionCache from LABCV_FRAME_CACHE_SIZE / _SIMILARITY / _TTL."""
+    return DetectionCache(
+        max_entries=int(os.environ.get('LABCV_FRAME_CACHE_SIZE', '256')),
+        min_similarity=float(os.environ.get('LABCV_FRAME_CACHE_SIMILARITY', '0.85')),
+        ttl=float(os.environ.get('LABCV_FRAME_CACHE_TTL', '10')),
+    )
@@ -0,0 +1,285 @@
+"""
+Model loading and shared inference scheduling for LabCV.
+
+The YOLO weights are loaded (and warmed up) on a background thread by
+ModelLoader so the web server can start answering requests immediately.
+
+Every kiosk that posts a capture ends up calling the same YOLO model. Instead
+of running one frame per request thread, callers hand their frame to a
+BatchScheduler which groups frames from concurrent requests into small
+batches, runs one model call per batch and hands each caller back its own
+result.
+"""
+
+import collections
+import os
+import threading
+import time
+
+
+class ModelNotReady(RuntimeError):
+    """Raised when inference is requested before the model has finished loading."""
+
+
+class ModelLoader:
+    """Load a model on a background thread and report its readiness.
+
+    `factory` builds the model; `warmup`, if given, is called once with the
+    fresh model (e.g. a dummy inference) before it is marked ready, so the
+    first real request doesn't pay for lazy initialisation either.
+    """
+
+    def __init__(self, factory, warmup=None):
+        self.factory = factory
+        self.warmup = warmup
+        self._model = None
+        self._error = None
+        self._state = 'idle'
+        self._load_seconds = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start loading in the background. Safe to call more than once."""
+        with self._lock:
+            if self._state != 'idle':
+                return
+            self._state = 'loading'
+            self._thread = threading.Thread(target=self._load, name='labcv-model-loader', daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        """Block until the model is ready (or failed). Returns True when ready."""
+        self.start()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self._ready.is_set()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    @property
+    def error(self):
+        return self._error
+
+    @property
+    def model(self):
+        if not self._ready.is_set():
+            if self._error is not None:
+                raise ModelNotReady(f"Model failed to load: {self._error}")
+            raise ModelNotReady("Model is still warming up.")
+        return self._model
+
+    def status(self):
+        return {
+            'state': self._state,
+            'ready': self.ready,
+            'load_seconds': self._load_seconds,
+            'error': str(self._error) if self._error is not None else None,
+        }
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            model = self.factory()
+            if self.warmup is not None:
+                self.warmup(model)
+        except Exception as e:
+            self._error = e
+            self._state = 'failed'
+            return
+        finally:
+            self._load_seconds = time.perf_counter() - started
+        self._model = model
+        self._state = 'ready'
+        self._ready.set()
+
+
+class _PendingFrame:
+    """A frame waiting in the queue together with the slot for its result."""
+
+    __slots__ = ('frame', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchScheduler:
+    """Collect frames from many threads and run them through the model in batches.
+
+    `predict` is called with a list of frames and must return a list of
+    results in the same order (ultralytics' `model(frames)` does exactly that).
+    A batch is dispatched as soon as `max_batch_size` frames are waiting or the
+    oldest frame has waited `max_wait_ms`, whichever comes first.
+    """
+
+    def __init__(self, predict, max_batch_size=4, max_wait_ms=15):
+        self.predict = predict
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    # ---------- Lifecycle ----------
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._worker, name='labcv-batch-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ---------- Public API ----------
+    def submit(self, frame, timeout=None):
+        """Queue one frame and block until its result is ready.
+
+        Returns the model result for this frame only. Any exception raised by
+        the model is re-raised in the calling thread.
+        """
+        return self.submit_many([frame], timeout)[0]
+
+    def submit_many(self, frames, timeout=None):
+        """Queue several frames at once (e.g. the tiles of one frame); returns their results in order."""
+        if not self._running:
+            self.start()
+
+        pending = [_PendingFrame(frame) for frame in frames]
+        with self._cond:
+            self._queue.extend(pending)
+            depth = len(self._queue)
+            self._cond.notify()
+
+        with self._stats_lock:
+            self._submitted += len(pending)
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        results = []
+        for p in pending:
+            remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            if not p.done.wait(remaining):
+                raise TimeoutError("Inference did not finish in time.")
+            if p.error is not None:
+                raise p.error
+            results.append(p.result)
+        return results
+
+    def stats(self):
+        """Return queue depth and batch-size statistics for tuning."""
+        with self._cond:
+            depth = len(self._queue)
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'queue_depth': depth,
+                'max_queue_depth': self._max_queue_depth,
+                'submitted': self._submitted,
+                'frames': self._frames,
+                'batches': batches,
+                'errors': self._errors,
+                'avg_batch_size': (self._frames / batches) if batches else 0.0,
+                'batch_size_histogram': {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                'avg_queue_wait_ms': (self._queue_wait_total / self._frames * 1000.0) if self._frames else 0.0,
+                'avg_inference_ms': (self._inference_total / batches * 1000.0) if batches else 0.0,
+                'queue_wait_seconds_total': self._queue_wait_total,
+                'inference_seconds_total': self._inference_total,
+            }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._reset_stats()
+
+    # ---------- Internals ----------
+    def _reset_stats(self):
+        self._submitted = 0
+        self._frames = 0
+        self._batches = 0
+        self._errors = 0
+        self._max_queue_depth = 0
+        self._batch_sizes = collections.Counter()
+        self._queue_wait_total = 0.0
+        self._inference_total = 0.0
+
+    def _next_batch(self):
+        """Block until a batch is ready, or return None when stopping."""
+        with self._cond:
+            while self._running and not self._queue:
+                self._cond.wait()
+            if not self._queue:
+                return None
+
+            deadline = self._queue[0].enqueued_at + self.max_wait
+            while self._running and len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = []
+            while self._queue and len(batch) < self.max_batch_size:
+                batch.append(self._queue.popleft())
+            return batch
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            started = time.perf_counter()
+            try:
+                results = list(self.predict([p.frame for p in batch]))
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"Model returned {len(results)} results for a batch of {len(batch)} frames."
+                    )
+                error = None
+            except Exception as e:
+                results = [None] * len(batch)
+                error = e
+            finished = time.perf_counter()
+
+            with self._stats_lock:
+                self._batches += 1
+                self._frames += len(batch)
+                self._batch_sizes[len(batch)] += 1
+                self._inference_total += finished - started
+                self._queue_wait_total += sum(started - p.enqueued_at for p in batch)
+                if error is not None:
+                    self._errors += 1
+
+            for pending, result in zip(batch, results):
+                pending.result = result
+                pending.error = error
+                pending.done.set()
+
+
+def scheduler_from_env(predict):
+    """Build a BatchScheduler configured from LABCV_BATCH_SIZE / LABCV_BATCH_WAIT_MS."""
+    return BatchScheduler(
+        predict,
+        max_batch_size=int(os.environ.get('LABCV_BATCH_SIZE', '4')),
+        max_wait_ms=float(os.environ.get('LABCV_BATCH_WAIT_MS', '15')),
+    )
@@ -0,0 +1,107 @@
+"""
+In-process cache of the inventory table.
+
+Inventory is small and almost never changes, yet the borrow/return page and
+every detection read it, sometimes twice per request. InventoryCache keeps
+one immutable snapshot (the ordered rows plus a name -> quantity dict) and
+reloads it only when it may be stale:
+
+- the inventory() route calls invalidate() after every add/update/delete
+- the cache holds its own connection and checks `PRAGMA data_version`, which
+  changes whenever any *other* connection commits to the database file; this
+  picks up edits made by other processes (and by this process's pooled
+  connections) without polling the table itself
+
+data_version does not say which table changed, so a commit anywhere (e.g. a
+borrow writing equipment_log) also triggers one reload of the small
+inventory table. Hit/miss counts are exposed through stats().
+"""
+
+import threading
+
+
+class InventorySnapshot:
+    """One consistent view of the inventory table."""
+
+    def __init__(self, version, items):
+        self.version = version
+        self.items = items                                  # [(id, name, quantity)] ordered by name
+        self.by_name = {name: qty for _, name, qty in items}  # name -> quantity
+
+
+class InventoryCache:
+    """Versioned inventory snapshot with write-through invalidation.
+
+    `connect` opens the connection the cache reads and watches through,
+    e.g. db.pool.connect.
+    """
+
+    QUERY = "SELECT id, name, quantity FROM inventory ORDER BY name ASC"
+
+    def __init__(self, connect):
+        self.connect = connect
+        self._conn = None
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._data_version = None
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.external_changes = 0
+
+    def _reload(self):
+        if self._conn is None:
+            self._conn = self.connect()
+        # Read data_version before the rows so a commit in between forces another reload
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        items = self._conn.execute(self.QUERY).fetchall()
+        self._version += 1
+        self._snapshot = InventorySnapshot(self._version, items)
+        self.misses += 1
+        return self._snapshot
+
+    def snapshot(self):
+        """The current InventorySnapshot, reloading it if the database changed."""
+        with self._lock:
+            if self._snapshot is None:
+                return self._reload()
+            if self._conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+                self.external_changes += 1
+                return self._reload()
+            self.hits += 1
+            return self._snapshot
+
+    def items(self):
+        """Rows (id, name, quantity) ordered by name."""
+        return self.snapshot().items
+
+    def as_dict(self):
+        """Dict: equipment_name -> quantity."""
+        return self.snapshot().by_name
+
+    def invalidate(self):
+        """Drop the snapshot; call after writing to the inventory table."""
+        with self._lock:
+            self._snapshot = None
+            self.invalidations += 1
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+            self._snapshot = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'version': self._version,
+                'items': len(self._snapshot.items) if self._snapshot else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'external_changes': self.external_changes,
+            }
@@ -0,0 +1,130 @@
+"""
+Load test for the borrow/return transaction.
+
+Builds a scratch database, then has several "kiosk" threads record carts
+through app.record_transaction() as fast as they can, alternating borrow
+and return, for each cart size. Reports transactions and items per second
+and commit latency percentiles, so the effect of set-based validation and
+batched inserts can be measured as carts grow.
+
+Usage:
+    python load_test.py
+    python load_test.py --carts 1 10 50 --kiosks 4 --seconds 3
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from benchmark import percentiles
+import db
+import migrations
+
+
+def make_database(path, items=50, students=100):
+    """Create a migrated database with `items` inventory rows and `students` students."""
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn)
+    conn.executemany("INSERT INTO inventory (name, quantity) VALUES (?, ?)",
+                     [(f"Item {i:03d}", 100) for i in range(items)])
+    conn.executemany("INSERT INTO students (student_id, name) VALUES (?, ?)",
+                     [(f"S{i:04d}", f"Student {i}") for i in range(students)])
+    conn.commit()
+    conn.close()
+
+
+def run_cart_size(pool, cart_size, seconds, kiosks, students=100):
+    """Hammer record_transaction() with carts of `cart_size` items from `kiosks` threads."""
+    from app import TransactionError, record_transaction
+
+    cart = [(f"Item {i % 50:03d}", 1 + i % 3) for i in range(cart_size)]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def kiosk(index):
+        conn = pool.connect()
+        local, n = [], 0
+        try:
+            while time.perf_counter() < deadline:
+                student_id = f"S{(index + n * kiosks) % students:04d}"
+                action = ('borrow', 'return')[n % 2]
+                started = time.perf_counter()
+                try:
+                    record_transaction(conn, student_id, action, cart)
+                except (TransactionError, sqlite3.OperationalError) as e:
+                    with lock:
+                        errors.append(str(e))
+                    continue
+                finally:
+                    n += 1
+                local.append(time.perf_counter() - started)
+        finally:
+            conn.close()
+            with lock:
+                latencies.extend(local)
+
+    threads = [threading.Thread(target=kiosk, args=(i,)) for i in range(kiosks)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    ms = percentiles([s * 1000.0 for s in latencies])
+    return {
+        'cart_size': cart_size,
+        'transactions': len(latencies),
+        'tx_per_s': len(latencies) / elapsed,
+        'items_per_s': len(latencies) * cart_size / elapsed,
+        'latency_ms': ms,
+        'errors': len(errors),
+    }
+
+
+def run(cart_sizes, seconds, kiosks, path=None):
+    """Run the load test for every cart size and return the result rows."""
+    owned = path is None
+    if owned:
+        handle, path = tempfile.mkstemp(suffix='.db', prefix='labcv_load_')
+        os.close(handle)
+        os.remove(path)
+    try:
+        make_database(path)
+        pool = db.ConnectionPool(path)
+        return [run_cart_size(pool, size, seconds, kiosks) for size in cart_sizes]
+    finally:
+        if owned:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Borrow/return transaction load test.")
+    parser.add_argument('--carts', type=int, nargs='+', default=[1, 5, 10, 25, 50])
+    parser.add_argument('--seconds', type=float, default=2.0, help="duration per cart size")
+    parser.add_argument('--kiosks', type=int, default=4, help="concurrent writer threads")
+    parser.add_argument('--db', default=None, help="database file (default: a temporary file)")
+    parser.add_argument('--json', default=None, help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.carts, args.seconds, args.kiosks, args.db)
+    print(f"{'cart':>5} {'tx/s':>9} {'items/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for r in results:
+        print(f"{r['cart_size']:>5} {r['tx_per_s']:>9.1f} {r['items_per_s']:>10.1f} "
+              f"{r['latency_ms']['p50']:>8.2f} {r['latency_ms']['p95']:>8.2f} {r['errors']:>7}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
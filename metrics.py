@@ -0,0 +1,151 @@
+"""
+In-process metrics for LabCV, exported in the Prometheus text format.
+
+The app keeps a few histograms (route latency, detection stages, template
+rendering, SQLite queries per request) in a Registry, and registers
+collectors that turn the existing stats snapshots (batch scheduler, stream
+hub, connection pool, inventory cache) into samples at scrape time. GET
+/metrics renders everything; nothing here needs a Prometheus client library.
+
+    with DETECTION_STAGES.time(stage='imdecode'):
+        frame = cv2.imdecode(...)
+"""
+
+import bisect
+import contextlib
+import math
+import threading
+import time
+
+# Seconds; covers a sub-millisecond cache hit up to a slow first inference
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    """A Prometheus histogram with one series per label combination."""
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)  # first bound >= value
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        """{label values: (bucket counts, sum, count)}, bucket counts not cumulative."""
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self.snapshot().items()):
+            labels = list(zip(self.labels, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{format_labels(labels + [('le', format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+def family(name, kind, help, samples):
+    """Text lines for a counter or gauge; `samples` is [(labels dict or None, value)]."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{format_labels(sorted((labels or {}).items()))} {format_value(value)}")
+    return lines
+
+
+def histogram_family(name, help, buckets, total, labels=None):
+    """Text lines for a histogram built elsewhere; `buckets` is [(upper bound, count)], not cumulative."""
+    base = sorted((labels or {}).items())
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+    cumulative = 0
+    for bound, n in sorted(buckets):
+        cumulative += n
+        lines.append(f"{name}_bucket{format_labels(base + [('le', format_value(float(bound)))])} {cumulative}")
+    lines.append(f"{name}_bucket{format_labels(base + [('le', '+Inf')])} {cumulative}")
+    lines.append(f"{name}_sum{format_labels(base)} {format_value(total)}")
+    lines.append(f"{name}_count{format_labels(base)} {cumulative}")
+    return lines
+
+
+class Registry:
+    """Histograms plus collectors that return text lines at scrape time."""
+
+    def __init__(self):
+        self._histograms = []
+        self._collectors = []
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        histogram = Histogram(name, help, labels, buckets)
+        self._histograms.append(histogram)
+        return histogram
+
+    def collector(self, fn):
+        """Register `fn() -> [lines]`; usable as a decorator."""
+        self._collectors.append(fn)
+        return fn
+
+    def reset(self):
+        for histogram in self._histograms:
+            histogram.reset()
+
+    def render(self):
+        lines = []
+        for histogram in self._histograms:
+            lines.extend(histogram.collect())
+        for fn in self._collectors:
+            lines.extend(fn())
+        return '\n'.join(lines) + '\n'
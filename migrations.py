@@ -0,0 +1,281 @@
+"""
+Versioned schema migrations for database.db.
+
+The schema version is stored in SQLite's `PRAGMA user_version`. Each
+migration runs inside its own BEGIN IMMEDIATE transaction together with the
+version bump, so a crash leaves the database at the previous version, and
+every step is written to be idempotent (IF NOT EXISTS, column checks) so it
+is also safe on databases created by the old init_db().
+
+Usage:
+    python migrations.py            # migrate database.db to the latest version
+    python migrations.py --status   # print current and latest version
+"""
+
+import argparse
+import re
+import sqlite3
+
+import balances
+import rollups
+import search
+
+
+def column_exists(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def add_column(conn, table, column, decl):
+    if not column_exists(conn, table, column):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# ---------- Migrations ----------
+def _create_base_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS students (
+            student_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            course TEXT,
+            year_level INTEGER,
+            number_of_equipment INTEGER DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS equipment_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id TEXT NOT NULL,
+            equipment_name TEXT NOT NULL,
+            action TEXT CHECK(action IN ('borrow', 'return')),
+            timestamp TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS inventory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            quantity INTEGER DEFAULT 0
+        )
+    ''')
+    # Databases created before equipment tracking lack this column
+    add_column(conn, 'students', 'number_of_equipment', 'INTEGER DEFAULT 0')
+
+
+def _add_log_indexes(conn):
+    # records: WHERE student_id=? ORDER BY timestamp; admin_logs student filter
+    # and student sort
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_log_student_ts ON equipment_log (student_id, timestamp)")
+    # history and admin_logs default/ascending sort
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_log_ts ON equipment_log (timestamp)")
+    # admin_logs action filter and 'action' sort (action ASC, timestamp DESC)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_log_action_ts ON equipment_log (action, timestamp DESC)")
+    # admin_logs equipment dropdown: DISTINCT equipment_name ORDER BY equipment_name
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_log_equipment ON equipment_log (equipment_name)")
+
+
+def _add_action_keyset_index(conn):
+    # Keyset pages on the action sort/filter break timestamp ties on id DESC;
+    # with id in the index the ORDER BY needs no temp b-tree
+    conn.execute("DROP INDEX IF EXISTS idx_log_action_ts")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_log_action_ts_id ON equipment_log (action, timestamp DESC, id DESC)")
+
+
+def _add_log_quantity(conn):
+    # One log row per cart line instead of one row per unit; older rows were one unit each
+    add_column(conn, 'equipment_log', 'quantity', 'INTEGER NOT NULL DEFAULT 1')
+
+
+def _add_equipment_balance(conn):
+    # Materialized outstanding items per student, seeded from the existing log
+    balances.create_table(conn)
+    balances.write(conn, balances.replay(conn))
+
+
+def _add_usage_rollups(conn):
+    # Daily usage per equipment and per course, seeded from the existing log
+    rollups.create_tables(conn)
+    rollups.catch_up(conn)
+
+
+def _add_name_search(conn):
+    # Trigram index over equipment and student names for the admin log filter
+    search.create_schema(conn)
+
+
+def _add_search_deferral(conn):
+    # Lets bulk imports index students a chunk at a time instead of per row
+    search.add_deferral(conn)
+
+
+def _add_filter_sort_indexes(conn):
+    # Keyset pages for admin_logs filters combined with another column's sort:
+    # action filter + student sort, and student filter + action sort (which
+    # also serves student + action filters under every sort)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_log_action_student_ts "
+                 "ON equipment_log (action, student_id, timestamp, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_log_student_action_ts "
+                 "ON equipment_log (student_id, action, timestamp DESC, id DESC)")
+
+
+def _add_equipment_sort_indexes(conn):
+    # The admin_logs equipment filter reads each matching name's rows in the
+    # page's sort order; (equipment_name, timestamp) also covers every lookup
+    # idx_log_equipment served
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_log_equipment_ts ON equipment_log (equipment_name, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_log_equipment_student_ts "
+                 "ON equipment_log (equipment_name, student_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_log_equipment_action_ts "
+                 "ON equipment_log (equipment_name, action, timestamp DESC, id DESC)")
+    conn.execute("DROP INDEX IF EXISTS idx_log_equipment")
+
+
+def _sync_search_triggers(conn):
+    # Databases migrated while steps 5-8 carried copies of the module SQL get
+    # the triggers from search.TRIGGERS, the one definition, like fresh ones
+    search.create_triggers(conn, replace=True)
+
+
+# (version, description, function). Append only; never edit a released step.
+# Steps 5-8 build their tables from balances, rollups and search, which hold
+# the only copy of that DDL; a change to it needs a new step that applies it
+# to databases already past those versions (as steps 8 and 11 do).
+MIGRATIONS = [
+    (1, 'base tables', _create_base_tables),
+    (2, 'equipment_log indexes for records, history and admin_logs', _add_log_indexes),
+    (3, 'id tie-breaker on the action index for keyset pagination', _add_action_keyset_index),
+    (4, 'quantity column on equipment_log', _add_log_quantity),
+    (5, 'equipment_balance table seeded from equipment_log', _add_equipment_balance),
+    (6, 'daily usage rollups per equipment and per course', _add_usage_rollups),
+    (7, 'trigram search over equipment and student names', _add_name_search),
+    (8, 'deferrable student name indexing for bulk imports', _add_search_deferral),
+    (9, 'composite indexes for admin_logs filter and sort pairs', _add_filter_sort_indexes),
+    (10, 'equipment_name indexes in each admin_logs sort order', _add_equipment_sort_indexes),
+    (11, 'search triggers re-created from search.TRIGGERS', _sync_search_triggers),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+# Rows ANALYZE samples per index; keeps it quick on a large log
+ANALYSIS_LIMIT = 1000
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """Apply every pending migration in order. Returns the list of versions applied."""
+    target = LATEST_VERSION if target is None else target
+    applied = []
+    if conn.in_transaction:
+        conn.commit()
+    for version, description, step in MIGRATIONS:
+        if version > target:
+            break
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-read inside the write lock: another process may have migrated
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    update_statistics(conn, full=bool(applied))
+    return applied
+
+
+def update_statistics(conn, full=False):
+    """Refresh the query planner's statistics (sqlite_stat1).
+
+    After a migration every table is analyzed, since new indexes have no
+    statistics yet; otherwise PRAGMA optimize re-analyzes only the tables
+    SQLite considers out of date. Runs at every startup through migrate().
+    """
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    conn.execute("ANALYZE" if full else "PRAGMA optimize")
+    conn.commit()
+
+
+# ---------- Query plan check ----------
+def query_plan(conn, sql, params=()):
+    return [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def is_paginated(sql):
+    return re.search(r'\bLIMIT\b', sql, re.IGNORECASE) is not None
+
+
+def full_scans(conn, sql, params=()):
+    """Plan lines where SQLite reads a whole table or walks a whole index.
+
+    `SCAN t USING [COVERING] INDEX i` has no constraint on the index, so it
+    is only allowed when it hands a LIMITed query its rows already in ORDER
+    BY order: the walk then stops once the page is full.
+    """
+    plan = query_plan(conn, sql, params)
+    # Scanning a CTE's own rows (e.g. a recursive loose index scan) reads no table
+    subqueries = {detail.split()[-1] for detail in plan if detail.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+    ordered_page = is_paginated(sql) and not temp_sorts(plan)
+    scans = []
+    for detail in plan:
+        if not detail.startswith('SCAN ') or 'CONSTANT ROW' in detail:
+            continue
+        # A virtual table (FTS5) scan with a constraint is an index lookup
+        if 'VIRTUAL TABLE INDEX' in detail and not detail.endswith(':'):
+            continue
+        if ' USING ' in detail and ordered_page:
+            continue
+        if detail.split()[1] not in subqueries:
+            scans.append(detail)
+    return scans
+
+
+def temp_sorts(plan):
+    """Plan lines where SQLite sorts rows for ORDER BY instead of reading them in index order."""
+    return [detail for detail in plan if detail.startswith('USE TEMP B-TREE FOR') and 'ORDER BY' in detail]
+
+
+def check_query_plans(conn, queries):
+    """Raise AssertionError listing every (label, plan line) that doesn't use an index.
+
+    That is a full table scan, an unbounded index walk, or a temp b-tree
+    sort in a paginated (LIMIT) query, which would sort every matching row
+    for each page. `queries` is an iterable of (label, sql, params), e.g.
+    app.route_queries().
+    """
+    problems = []
+    for label, sql, params in queries:
+        details = full_scans(conn, sql, params)
+        if is_paginated(sql):
+            details += temp_sorts(query_plan(conn, sql, params))
+        problems.extend(f"{label}: {detail}" for detail in details)
+    if problems:
+        raise AssertionError("Unindexed plans in route queries:\n  " + "\n  ".join(problems))
+
+
+def main(argv=None):
+    from db import default_db_path
+
+    parser = argparse.ArgumentParser(description="Migrate the LabCV database schema.")
+    parser.add_argument('--db', default=default_db_path())
+    parser.add_argument('--status', action='store_true', help="show the schema version and exit")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.status:
+            print(f"{args.db}: version {current_version(conn)} (latest {LATEST_VERSION})")
+            return 0
+        applied = migrate(conn)
+        print(f"Applied migrations: {applied}" if applied else "Database is up to date.")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
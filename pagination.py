@@ -0,0 +1,127 @@
+"""
+Keyset (cursor) pagination for the log pages.
+
+OFFSET pagination gets slower with every page because SQLite still walks all
+skipped rows. Keyset pagination instead remembers the sort key of the last
+row shown and asks for rows strictly after it, which an index on the sort
+columns answers directly no matter how deep the page is.
+
+Cursors are the last row's sort key, JSON-encoded and base64url'd so they
+can travel in a query string.
+"""
+
+import base64
+import binascii
+import json
+import os
+
+DEFAULT_PAGE_SIZE = int(os.environ.get('LABCV_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, length):
+    """Decode a cursor produced by encode_cursor(). Returns None for a bad token."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+
+def page_size_arg(value, default=None):
+    """Parse a per_page argument, clamped to 1..MAX_PAGE_SIZE."""
+    default = default or DEFAULT_PAGE_SIZE
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_condition(sort_key, cursor):
+    """SQL condition selecting rows that sort strictly after `cursor`.
+
+    `sort_key` is a list of (column, 'ASC'|'DESC'). When every column sorts
+    the same way a row-value comparison is used; otherwise the leading column
+    may differ from the rest (e.g. action ASC, timestamp DESC, id DESC) and
+    the condition is expanded so SQLite can still range-scan the index.
+    Returns (sql, params).
+    """
+    directions = [d for _, d in sort_key]
+    columns = [c for c, _ in sort_key]
+
+    def op(direction):
+        return '>' if direction == 'ASC' else '<'
+
+    if len(set(directions)) == 1:
+        placeholders = ', '.join('?' * len(columns))
+        return f"({', '.join(columns)}) {op(directions[0])} ({placeholders})", list(cursor)
+
+    if len(set(directions[1:])) != 1:
+        raise ValueError("Only the leading sort column may differ in direction.")
+    lead, rest = columns[0], columns[1:]
+    lead_op = op(directions[0])
+    rest_placeholders = ', '.join('?' * len(rest))
+    sql = (f"{lead} {lead_op}= ? AND ({lead} {lead_op} ? OR "
+           f"({lead} = ? AND ({', '.join(rest)}) {op(directions[1])} ({rest_placeholders})))")
+    return sql, [cursor[0], cursor[0], cursor[0]] + list(cursor[1:])
+
+
+def order_by(sort_key):
+    return ' ORDER BY ' + ', '.join(f"{c} {d}" for c, d in sort_key)
+
+
+class KeysetPage:
+    """One page of rows read from a cursor, plus the token for the next page.
+
+    The query must be run with LIMIT page_size + 1; the extra row only tells
+    us whether another page exists. Iterating the page reads rows lazily, so
+    it can be handed straight to stream_template; otherwise call load() to
+    materialise it. `next_cursor` is known once iteration has finished.
+    """
+
+    def __init__(self, rows, page_size, key_of, after=None, streamed=False):
+        self._source = iter(rows)
+        self._rows = None
+        self.page_size = page_size
+        self.key_of = key_of
+        self.after = after
+        self.streamed = streamed
+        self.has_more = False
+        self._last = None
+
+    def __iter__(self):
+        if self._rows is not None:
+            yield from self._rows
+            return
+        for i, row in enumerate(self._source):
+            if i == self.page_size:
+                self.has_more = True
+                break
+            self._last = row
+            yield row
+
+    def load(self):
+        if self._rows is None:
+            self._rows = list(self)
+        return self
+
+    @property
+    def rows(self):
+        return self.load()._rows
+
+    @property
+    def next_cursor(self):
+        if not self.has_more or self._last is None:
+            return None
+        return encode_cursor(self.key_of(self._last))
@@ -0,0 +1,126 @@
+"""
+Pre- and postprocessing around the detection model.
+
+A capture used to reach the model at whatever resolution the kiosk sent,
+and ultralytics resized it again for every call and ran NMS over every
+class the weights know, only for app.py to drop the classes that aren't
+inventory items. This module moves that work to where it is cheapest:
+
+- Letterbox scales a frame once into the model's square input (LABCV_IMGSZ)
+  and pads it, writing into a per-thread buffer that is reused for every
+  frame of the same shape, so ultralytics gets a frame it doesn't need to
+  resize; boxes are mapped back to frame coordinates afterwards
+- DetectionOptions holds the confidence / IoU / max-detections settings
+  (LABCV_CONF, LABCV_IOU, LABCV_MAX_DET) passed to every model call
+- class_filter() lists the class ids that map to an inventory item, which
+  ultralytics drops before NMS
+
+LABCV_LETTERBOX=0 and LABCV_CLASS_FILTER=0 switch the first and last off,
+to compare timings under /metrics (labcv_detection_stage_seconds).
+"""
+
+import os
+import threading
+
+import cv2
+import numpy as np
+
+PAD_VALUE = 114  # the grey ultralytics pads with
+
+
+def _truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+class Letterbox:
+    """Scale-and-pad frames into a size x size canvas, reusing buffers per thread.
+
+    The returned canvas is only valid until the same thread letterboxes its
+    next frame into the same `slot`, which suits request threads that block
+    until their result is back; tiles of one frame use one slot each.
+    """
+
+    def __init__(self, size=640, pad_value=PAD_VALUE):
+        self.size = int(size)
+        self.pad_value = pad_value
+        self._local = threading.local()
+
+    def geometry(self, shape):
+        """(scale, new_w, new_h, left, top) for a frame of this shape."""
+        h, w = shape[:2]
+        scale = min(self.size / h, self.size / w)
+        new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
+        return scale, new_w, new_h, (self.size - new_w) // 2, (self.size - new_h) // 2
+
+    def __call__(self, frame, slot=0):
+        """Return (canvas, transform); pass transform to unmap() for the boxes."""
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        key, canvas, geometry = buffers.get(slot, (None, None, None))
+        if key != (frame.shape, frame.dtype):
+            # Padding only changes with the frame shape, so fill it once per shape
+            shape = (self.size, self.size) + frame.shape[2:]
+            canvas = np.full(shape, self.pad_value, dtype=frame.dtype)
+            geometry = self.geometry(frame.shape)
+            buffers[slot] = ((frame.shape, frame.dtype), canvas, geometry)
+        scale, new_w, new_h, left, top = geometry
+        view = canvas[top:top + new_h, left:left + new_w]
+        if (new_w, new_h) == (frame.shape[1], frame.shape[0]):
+            view[...] = frame
+        else:
+            cv2.resize(frame, (new_w, new_h), dst=view, interpolation=cv2.INTER_LINEAR)
+        return canvas, (scale, left, top, frame.shape[1], frame.shape[0])
+
+    @staticmethod
+    def unmap(xyxy, transform):
+        """Map a box from canvas to original frame coordinates, clipped to the frame."""
+        scale, left, top, width, height = transform
+        x1, y1, x2, y2 = xyxy
+        return (
+            min(max((x1 - left) / scale, 0.0), width),
+            min(max((y1 - top) / scale, 0.0), height),
+            min(max((x2 - left) / scale, 0.0), width),
+            min(max((y2 - top) / scale, 0.0), height),
+        )
+
+
+class DetectionOptions:
+    """Keyword arguments for the model call: conf, iou, max_det and the class filter."""
+
+    def __init__(self, conf=0.25, iou=0.7, max_det=300, filter_classes=True):
+        self.conf = float(conf)
+        self.iou = float(iou)
+        self.max_det = int(max_det)
+        self.filter_classes = filter_classes
+
+    def kwargs(self, classes=None):
+        options = {'conf': self.conf, 'iou': self.iou, 'max_det': self.max_det}
+        if self.filter_classes and classes is not None:
+            options['classes'] = classes
+        return options
+
+    def describe(self):
+        return {'conf': self.conf, 'iou': self.iou, 'max_det': self.max_det, 'class_filter': self.filter_classes}
+
+
+def class_filter(names, class_to_equipment, inventory):
+    """Sorted ids of the model classes that map to an item in `inventory`."""
+    return sorted(int(i) for i, name in names.items() if class_to_equipment.get(name) in inventory)
+
+
+def letterbox_from_env():
+    """A Letterbox for LABCV_IMGSZ, or None when LABCV_LETTERBOX is off."""
+    if not _truthy(os.environ.get('LABCV_LETTERBOX', '1')):
+        return None
+    return Letterbox(int(os.environ.get('LABCV_IMGSZ', '640')))
+
+
+def options_from_env():
+    """Build DetectionOptions from LABCV_CONF / LABCV_IOU / LABCV_MAX_DET / LABCV_CLASS_FILTER."""
+    return DetectionOptions(
+        conf=float(os.environ.get('LABCV_CONF', '0.25')),
+        iou=float(os.environ.get('LABCV_IOU', '0.7')),
+        max_det=int(os.environ.get('LABCV_MAX_DET', '300')),
+        filter_classes=_truthy(os.environ.get('LABCV_CLASS_FILTER', '1')),
+    )
@@ -0,0 +1,140 @@
+"""
+A sampling profiler that can be switched on while the server is running.
+
+The Electron shell starts the bundled backend once and keeps it for the
+whole session, so restarting it under cProfile to find a slow path isn't
+practical. SamplingProfiler instead runs a background thread that grabs
+every thread's stack with sys._current_frames() every few milliseconds and
+counts identical stacks. It costs nothing while stopped and is toggled with
+POST /debug/profiler (or LABCV_PROFILER=1 at startup).
+
+Samples are wall-clock: a thread blocked on a lock or on the model shows up
+where it waits. The collapsed output ("thread;outer;...;inner count" per
+line) feeds straight into flamegraph.pl or speedscope.
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+
+# Shortest sampling interval accepted; each sample walks every thread's stack
+MIN_INTERVAL = 0.002
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Sample all thread stacks every `interval` seconds while running."""
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = max(MIN_INTERVAL, float(interval))
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started_at = None
+        self._reset()
+
+    def _reset(self):
+        self._stacks = collections.Counter()
+        self._samples = 0
+        self._sampled_seconds = 0.0
+
+    # ---------- Lifecycle ----------
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        """Start sampling. Safe to call while already running."""
+        with self._lock:
+            if interval is not None:
+                self.interval = max(MIN_INTERVAL, float(interval))
+            if self.running:
+                return
+            self._stop.clear()
+            self._started_at = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name='labcv-profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stop.set()
+        if thread is not None:
+            thread.join()
+
+    def reset(self):
+        with self._lock:
+            self._reset()
+
+    # ---------- Sampling ----------
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(skip=own)
+
+    def sample(self, skip=None):
+        """Record one stack per thread (except `skip`)."""
+        started = time.perf_counter()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == skip:
+                continue
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(ident, f"thread-{ident}"))
+            stacks.append(';'.join(reversed(labels)))
+        with self._lock:
+            self._stacks.update(stacks)
+            self._samples += 1
+            self._sampled_seconds += time.perf_counter() - started
+
+    # ---------- Reports ----------
+    def collapsed(self):
+        """Collapsed stacks, one "frame;frame;... count" line per distinct stack."""
+        with self._lock:
+            stacks = sorted(self._stacks.items(), key=lambda kv: -kv[1])
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def top(self, limit=20):
+        """The hottest functions by own (leaf) and total (inclusive) samples."""
+        with self._lock:
+            stacks = list(self._stacks.items())
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in stacks:
+            frames = stack.split(';')[1:]  # drop the thread name
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        return [{'function': label, 'own': count, 'total': total[label]}
+                for label, count in own.most_common(limit)]
+
+    def status(self):
+        with self._lock:
+            return {
+                'running': self.running,
+                'interval_ms': self.interval * 1000.0,
+                'samples': self._samples,
+                'stacks': len(self._stacks),
+                'overhead_ms': self._sampled_seconds * 1000.0,
+                'running_seconds': (time.perf_counter() - self._started_at) if self.running else None,
+            }
+
+
+def profiler_from_env():
+    """Build a SamplingProfiler from LABCV_PROFILER_INTERVAL_MS, started if LABCV_PROFILER is set."""
+    profiler = SamplingProfiler(interval=float(os.environ.get('LABCV_PROFILER_INTERVAL_MS', '5')) / 1000.0)
+    if os.environ.get('LABCV_PROFILER', '').lower() in ('1', 'true', 'yes'):
+        profiler.start()
+    return profiler
@@ -0,0 +1,174 @@
+"""
+Precomputed usage rollups for the analytics endpoint.
+
+Daily borrow/return volumes are kept in two small tables so dashboards never
+aggregate the raw equipment_log:
+
+    usage_daily_equipment   day x equipment_name x action
+    usage_daily_course      day x course x action
+
+Both hold the number of log rows (`entries`) and the summed `quantity`.
+rollup_state remembers the last equipment_log id folded in, and catch_up()
+aggregates only the rows after it. record_transaction() and bulk imports
+call catch_up() in the same transaction as their log inserts; anything
+written to the log another way needs `python rollups.py` afterwards (or
+from a scheduled job). Weekly figures are summed from the daily rows.
+
+A log row is attributed to the student's course at the time it is folded
+in; students without a course are counted under 'Unknown'.
+
+Usage:
+    python rollups.py               # catch up with the log
+    python rollups.py --rebuild     # recompute everything from the log
+"""
+
+import argparse
+import sqlite3
+
+STATE_KEY = 'usage'
+UNKNOWN_COURSE = 'Unknown'
+PERIODS = ('day', 'week')
+DIMENSIONS = {
+    'equipment': ('usage_daily_equipment', 'equipment_name'),
+    'course': ('usage_daily_course', 'course'),
+}
+
+
+def create_tables(conn):
+    for table, column in DIMENSIONS.values():
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                day TEXT NOT NULL,
+                {column} TEXT NOT NULL,
+                action TEXT NOT NULL,
+                entries INTEGER NOT NULL DEFAULT 0,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, {column}, action)
+            ) WITHOUT ROWID
+        ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            last_log_id INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO rollup_state (name, last_log_id) VALUES (?, 0)", (STATE_KEY,))
+
+
+def last_log_id(conn):
+    row = conn.execute("SELECT last_log_id FROM rollup_state WHERE name=?", (STATE_KEY,)).fetchone()
+    return row[0] if row else 0
+
+
+def catch_up(conn):
+    """Fold log rows newer than the last processed id into the rollups.
+
+    Runs inside the caller's transaction. Returns the number of ids covered.
+    Rows whose timestamp has no date (bulk.py rejects them, but older
+    imports didn't) are passed over rather than blocking every later write.
+    """
+    start = last_log_id(conn)
+    end = conn.execute("SELECT MAX(id) FROM equipment_log").fetchone()[0]
+    if end is None or end <= start:
+        return 0
+    conn.execute('''
+        INSERT INTO usage_daily_equipment (day, equipment_name, action, entries, quantity)
+        SELECT date(timestamp), equipment_name, action, COUNT(*), SUM(quantity)
+        FROM equipment_log
+        WHERE id > ? AND id <= ? AND action IS NOT NULL AND date(timestamp) IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (day, equipment_name, action)
+        DO UPDATE SET entries = entries + excluded.entries, quantity = quantity + excluded.quantity
+    ''', (start, end))
+    conn.execute('''
+        INSERT INTO usage_daily_course (day, course, action, entries, quantity)
+        SELECT date(e.timestamp), COALESCE(NULLIF(s.course, ''), ?), e.action, COUNT(*), SUM(e.quantity)
+        FROM equipment_log e
+        LEFT JOIN students s ON e.student_id = s.student_id
+        WHERE e.id > ? AND e.id <= ? AND e.action IS NOT NULL AND date(e.timestamp) IS NOT NULL
+        GROUP BY 1, 2, 3
+        ON CONFLICT (day, course, action)
+        DO UPDATE SET entries = entries + excluded.entries, quantity = quantity + excluded.quantity
+    ''', (UNKNOWN_COURSE, start, end))
+    conn.execute("UPDATE rollup_state SET last_log_id=? WHERE name=?", (end, STATE_KEY))
+    return end - start
+
+
+def _in_transaction(conn, work):
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = work(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return result
+
+
+def run_catch_up(conn):
+    """catch_up() in its own transaction."""
+    return _in_transaction(conn, catch_up)
+
+
+def rebuild(conn):
+    """Empty the rollups and fold in the whole log again."""
+    def work(conn):
+        for table, _ in DIMENSIONS.values():
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("UPDATE rollup_state SET last_log_id=0 WHERE name=?", (STATE_KEY,))
+        return catch_up(conn)
+    return _in_transaction(conn, work)
+
+
+# ---------- Queries ----------
+def usage_query(by, period='day', action=None, start=None, end=None):
+    """SQL and params for rollup rows grouped by `by` and `period`.
+
+    Rows are (period, key, action, entries, quantity); `start`/`end` are
+    inclusive YYYY-MM-DD bounds on the day.
+    """
+    table, column = DIMENSIONS[by]
+    period_sql = 'day' if period == 'day' else "date(day, '-6 days', 'weekday 1')"
+    query = f"SELECT {period_sql} AS period, {column}, action, SUM(entries), SUM(quantity) FROM {table} WHERE 1=1"
+    params = []
+    if start:
+        query += " AND day >= ?"
+        params.append(start)
+    if end:
+        query += " AND day <= ?"
+        params.append(end)
+    if action:
+        query += " AND action = ?"
+        params.append(action)
+    query += f" GROUP BY period, {column}, action ORDER BY period, {column}, action"
+    return query, params
+
+
+def usage(conn, by, period='day', action=None, start=None, end=None):
+    query, params = usage_query(by, period, action, start, end)
+    return conn.execute(query, params).fetchall()
+
+
+def main(argv=None):
+    import migrations
+    from db import default_db_path
+
+    parser = argparse.ArgumentParser(description="Maintain the usage rollup tables.")
+    parser.add_argument('--db', default=default_db_path())
+    parser.add_argument('--rebuild', action='store_true', help="recompute the rollups from the whole log")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrations.migrate(conn)
+        covered = rebuild(conn) if args.rebuild else run_catch_up(conn)
+        print(f"Rollups cover equipment_log up to id {last_log_id(conn)} ({covered} new id(s) folded in).")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
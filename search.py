@@ -0,0 +1,197 @@
+"""
+Trigram search over equipment and student names.
+
+`equipment_name LIKE '%term%'` can't use an index, so filtering the admin log
+by equipment used to read every log row. Names repeat endlessly in the log
+but there are only a few distinct ones, so they are indexed once instead:
+
+    search_name        (kind, ref, name) for every distinct equipment name
+                       (kind 'equipment', ref = the name) and every student
+                       (kind 'student', ref = student_id)
+    search_name_fts    FTS5 trigram index over search_name.name
+
+Triggers on equipment_log and students keep search_name current, and
+triggers on search_name keep the FTS index in step. The admin log filter
+looks up the matching names here and reads each name's log rows in order
+from an (equipment_name, <sort columns>) index, so a page costs about the
+same however large the log is.
+
+The trigram tokenizer needs at least three characters; shorter terms fall
+back to LIKE over the (small) search_name table.
+
+FTS5 flushes its pending index data at every statement boundary inside a
+transaction, so indexing rows one trigger call at a time is slow for bulk
+loads. Bulk imports therefore pause the student triggers (a row in
+search_defer, only ever visible inside the importing transaction) and index
+each chunk with a single statement through index_students().
+"""
+
+import json
+
+# Student triggers stay quiet while a bulk import holds a search_defer row
+NOT_DEFERRED = "WHEN NOT EXISTS (SELECT 1 FROM search_defer)"
+
+TRIGGERS = {
+    # equipment_log -> search_name
+    'trg_log_name_ai': '''
+        AFTER INSERT ON equipment_log BEGIN
+            INSERT OR IGNORE INTO search_name (kind, ref, name)
+            VALUES ('equipment', new.equipment_name, new.equipment_name);
+        END''',
+    'trg_log_name_ad': '''
+        AFTER DELETE ON equipment_log BEGIN
+            DELETE FROM search_name
+            WHERE kind = 'equipment' AND ref = old.equipment_name
+              AND NOT EXISTS (SELECT 1 FROM equipment_log WHERE equipment_name = old.equipment_name);
+        END''',
+    'trg_log_name_au': '''
+        AFTER UPDATE OF equipment_name ON equipment_log BEGIN
+            INSERT OR IGNORE INTO search_name (kind, ref, name)
+            VALUES ('equipment', new.equipment_name, new.equipment_name);
+            DELETE FROM search_name
+            WHERE kind = 'equipment' AND ref = old.equipment_name
+              AND NOT EXISTS (SELECT 1 FROM equipment_log WHERE equipment_name = old.equipment_name);
+        END''',
+    # students -> search_name
+    'trg_student_name_ai': '''
+        AFTER INSERT ON students {NOT_DEFERRED} BEGIN
+            INSERT INTO search_name (kind, ref, name) VALUES ('student', new.student_id, new.name)
+            ON CONFLICT (kind, ref) DO UPDATE SET name = excluded.name;
+        END''',
+    'trg_student_name_au': '''
+        AFTER UPDATE OF student_id, name ON students {NOT_DEFERRED} BEGIN
+            UPDATE search_name SET ref = new.student_id, name = new.name
+            WHERE kind = 'student' AND ref = old.student_id;
+        END''',
+    'trg_student_name_ad': '''
+        AFTER DELETE ON students BEGIN
+            DELETE FROM search_name WHERE kind = 'student' AND ref = old.student_id;
+        END''',
+    # search_name -> search_name_fts (external content table)
+    'trg_search_fts_ai': '''
+        AFTER INSERT ON search_name BEGIN
+            INSERT INTO search_name_fts (rowid, name) VALUES (new.id, new.name);
+        END''',
+    'trg_search_fts_ad': '''
+        AFTER DELETE ON search_name BEGIN
+            INSERT INTO search_name_fts (search_name_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        END''',
+    'trg_search_fts_au': '''
+        AFTER UPDATE OF name ON search_name BEGIN
+            INSERT INTO search_name_fts (search_name_fts, rowid, name) VALUES ('delete', old.id, old.name);
+            INSERT INTO search_name_fts (rowid, name) VALUES (new.id, new.name);
+        END''',
+}
+
+
+def create_schema(conn):
+    """Create the search tables and triggers and index the existing names."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_name (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            ref TEXT NOT NULL,
+            name TEXT NOT NULL,
+            UNIQUE (kind, ref)
+        )
+    ''')
+    conn.execute("CREATE TABLE IF NOT EXISTS search_defer (flag INTEGER)")
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_name_fts
+        USING fts5(name, content='search_name', content_rowid='id', tokenize='trigram')
+    ''')
+    create_triggers(conn)
+    conn.execute('''
+        INSERT OR IGNORE INTO search_name (kind, ref, name)
+        SELECT 'equipment', equipment_name, equipment_name FROM equipment_log GROUP BY equipment_name
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO search_name (kind, ref, name)
+        SELECT 'student', student_id, name FROM students
+    ''')
+
+
+def create_triggers(conn, names=None, replace=False):
+    """Create the TRIGGERS named (default: all), dropping existing ones first with `replace`."""
+    for name in TRIGGERS if names is None else names:
+        if replace:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {TRIGGERS[name].format(NOT_DEFERRED=NOT_DEFERRED)}")
+
+
+def add_deferral(conn):
+    """Recreate the student triggers with their search_defer guard."""
+    conn.execute("CREATE TABLE IF NOT EXISTS search_defer (flag INTEGER)")
+    create_triggers(conn, ('trg_student_name_ai', 'trg_student_name_au'), replace=True)
+
+
+def defer_students(conn):
+    """Pause the student triggers for the rest of the caller's transaction."""
+    conn.execute("INSERT INTO search_defer (flag) VALUES (1)")
+
+
+def index_students(conn, student_ids):
+    """Index the given students in one statement and resume the triggers."""
+    conn.execute("DELETE FROM search_defer")
+    conn.execute('''
+        INSERT INTO search_name (kind, ref, name)
+        SELECT 'student', student_id, name FROM students
+        WHERE student_id IN (SELECT value FROM json_each(?))
+        ON CONFLICT (kind, ref) DO UPDATE SET name = excluded.name WHERE name != excluded.name
+    ''', (json.dumps(list(student_ids)),))
+
+
+def rebuild(conn):
+    """Re-derive search_name from the log and students and rebuild the FTS index."""
+    conn.execute("DELETE FROM search_name")
+    create_schema(conn)
+    conn.execute("INSERT INTO search_name_fts (search_name_fts) VALUES ('rebuild')")
+
+
+def _phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def matching_refs(term, kind):
+    """SQL selecting the refs of `kind` whose name contains `term`, and its params.
+
+    Meant for `column IN (<sql>)` filters.
+    """
+    if len(term) >= 3:
+        # Drive the lookup from the FTS match (unary + keeps SQLite off the kind index)
+        return ('''SELECT ref FROM search_name
+                   WHERE id IN (SELECT rowid FROM search_name_fts WHERE search_name_fts MATCH ?)
+                     AND +kind = ?''', [_phrase(term), kind])
+    return ("SELECT ref FROM search_name WHERE kind = ? AND name LIKE ? ESCAPE '\\'",
+            [kind, _like_pattern(term)])
+
+
+def matching_names(conn, term, kind):
+    """Sorted refs of `kind` whose name contains `term`."""
+    sql, params = matching_refs(term, kind)
+    return sorted(row[0] for row in conn.execute(sql, params))
+
+
+def search(conn, term, kind=None, limit=20):
+    """Ranked name matches: prefix matches first, then other substrings.
+
+    Returns [(kind, ref, name)].
+    """
+    term = term.strip()
+    if not term:
+        return []
+    kinds = [kind] if kind else ['equipment', 'student']
+    results = []
+    for k in kinds:
+        sql, params = matching_refs(term, k)
+        results.extend(conn.execute(
+            f"SELECT kind, ref, name FROM search_name WHERE kind = ? AND ref IN ({sql})",
+            [k] + params).fetchall())
+    folded = term.lower()
+    results.sort(key=lambda r: (not r[2].lower().startswith(folded), len(r[2]), r[2].lower()))
+    return results[:limit]
@@ -0,0 +1,293 @@
+"""
+Production server for LabCV.
+
+`python app.py` runs Werkzeug's development server: one process, a new
+thread per request, no supervision. This module serves the same Flask app
+with a standard WSGI server for real use, e.g. a shared lab server with many
+kiosks:
+
+    python serve.py                          # production mode
+    FLASK_SERVER=production python app.py    # same, e.g. for the bundled backend
+
+- Linux/macOS: gunicorn with preload_app. The master imports the app (so
+  the migrations run exactly once), loads and warms up the model and
+  freezes the garbage collector, then forks FLASK_WORKERS gthread workers
+  that share the model copy-on-write. Each runs requests on FLASK_THREADS
+  threads; idle keep-alive connections wait in the worker's poller, not on
+  a thread. Crashed workers are restarted, SIGHUP replaces them gracefully,
+  SIGTERM/SIGINT stop within FLASK_GRACEFUL_TIMEOUT and FLASK_MAX_REQUESTS
+  (default 0, off) recycles a worker after that many requests
+- Windows (no fork): waitress in one process with FLASK_THREADS threads;
+  FLASK_WORKERS is ignored
+
+Paths under config['pinned'] (the app's live streams, whose state lives in
+one process) are served by one worker when there are several: every worker
+waits on a lock file, the holder serves those paths on a private Unix
+socket and the others forward them there, relaying the response as it
+streams. When the holder exits the next worker in line takes over.
+
+A streamed response holds a request thread for as long as the client
+listens, and a forwarded one holds one in both workers, so long-lived
+streams must stay below FLASK_THREADS; the app caps its stream clients at
+FLASK_THREADS - 2. Threads are cheap while they wait, so raise FLASK_THREADS
+(default 32) for more kiosks.
+
+FLASK_HOST and FLASK_PORT work as for the development server. Each worker
+keeps its own caches and counters, so /metrics and the */stats endpoints
+describe whichever worker answered.
+"""
+
+import argparse
+import gc
+import http.client
+import math
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import urllib.parse
+
+SERVERS = ('development', 'production')
+
+
+def default_workers():
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def server_config():
+    """Serving options from the FLASK_* environment variables."""
+    env = os.environ.get
+    return {
+        'server': env('FLASK_SERVER', 'development').lower(),
+        'host': env('FLASK_HOST', '127.0.0.1'),
+        'port': int(env('FLASK_PORT', '5000')),
+        'workers': max(1, int(env('FLASK_WORKERS', str(default_workers())))),
+        'threads': max(1, int(env('FLASK_THREADS', '32'))),
+        'graceful_timeout': float(env('FLASK_GRACEFUL_TIMEOUT', '30')),
+        'max_requests': max(0, int(env('FLASK_MAX_REQUESTS', '0'))),
+        'keepalive': float(env('FLASK_KEEPALIVE', '5')),
+        'pinned': (),
+    }
+
+
+def forks():
+    """Whether the pre-fork (gunicorn) server is available here."""
+    return hasattr(os, 'fork')
+
+
+# ---------- Pinned paths ----------
+# Hop-by-hop headers apply to one connection and are not forwarded
+HOP_HEADERS = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailer',
+               'transfer-encoding', 'upgrade'}
+CLIENT_ADDR_HEADER = 'X-Pinned-Client-Addr'
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class PinnedRouter:
+    """WSGI middleware sending requests under `prefixes` to the pinned worker.
+
+    Until start() makes this worker the pinned one, those requests are
+    forwarded over the Unix socket in `directory`; everything else goes to
+    `app` here. The response is relayed as it arrives, so Server-Sent Events
+    keep flowing.
+    """
+
+    def __init__(self, app, prefixes, directory, threads=4, timeout=60.0):
+        self.app = app
+        self.prefixes = tuple(prefixes)
+        self.socket_path = os.path.join(directory, 'pinned.sock')
+        self.lock_path = os.path.join(directory, 'pinned.lock')
+        self.threads = threads
+        self.timeout = timeout
+        self.elected = threading.Event()
+
+    def start(self):
+        """Queue this worker for the pinned role (call once per process)."""
+        threading.Thread(target=self._serve_when_elected, name='labcv-pinned', daemon=True).start()
+
+    def _serve_when_elected(self):
+        import fcntl
+        import waitress
+
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)   # held until this process exits
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)   # left by the previous holder
+        server = waitress.create_server(_forwarded_client(self.app), unix_socket=self.socket_path,
+                                        unix_socket_perms='600', threads=self.threads)
+        self.elected.set()
+        server.run()
+
+    def __call__(self, environ, start_response):
+        if self.elected.is_set() or not environ.get('PATH_INFO', '').startswith(self.prefixes):
+            return self.app(environ, start_response)
+        target = urllib.parse.quote(environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', ''))
+        if environ.get('QUERY_STRING'):
+            target += '?' + environ['QUERY_STRING']
+        headers = {key[5:].replace('_', '-').title(): value for key, value in environ.items()
+                   if key.startswith('HTTP_') and key[5:].replace('_', '-').lower() not in HOP_HEADERS}
+        if environ.get('CONTENT_TYPE'):
+            headers['Content-Type'] = environ['CONTENT_TYPE']
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        body = environ['wsgi.input'].read(length) if length else None
+        headers[CLIENT_ADDR_HEADER] = environ.get('REMOTE_ADDR', '')
+
+        conn = _UnixHTTPConnection(self.socket_path, self.timeout)
+        try:
+            conn.request(environ['REQUEST_METHOD'], target, body=body, headers=headers)
+            response = conn.getresponse()
+        except OSError:
+            conn.close()
+            start_response('503 Service Unavailable', [('Content-Type', 'application/json'), ('Retry-After', '2')])
+            return [b'{"error": "The stream worker is restarting. Please try again shortly."}']
+        start_response(f'{response.status} {response.reason}',
+                       [(name, value) for name, value in response.getheaders() if name.lower() not in HOP_HEADERS])
+        return self._relay(conn, response)
+
+    @staticmethod
+    def _relay(conn, response):
+        try:
+            while True:
+                chunk = response.read1(65536)   # whatever has arrived, without waiting for more
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            response.close()
+            conn.close()
+
+
+def _forwarded_client(app):
+    """Restore the original client address on requests forwarded by a PinnedRouter."""
+    def wrapped(environ, start_response):
+        forwarded = environ.pop('HTTP_' + CLIENT_ADDR_HEADER.upper().replace('-', '_'), None)
+        if forwarded is not None:
+            environ['REMOTE_ADDR'] = forwarded
+        return app(environ, start_response)
+    return wrapped
+
+
+# ---------- Servers ----------
+def waitress_server(app, config):
+    """A waitress server for `app` on config's host and port (not yet running)."""
+    import waitress
+
+    return waitress.create_server(app, host=config['host'], port=config['port'], threads=config['threads'],
+                                  ident='LabCV')
+
+
+def gunicorn_options(config):
+    """gunicorn settings for the FLASK_* options."""
+    return {
+        'bind': f"[{config['host']}]:{config['port']}" if ':' in config['host'] else
+                f"{config['host']}:{config['port']}",
+        'workers': config['workers'],
+        'worker_class': 'gthread',
+        'threads': config['threads'],
+        'graceful_timeout': math.ceil(config['graceful_timeout']),
+        'max_requests': config['max_requests'],
+        'keepalive': math.ceil(config['keepalive']),
+        'preload_app': True,
+    }
+
+
+def _gunicorn_app(app, config, preload, post_fork, ready):
+    from gunicorn.app.base import BaseApplication
+
+    router = None
+    directory = None
+    if config.get('pinned') and config['workers'] > 1:
+        directory = tempfile.mkdtemp(prefix='labcv-')   # mode 0700
+        router = PinnedRouter(app, config['pinned'], directory, threads=config['threads'])
+
+    def worker_started(server, worker):
+        if post_fork is not None:
+            post_fork()
+        if router is not None:
+            router.start()
+
+    def when_ready(server):
+        port = server.LISTENERS[0].sock.getsockname()[1]
+        print(f"LabCV serving on http://{config['host']}:{port} with {config['workers']} worker(s) "
+              f"x {config['threads']} thread(s)", flush=True)
+        if ready is not None:
+            ready(port)
+
+    def on_exit(server):
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in gunicorn_options(config).items():
+                self.cfg.set(key, value)
+            self.cfg.set('post_fork', worker_started)
+            self.cfg.set('when_ready', when_ready)
+            self.cfg.set('on_exit', on_exit)
+
+        def load(self):
+            if preload is not None:
+                preload()
+            # Keep the preloaded heap out of the workers' collections so its pages stay shared
+            gc.collect()
+            gc.freeze()
+            return router or app
+
+    return Application()
+
+
+def run(app, config=None, preload=None, post_fork=None, ready=None):
+    """Serve `app` in production mode until stopped.
+
+    `preload()` runs in the gunicorn master before forking (load everything
+    workers should share); `post_fork()` runs first thing in each worker.
+    On Windows both run in the one waitress process. `ready(port)` is called
+    once the server accepts connections.
+    """
+    config = config or server_config()
+    if not forks():
+        if preload is not None:
+            preload()
+        if post_fork is not None:
+            post_fork()
+        server = waitress_server(app, config)
+        print(f"LabCV serving on http://{config['host']}:{server.effective_port} "
+              f"with {config['threads']} thread(s)", flush=True)
+        if ready is not None:
+            ready(server.effective_port)
+        server.run()
+        return 0
+    _gunicorn_app(app, config, preload, post_fork, ready).run()
+    return 0
+
+
+def main(argv=None):
+    config = server_config()
+    parser = argparse.ArgumentParser(description="Run LabCV with the production server.")
+    parser.add_argument('--host', default=config['host'])
+    parser.add_argument('--port', type=int, default=config['port'])
+    parser.add_argument('--workers', type=int, default=config['workers'])
+    parser.add_argument('--threads', type=int, default=config['threads'])
+    args = parser.parse_args(argv)
+    config.update(host=args.host, port=args.port, workers=max(1, args.workers), threads=max(1, args.threads))
+
+    import app as labcv
+    labcv.model_loader.start()
+    labcv.limit_stream_clients(config['threads'])
+    config['pinned'] = labcv.PINNED_PATHS
+    return run(labcv.app, config, preload=labcv.prepare_for_fork, post_fork=labcv.after_fork)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
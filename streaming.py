@@ -0,0 +1,223 @@
+"""
+Live detection streams for the borrow/return camera panel.
+
+Each kiosk pushes frames with small POSTs and listens for results on a
+Server-Sent Events connection. The StreamHub keeps only the newest frame per
+client, so frames that arrive while the previous one is still being processed
+replace it instead of piling up. Clients are served round-robin with at most
+one frame in flight each, which keeps a slow kiosk from starving the others
+of the shared model.
+"""
+
+import collections
+import threading
+import time
+
+
+class StreamFull(RuntimeError):
+    """Raised when a new client connects while the hub is at max_clients."""
+
+
+class ClientStream:
+    """Per-client state: the newest pending frame and the latest result."""
+
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.pending = None          # newest frame not yet handed to the model
+        self.in_flight = False       # a frame from this client is being processed
+        self.queued = False          # client is waiting in the hub's ready queue
+        self.last_accepted = 0.0
+        self.last_seen = time.monotonic()
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+        self.result_seq = 0
+        self.result = None
+        self.closed = False
+        self.state = {}              # scratch space owned by the processor
+
+
+class StreamHub:
+    """Fair, newest-frame-wins dispatcher from many clients to one detector.
+
+    `process(frame, state)` is called on a worker thread and must return a
+    JSON-serialisable dict; its return value is published to the client's
+    event stream. `state` is a per-client dict the processor may keep data in
+    (e.g. a tracker); it is never used by two threads at once and goes away
+    with the client. Frames can be anything `process` understands (the app
+    passes undecoded request bodies, so dropped frames are never decoded).
+    """
+
+    def __init__(self, process, workers=2, max_fps=5.0, max_clients=16, idle_timeout=30.0):
+        self.process = process
+        self.workers = max(1, int(workers))
+        self.min_interval = 1.0 / max_fps if max_fps and max_fps > 0 else 0.0
+        self.max_clients = max(1, int(max_clients))
+        self.idle_timeout = idle_timeout
+
+        self._clients = {}
+        self._ready = collections.deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+        # Lifetime totals; the per-client counts go away with their clients
+        self._received = 0
+        self._processed = 0
+        self._dropped = 0
+        self._errors = 0
+
+    # ---------- Lifecycle ----------
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f'labcv-stream-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout=None):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    # ---------- Clients ----------
+    def _get_client(self, client_id):
+        """Return the client's stream, creating it if needed. Caller holds the lock."""
+        client = self._clients.get(client_id)
+        if client is None:
+            self._evict_idle()
+            if len(self._clients) >= self.max_clients:
+                raise StreamFull("Too many live detection streams.")
+            client = self._clients[client_id] = ClientStream(client_id)
+        client.last_seen = time.monotonic()
+        return client
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for client_id, client in list(self._clients.items()):
+            if now - client.last_seen > self.idle_timeout and not client.in_flight:
+                client.closed = True
+                del self._clients[client_id]
+        self._cond.notify_all()
+
+    def open(self, client_id):
+        """Register a client (or refresh it). Raises StreamFull when at capacity."""
+        with self._cond:
+            self._get_client(client_id)
+
+    def close(self, client_id):
+        with self._cond:
+            client = self._clients.pop(client_id, None)
+            if client is not None:
+                client.closed = True
+                self._cond.notify_all()
+
+    # ---------- Producer side ----------
+    def push(self, client_id, frame):
+        """Offer a frame from a client. Returns False if it was dropped by the rate cap."""
+        if not self._running:
+            self.start()
+        with self._cond:
+            client = self._get_client(client_id)
+            client.received += 1
+            self._received += 1
+            now = time.monotonic()
+            if self.min_interval and now - client.last_accepted < self.min_interval:
+                client.dropped += 1
+                self._dropped += 1
+                return False
+            client.last_accepted = now
+
+            if client.pending is not None:
+                client.dropped += 1  # the older frame was never processed
+                self._dropped += 1
+            client.pending = frame
+            if not client.in_flight and not client.queued:
+                client.queued = True
+                self._ready.append(client)
+                self._cond.notify()
+            return True
+
+    # ---------- Consumer side ----------
+    def events(self, client_id, keepalive=15.0):
+        """Yield each new result for a client as it is produced.
+
+        A slow reader only ever sees the latest result. Yields None every
+        `keepalive` seconds without a result so the caller can send a heartbeat.
+        The generator ends when the client is closed or evicted.
+        """
+        with self._cond:
+            client = self._clients.get(client_id)
+        if client is None:
+            return
+        seen = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: client.closed or client.result_seq > seen, keepalive)
+                if client.closed:
+                    return
+                client.last_seen = time.monotonic()
+                if client.result_seq == seen:
+                    result = None
+                else:
+                    seen = client.result_seq
+                    result = client.result
+            yield result
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while self._running and not self._ready:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                client = self._ready.popleft()
+                client.queued = False
+                frame, client.pending = client.pending, None
+                if frame is None or client.closed:
+                    continue
+                client.in_flight = True
+
+            started = time.perf_counter()
+            try:
+                result = dict(self.process(frame, client.state))
+            except Exception as e:
+                result = {'error': str(e)}
+                with self._cond:
+                    self._errors += 1
+            result['latency_ms'] = (time.perf_counter() - started) * 1000.0
+
+            with self._cond:
+                client.in_flight = False
+                client.processed += 1
+                self._processed += 1
+                client.result_seq += 1
+                result['seq'] = client.result_seq
+                result['dropped'] = client.dropped
+                client.result = result
+                # A newer frame arrived meanwhile: go to the back of the line
+                if client.pending is not None and not client.closed and not client.queued:
+                    client.queued = True
+                    self._ready.append(client)
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            clients = list(self._clients.values())
+            return {
+                'clients': len(clients),
+                'max_clients': self.max_clients,
+                'workers': self.workers,
+                'ready_queue': len(self._ready),
+                'in_flight': sum(1 for c in clients if c.in_flight),
+                'received': self._received,
+                'processed': self._processed,
+                'dropped': self._dropped,
+                'errors': self._errors,
+            }
+
@@ -0,0 +1,113 @@
+"""
+Tests for admission control in front of the detection endpoints.
+
+Running tests:
+    pytest test_admission.py -v
+"""
+
+import threading
+import time
+
+import pytest  # type: ignore
+
+from admission import AdmissionGate, Overloaded
+
+
+class Blocker:
+    """A job that holds its executor slot until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.entered = threading.Semaphore(0)
+
+    def __call__(self, value=None):
+        self.entered.release()
+        self.release.wait(5)
+        return value
+
+
+def run_in_thread(gate, fn, *args):
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = gate.run(fn, *args)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread, outcome
+
+
+class TestAdmissionGate:
+    """Test concurrency limits, rejection and queue timeouts."""
+
+    def test_runs_jobs_and_propagates_errors(self):
+        gate = AdmissionGate(concurrency=2, queue=2)
+        assert gate.run(lambda a, b: a + b, 2, 3) == 5
+        with pytest.raises(ValueError):
+            gate.run(int, 'not a number')
+        stats = gate.stats()
+        assert stats['admitted'] == 2
+        assert stats['completed'] == 2
+        assert stats['running'] == 0 and stats['waiting'] == 0
+
+    def test_full_queue_is_rejected_with_429(self):
+        gate = AdmissionGate(concurrency=1, queue=1, queue_timeout=5)
+        blocker = Blocker()
+        running, running_outcome = run_in_thread(gate, blocker, 'first')
+        assert blocker.entered.acquire(timeout=5)
+        queued, queued_outcome = run_in_thread(gate, blocker, 'second')
+        deadline = time.monotonic() + 5
+        while gate.stats()['waiting'] != 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        with pytest.raises(Overloaded) as e:
+            gate.run(blocker, 'third')
+        assert e.value.status == 429
+        assert 1 <= e.value.retry_after <= 30
+
+        blocker.release.set()
+        running.join(5)
+        queued.join(5)
+        assert running_outcome['result'] == 'first'
+        assert queued_outcome['result'] == 'second'
+        assert gate.stats()['rejected'] == 1
+        # Slots are handed back once jobs finish
+        assert gate.run(lambda: 'again') == 'again'
+
+    def test_job_that_cannot_start_in_time_gets_503(self):
+        gate = AdmissionGate(concurrency=1, queue=4, queue_timeout=0.05)
+        blocker = Blocker()
+        running, _ = run_in_thread(gate, blocker)
+        assert blocker.entered.acquire(timeout=5)
+        ran = []
+
+        with pytest.raises(Overloaded) as e:
+            gate.run(ran.append, 1)
+        assert e.value.status == 503
+
+        blocker.release.set()
+        running.join(5)
+        gate.run(lambda: None)
+        assert ran == []   # the cancelled job never runs
+        stats = gate.stats()
+        assert stats['timed_out'] == 1
+        assert stats['admitted'] == 2
+        assert stats['waiting'] == 0
+
+    def test_retry_after_grows_with_backlog(self):
+        gate = AdmissionGate(concurrency=1, queue=8, queue_timeout=5)
+        gate.run(time.sleep, 0.02)
+        assert gate.retry_after() == 1
+        with gate._lock:
+            gate.run_seconds = 2.0 * gate.completed
+            gate._waiting = 5
+        assert gate.retry_after() == 10
+        gate.reset_stats()
+        assert gate.stats()['completed'] == 0
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
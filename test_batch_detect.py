@@ -0,0 +1,156 @@
+"""
+Tests for the offline batch detection CLI.
+
+Running tests:
+    pytest test_batch_detect.py -v
+"""
+
+import csv
+import json
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest  # type: ignore
+
+import batch_detect
+from batch_detect import BatchError, Segments, list_sources, prefetch, run
+
+NAMES = {0: 'beaker', 1: 'funnel', 2: 'unknown_thing'}
+MAPPING = {'beaker': 'Beaker', 'funnel': 'Funnel'}
+
+
+def fake_detect(images):
+    """One beaker per frame, plus a funnel when the first pixel is bright."""
+    rows = []
+    for image in images:
+        boxes = [(0, 0.9, (0.0, 0.0, 5.0, 5.0)), (2, 0.5, (1.0, 1.0, 2.0, 2.0))]
+        if image[0, 0, 0] > 128:
+            boxes.append((1, 0.8, (10.0, 10.0, 20.0, 20.0)))
+        rows.append(boxes)
+    return rows
+
+
+def write_video(path, values, fps=10):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), fps, (64, 48))
+    for value in values:
+        writer.write(np.full((48, 64, 3), value, dtype=np.uint8))
+    writer.release()
+
+
+@pytest.fixture
+def footage(tmp_path):
+    folder = tmp_path / 'audit'
+    (folder / 'photos').mkdir(parents=True)
+    for name, value in (('b.jpg', 200), ('a.png', 10)):
+        cv2.imwrite(str(folder / 'photos' / name), np.full((48, 64, 3), value, dtype=np.uint8))
+    (folder / 'notes.txt').write_text('ignored')
+    # 4 dark frames then 4 bright ones at 4 fps: two 1-second segments
+    write_video(folder / 'bench.avi', [10] * 4 + [250] * 4, fps=4)
+    return folder
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestSources:
+    """Test input discovery and the bounded reader."""
+
+    def test_folders_are_walked_in_order(self, footage):
+        sources = list_sources([str(footage)])
+        assert [s.rsplit('/', 1)[-1] for s in sources] == ['bench.avi', 'a.png', 'b.jpg']
+        with pytest.raises(BatchError):
+            list_sources([str(footage / 'notes.txt')])
+        with pytest.raises(BatchError):
+            list_sources([str(footage / 'missing')])
+
+    def test_prefetch_stays_bounded_and_stops_with_the_consumer(self):
+        produced = []
+
+        def numbers():
+            for i in range(1000):
+                produced.append(i)
+                yield i
+
+        reader = prefetch(numbers(), 4)
+        assert next(reader) == 0
+        time.sleep(0.2)
+        assert len(produced) <= 1 + 4 + 1
+        reader.close()
+        assert not any(t.name == 'labcv-batch-reader' for t in threading.enumerate())
+
+
+class TestRun:
+    """Test records, segments and resuming from a checkpoint."""
+
+    def test_per_frame_jsonl(self, footage, tmp_path):
+        output = tmp_path / 'out.jsonl'
+        stats = run(list_sources([str(footage)]), fake_detect, NAMES, MAPPING, str(output), batch_size=3,
+                    stride=2, checkpoint=str(tmp_path / 'ck.json'), progress=0)
+        records = read_jsonl(output)
+        assert stats['frames'] == len(records) == 4 + 2
+        video = [r for r in records if r['source'].endswith('bench.avi')]
+        assert [r['frame'] for r in video] == [0, 2, 4, 6]
+        assert video[0]['time'] == 0.0 and video[2]['time'] == 1.0
+        assert video[0]['equipment'] == {'Beaker': 1}
+        assert video[3]['equipment'] == {'Beaker': 1, 'Funnel': 1}
+        assert records[-1]['equipment'] == {'Beaker': 1, 'Funnel': 1}   # b.jpg is bright
+        assert json.load(open(tmp_path / 'ck.json'))['complete']
+
+    def test_segments_csv(self, footage, tmp_path):
+        output = tmp_path / 'out.csv'
+        run(list_sources([str(footage)]), fake_detect, NAMES, MAPPING, str(output), fmt='csv', segment=1.0,
+            progress=0)
+        with open(output, newline='') as f:
+            rows = list(csv.DictReader(f))
+        assert list(rows[0]) == ['source', 'start', 'end', 'frames', 'Beaker', 'Funnel']
+        assert [(r['start'], r['frames'], r['Funnel']) for r in rows[:2]] == [('0.0', '4', '0'), ('1.0', '4', '1')]
+        assert len(rows) == 2 + 2   # two segments plus one per photo
+
+    def test_interrupted_run_resumes_where_it_stopped(self, footage, tmp_path):
+        sources = list_sources([str(footage)])
+        expected = tmp_path / 'expected.jsonl'
+        run(sources, fake_detect, NAMES, MAPPING, str(expected), progress=0)
+
+        output, checkpoint = tmp_path / 'out.jsonl', str(tmp_path / 'out.ck')
+        calls = []
+
+        def flaky(images):
+            calls.append(len(images))
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return fake_detect(images)
+
+        with pytest.raises(KeyboardInterrupt):
+            run(sources, flaky, NAMES, MAPPING, str(output), batch_size=2, checkpoint=checkpoint,
+                checkpoint_every=3, progress=0)
+        state = json.load(open(checkpoint))
+        assert not state['complete'] and state['frame'] == 3
+
+        stats = run(sources, fake_detect, NAMES, MAPPING, str(output), batch_size=2, checkpoint=checkpoint,
+                    progress=0)
+        assert stats['resumed'] and stats['frames'] == 10 - 3
+        assert read_jsonl(output) == read_jsonl(expected)
+
+        again = run(sources, fake_detect, NAMES, MAPPING, str(output), batch_size=2, checkpoint=checkpoint,
+                    progress=0)
+        assert again['frames'] == 0
+
+        with pytest.raises(BatchError):
+            run(sources, fake_detect, NAMES, MAPPING, str(output), stride=2, checkpoint=checkpoint, progress=0)
+
+    def test_segment_counts_are_the_most_seen_at_once(self):
+        segments = Segments(5.0)
+        frame = batch_detect.Frame(0, 'v.mp4', 0, 0.0, None)
+        assert segments.add(frame, {'Beaker': 2}) is None
+        assert segments.add(batch_detect.Frame(0, 'v.mp4', 1, 4.0, None), {'Beaker': 1, 'Funnel': 1}) is None
+        closed = segments.add(batch_detect.Frame(0, 'v.mp4', 2, 5.0, None), {})
+        assert closed == {'source': 'v.mp4', 'start': 0.0, 'end': 5.0, 'frames': 2,
+                          'equipment': {'Beaker': 2, 'Funnel': 1}}
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
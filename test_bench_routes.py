@@ -0,0 +1,52 @@
+"""
+Tests for the route benchmark suite.
+
+Running tests:
+    pytest test_bench_routes.py -v
+"""
+
+import json
+import sqlite3
+
+import bench_routes
+import balances
+
+
+class TestSyntheticDatabase:
+    """Test the generated database is complete and consistent."""
+
+    def test_sizes_and_derived_tables(self, tmp_path):
+        path = bench_routes.build_database(str(tmp_path / 'bench.db'), students=50, items=12, log_rows=3000)
+        conn = sqlite3.connect(path)
+        counts = [conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                  for t in ('students', 'inventory', 'equipment_log')]
+        assert counts == [50, 12, 3000]
+        assert balances.verify(conn) == []
+        assert conn.execute("SELECT SUM(entries) FROM usage_daily_equipment").fetchone()[0] == 3000
+        conn.close()
+
+    def test_route_queries_use_indexes_at_size(self, tmp_path):
+        from app import route_queries
+        import migrations
+
+        path = bench_routes.build_database(str(tmp_path / 'bench.db'), students=200, items=40, log_rows=20000)
+        conn = sqlite3.connect(path)
+        migrations.check_query_plans(conn, route_queries())
+        conn.close()
+
+
+class TestRouteSuite:
+    """Test a short run over every route with the stub model."""
+
+    def test_short_run_reports_every_route(self, tmp_path):
+        output = tmp_path / 'routes.json'
+        assert bench_routes.main(['--students', '40', '--items', '12', '--log-rows', '2000',
+                                  '--dir', str(tmp_path), '--seconds', '0.2', '--concurrency', '2',
+                                  '--output', str(output)]) == 0
+        report = json.loads(output.read_text())
+        assert [r['route'] for r in report['routes']] == list(bench_routes.ROUTES)
+        for result in report['routes']:
+            assert result['requests'] > 0
+            assert result['errors'] == 0
+
+        assert bench_routes.main(['--compare', str(output), str(output)]) == 0
@@ -0,0 +1,49 @@
+"""
+Tests for the benchmark harness metrics.
+
+Running tests:
+    pytest test_benchmark.py -v
+"""
+
+import pytest  # type: ignore
+
+from benchmark import compute_map, percentiles
+
+CLASSES = ['beaker', 'funnel']
+
+
+class TestComputeMap:
+    """Test mAP against hand-checked cases."""
+
+    def test_perfect_predictions(self):
+        samples = [
+            ([('beaker', 0.9, [0, 0, 10, 10]), ('funnel', 0.8, [20, 20, 40, 40])],
+             [('beaker', [0, 0, 10, 10]), ('funnel', [20, 20, 40, 40])]),
+        ]
+        result = compute_map(samples, CLASSES)
+        assert result['map50'] == pytest.approx(1.0)
+        assert result['map50_95'] == pytest.approx(1.0)
+
+    def test_missed_object_halves_recall(self):
+        samples = [
+            ([('beaker', 0.9, [0, 0, 10, 10])], [('beaker', [0, 0, 10, 10])]),
+            ([], [('beaker', [0, 0, 10, 10])]),
+        ]
+        assert compute_map(samples, CLASSES)['per_class_ap50']['beaker'] == pytest.approx(0.5)
+
+    def test_false_positive_ranked_first(self):
+        samples = [
+            ([('beaker', 0.9, [50, 50, 60, 60]), ('beaker', 0.5, [0, 0, 10, 10])],
+             [('beaker', [0, 0, 10, 10])]),
+        ]
+        assert compute_map(samples, CLASSES)['map50'] == pytest.approx(0.5)
+
+    def test_classes_without_labels_are_skipped(self):
+        samples = [([('beaker', 0.9, [0, 0, 10, 10])], [('beaker', [0, 0, 10, 10])])]
+        assert set(compute_map(samples, CLASSES)['per_class_ap50']) == {'beaker'}
+
+
+def test_percentiles():
+    result = percentiles(list(range(1, 101)))
+    assert result['p50'] == pytest.approx(50.5)
+    assert result['p99'] == pytest.approx(99.01)
@@ -0,0 +1,156 @@
+"""
+Tests for streaming bulk import/export.
+
+Running tests:
+    pytest test_bulk.py -v
+"""
+
+import io
+import json
+import sqlite3
+
+import pytest  # type: ignore
+
+import balances
+import bulk
+import migrations
+import search
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'bulk.db'))
+    migrations.migrate(conn)
+    yield conn
+    conn.close()
+
+
+def load(conn, table, text, fmt='csv', **kwargs):
+    return bulk.import_rows(conn, table, bulk.iter_records(io.StringIO(text), fmt), **kwargs).as_dict()
+
+
+class TestImport:
+    """Test validation, chunking and per-row error reports."""
+
+    def test_csv_students_with_bad_rows(self, conn):
+        text = ("student_id,name,course,year_level\n"
+                "S1,Ann,CS,1\n"
+                "S2,,CS,2\n"          # missing name
+                "S3,Cy,EE,three\n"    # bad year
+                "S1,Ann again,CS,1\n"  # duplicate, skipped
+                "S4,Dee,,\n")
+        report = load(conn, 'students', text, chunk_size=2)
+        assert (report['rows'], report['written'], report['skipped'], report['error_count']) == (5, 2, 1, 2)
+        assert [e['line'] for e in report['errors']] == [3, 4]
+        assert conn.execute("SELECT student_id, name, year_level FROM students ORDER BY student_id").fetchall() == \
+            [('S1', 'Ann', 1), ('S4', 'Dee', None)]
+        assert search.search(conn, 'dee') == [('student', 'S4', 'Dee')]
+
+    def test_update_mode_overwrites(self, conn):
+        load(conn, 'inventory', "name,quantity\nBeaker,5\n")
+        report = load(conn, 'inventory', '{"name": "Beaker", "quantity": 9}\nnot json\n', fmt='jsonl', mode='update')
+        assert report['written'] == 1 and report['error_count'] == 1
+        assert conn.execute("SELECT quantity FROM inventory WHERE name='Beaker'").fetchone() == (9,)
+
+    def test_log_import_updates_balances_and_rollups(self, conn):
+        import rollups
+
+        load(conn, 'students', "student_id,name\nS1,Ann\n")
+        load(conn, 'inventory', "name,quantity\nBeaker,5\nFunnel,2\n")
+        text = ("student_id,equipment_name,action,timestamp,quantity\n"
+                "S1,Beaker,borrow,2025-01-06 09:00:00,3\n"
+                "S1,Beaker,return,2025-01-06 10:00:00,1\n"
+                "S1,Beaker,lend,2025-01-06 11:00:00,1\n"
+                "S1,Funnel,return,2025-01-06 12:00:00,5\n")
+        report = load(conn, 'equipment_log', text)
+        assert report['written'] == 3 and report['error_count'] == 1
+        assert balances.by_student(conn, 'S1') == [('Beaker', 2)]
+        assert balances.verify(conn) == []
+        assert rollups.last_log_id(conn) == 3
+        # 3 borrowed, 1 returned, then a return of 5 clamps at zero
+        assert conn.execute("SELECT number_of_equipment FROM students WHERE student_id='S1'").fetchone() == (0,)
+
+    def test_log_import_counts_outstanding_items_per_student(self, conn):
+        load(conn, 'students', "student_id,name\nS1,Ann\nS2,Bob\n")
+        load(conn, 'inventory', "name,quantity\nBeaker,5\nFunnel,2\n")
+        text = ("student_id,equipment_name,action,quantity\n"
+                "S1,Beaker,borrow,3\nS2,Funnel,borrow,1\nS1,Beaker,return,1\n")
+        load(conn, 'equipment_log', text, chunk_size=2)
+        assert conn.execute("SELECT student_id, number_of_equipment FROM students ORDER BY 1").fetchall() == \
+            [('S1', 2), ('S2', 1)]
+
+    def test_log_rows_need_a_valid_time_student_and_item(self, conn):
+        import rollups
+
+        load(conn, 'students', "student_id,name\nS1,Ann\n")
+        load(conn, 'inventory', "name,quantity\nBeaker,5\n")
+        text = ("student_id,equipment_name,action,timestamp,quantity\n"
+                "S1,Beaker,borrow,01/02/2025,1\n"
+                "S1,Beaker,borrow,2025-02-30 09:00:00,1\n"
+                "S9,Beaker,borrow,2025-01-06 09:00:00,1\n"
+                "S1,Kettle,borrow,2025-01-06 09:00:00,1\n"
+                "S1,Beaker,borrow,2025-01-06 09:00:00,2\n")
+        report = load(conn, 'equipment_log', text)
+        assert report['written'] == 1
+        assert [(e['line'], e['error'].split()[0]) for e in report['errors']] == \
+            [(2, "'timestamp'"), (3, "'timestamp'"), (4, 'student'), (5, 'equipment')]
+        assert conn.execute("SELECT student_id, timestamp, quantity FROM equipment_log").fetchall() == \
+            [('S1', '2025-01-06 09:00:00', 2)]
+        assert rollups.run_catch_up(conn) == 0
+
+    def test_failed_chunk_leaves_no_rows(self, conn, monkeypatch):
+        import rollups
+
+        load(conn, 'students', "student_id,name\nS1,Ann\n")
+        load(conn, 'inventory', "name,quantity\nBeaker,5\n")
+
+        def fail(conn):
+            raise RuntimeError("rollup failed")
+        monkeypatch.setattr(rollups, 'catch_up', fail)
+        with pytest.raises(RuntimeError):
+            load(conn, 'equipment_log', "student_id,equipment_name,action\nS1,Beaker,borrow\n")
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM equipment_log").fetchone() == (0,)
+        assert conn.execute("SELECT number_of_equipment FROM students").fetchone() == (0,)
+        assert balances.by_student(conn, 'S1') == []
+
+    def test_unknown_table_is_rejected(self, conn):
+        with pytest.raises(ValueError):
+            load(conn, 'grades', "a\n1\n")
+
+
+class TestCommandLine:
+    """Test that the CLIs bring a fresh database up to date before using it."""
+
+    def test_import_into_fresh_database(self, tmp_path, capsys):
+        path = tmp_path / 'students.csv'
+        path.write_text("student_id,name\nS1,Ann\n")
+        db_path = str(tmp_path / 'fresh.db')
+        assert bulk.main(['--db', db_path, 'import', 'students', str(path)]) == 0
+        assert '1 written' in capsys.readouterr().out
+        conn = sqlite3.connect(db_path)
+        assert migrations.current_version(conn) == migrations.LATEST_VERSION
+        assert conn.execute("SELECT student_id, name FROM students").fetchall() == [('S1', 'Ann')]
+        conn.close()
+
+    def test_balances_and_rollups_on_fresh_database(self, tmp_path):
+        import rollups
+
+        assert balances.main(['--db', str(tmp_path / 'balances.db')]) == 0
+        assert rollups.main(['--db', str(tmp_path / 'rollups.db')]) == 0
+
+
+class TestExport:
+    """Test that exports stream every row in both formats."""
+
+    def test_round_trip(self, conn):
+        load(conn, 'students', "student_id,name,course,year_level\n" +
+             "".join(f"S{i:03d},Student {i},CS,1\n" for i in range(250)))
+        chunks = list(bulk.export_rows(conn, 'students', 'jsonl', batch_size=100))
+        assert len(chunks) == 3
+        rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        assert len(rows) == 250 and rows[0]['student_id'] == 'S000'
+
+        csv_text = ''.join(bulk.export_rows(conn, 'students', 'csv'))
+        assert csv_text.splitlines()[0] == 'student_id,name,course,year_level,number_of_equipment'
+        assert len(csv_text.splitlines()) == 251
@@ -0,0 +1,424 @@
+"""
+Tests for the pooled SQLite connection layer.
+
+Running tests:
+    pytest test_db.py -v
+"""
+
+import sqlite3
+
+import pytest  # type: ignore
+
+import db
+import migrations
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = db.ConnectionPool(str(tmp_path / 'test.db'), max_idle=2)
+    yield pool
+    pool.close_all()
+
+
+class TestConnectionPool:
+    """Test connection tuning, reuse and statistics."""
+
+    def test_pragmas_are_applied(self, pool):
+        conn = pool.acquire()
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+        pool.release(conn)
+
+    def test_connections_are_reused(self, pool):
+        first = pool.acquire()
+        pool.release(first)
+        second = pool.acquire()
+        assert second is first
+        stats = pool.stats.snapshot()
+        assert stats['connections_opened'] == 1
+        assert stats['reused'] == 1
+
+    def test_release_rolls_back_open_transaction(self, pool):
+        conn = pool.acquire()
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (1)")
+        pool.release(conn)
+        assert pool.acquire().execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+    def test_queries_are_timed(self, pool):
+        conn = pool.acquire()
+        before = pool.stats.snapshot()['queries']
+        conn.execute("SELECT 1").fetchone()
+        conn.cursor().execute("SELECT 2").fetchone()
+        assert pool.stats.snapshot()['queries'] == before + 2
+
+    def test_idle_pool_is_bounded(self, pool):
+        conns = [pool.acquire() for _ in range(4)]
+        for conn in conns:
+            pool.release(conn)
+        assert pool.idle_count() == 2
+
+
+class TestMigrations:
+    """Test versioned migrations and the route query plan check."""
+
+    def test_fresh_database_reaches_latest_version(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / 'fresh.db'))
+        applied = migrations.migrate(conn)
+        assert applied == [v for v, _, _ in migrations.MIGRATIONS]
+        assert migrations.current_version(conn) == migrations.LATEST_VERSION
+
+    def test_migrate_is_idempotent(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / 'twice.db'))
+        migrations.migrate(conn)
+        assert migrations.migrate(conn) == []
+
+    def test_search_triggers_match_the_module(self, tmp_path):
+        import search
+
+        conn = sqlite3.connect(str(tmp_path / 'triggers.db'))
+        migrations.migrate(conn, target=10)
+        # As a database migrated with a divergent copy of a trigger would have it
+        conn.execute("DROP TRIGGER trg_student_name_ai")
+        conn.execute("CREATE TRIGGER trg_student_name_ai AFTER INSERT ON students BEGIN SELECT 1; END")
+        conn.commit()
+        migrations.migrate(conn)
+        stored = dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"))
+        assert stored == {name: f"CREATE TRIGGER {name} {body.format(NOT_DEFERRED=search.NOT_DEFERRED)}"
+                          for name, body in search.TRIGGERS.items()}
+        conn.execute("INSERT INTO students (student_id, name) VALUES ('S1', 'Ann')")
+        assert search.search(conn, 'ann') == [('student', 'S1', 'Ann')]
+
+    def test_legacy_database_is_upgraded(self, tmp_path):
+        # Schema as created before number_of_equipment and the inventory table existed
+        conn = sqlite3.connect(str(tmp_path / 'legacy.db'))
+        conn.execute("CREATE TABLE students (student_id TEXT PRIMARY KEY, name TEXT NOT NULL, course TEXT, year_level INTEGER)")
+        conn.execute("""CREATE TABLE equipment_log (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id TEXT NOT NULL,
+                        equipment_name TEXT NOT NULL, action TEXT, timestamp TEXT DEFAULT CURRENT_TIMESTAMP)""")
+        conn.execute("INSERT INTO students VALUES ('S1', 'Ann', 'CS', 1)")
+        conn.commit()
+
+        migrations.migrate(conn)
+        assert migrations.column_exists(conn, 'students', 'number_of_equipment')
+        assert conn.execute("SELECT name FROM students").fetchone() == ('Ann',)
+        assert conn.execute("SELECT COUNT(*) FROM inventory").fetchone()[0] == 0
+
+    def test_failed_migration_rolls_back(self, tmp_path, monkeypatch):
+        def broken(conn):
+            conn.execute("CREATE TABLE half_done (x INTEGER)")
+            raise RuntimeError("boom")
+
+        conn = sqlite3.connect(str(tmp_path / 'broken.db'))
+        migrations.migrate(conn)
+        monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [(99, 'broken', broken)])
+        with pytest.raises(RuntimeError):
+            migrations.migrate(conn, target=99)
+        assert migrations.current_version(conn) == migrations.LATEST_VERSION
+        assert not conn.execute("SELECT name FROM sqlite_master WHERE name='half_done'").fetchall()
+
+    def test_route_queries_use_indexes(self, tmp_path):
+        from app import route_queries
+
+        conn = sqlite3.connect(str(tmp_path / 'plans.db'))
+        migrations.migrate(conn)
+        migrations.check_query_plans(conn, route_queries())
+
+    def test_plan_check_catches_full_scans(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / 'scan.db'))
+        migrations.migrate(conn)
+        with pytest.raises(AssertionError):
+            migrations.check_query_plans(conn, [('bad', "SELECT * FROM equipment_log WHERE action LIKE '%x'", ())])
+
+    def test_plan_check_catches_index_walks_and_sorted_pages(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / 'walk.db'))
+        migrations.migrate(conn)
+        # Reads every entry of idx_log_ts
+        walk = "SELECT id FROM equipment_log ORDER BY timestamp"
+        assert migrations.full_scans(conn, walk) == ['SCAN equipment_log USING COVERING INDEX idx_log_ts']
+        # ...but a page in index order stops after LIMIT rows
+        assert migrations.full_scans(conn, walk + " LIMIT 10") == []
+        unsorted_page = "SELECT id FROM equipment_log WHERE action = 'borrow' ORDER BY quantity LIMIT 10"
+        with pytest.raises(AssertionError, match='USE TEMP B-TREE FOR ORDER BY'):
+            migrations.check_query_plans(conn, [('page', unsorted_page, ())])
+        # Without LIMIT the sort is over the matching rows only, as the query asks
+        migrations.check_query_plans(conn, [('all', unsorted_page.replace(' LIMIT 10', ''), ())])
+
+
+@pytest.fixture
+def log_db(tmp_path):
+    """A migrated database with 37 log rows, many sharing a timestamp."""
+    conn = sqlite3.connect(str(tmp_path / 'logs.db'))
+    migrations.migrate(conn)
+    conn.executemany("INSERT INTO students (student_id, name) VALUES (?, ?)", [('S1', 'Ann'), ('S2', 'Bob')])
+    conn.executemany(
+        "INSERT INTO equipment_log (student_id, equipment_name, action, timestamp) VALUES (?, ?, ?, ?)",
+        [(f'S{i % 2 + 1}', f'Item {i % 5}', ('borrow', 'return')[i % 3 == 0],
+          f'2025-01-0{i % 4 + 1} 10:00:00') for i in range(37)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+class TestKeysetPagination:
+    """Test that keyset pages cover every row exactly once, in order."""
+
+    def walk(self, conn, filters, page_size):
+        from app import ADMIN_LOG_SORT_KEYS, admin_log_key, build_admin_log_query
+        from pagination import KeysetPage, decode_cursor
+
+        seen, token = [], None
+        while True:
+            after = decode_cursor(token, len(ADMIN_LOG_SORT_KEYS[filters['sort']]))
+            query, params = build_admin_log_query(filters, after, page_size + 1)
+            page = KeysetPage(conn.execute(query, params), page_size, admin_log_key(filters['sort'])).load()
+            assert len(page.rows) <= page_size
+            seen.extend(page.rows)
+            token = page.next_cursor
+            if token is None:
+                return seen
+
+    @pytest.mark.parametrize('sort', ['timestamp_desc', 'timestamp_asc', 'student_id', 'action'])
+    @pytest.mark.parametrize('action', ['', 'borrow'])
+    @pytest.mark.parametrize('student_id', ['', 'S1'])
+    def test_pages_match_unpaginated_order(self, log_db, sort, action, student_id):
+        from app import build_admin_log_query
+
+        filters = {'student_id': student_id, 'equipment': '', 'action': action, 'sort': sort}
+        query, params = build_admin_log_query(filters)
+        expected = log_db.execute(query, params).fetchall()
+        assert self.walk(log_db, filters, page_size=4) == expected
+
+    @pytest.mark.parametrize('sort', ['timestamp_desc', 'timestamp_asc', 'student_id', 'action'])
+    @pytest.mark.parametrize('student_id, action', [('S1', ''), ('', 'borrow'), ('S1', 'borrow')])
+    def test_filtered_pages_are_read_in_index_order(self, log_db, sort, student_id, action):
+        from app import ADMIN_LOG_SORT_KEYS, build_admin_log_query
+
+        filters = {'student_id': student_id, 'equipment': '', 'action': action, 'sort': sort}
+        cursor = ['S1' if c == 'e.student_id' else 'borrow' if c == 'e.action' else
+                  10 if c == 'e.id' else '2025-01-01 10:00:00' for c, _ in ADMIN_LOG_SORT_KEYS[sort]]
+        for after in (None, cursor):
+            query, params = build_admin_log_query(filters, after, 5)
+            plan = [row[-1] for row in log_db.execute("EXPLAIN QUERY PLAN " + query, params)]
+            assert not [line for line in plan if line.startswith('USE TEMP B-TREE')], plan
+            log_line = next(line for line in plan if line.startswith(('SCAN e ', 'SEARCH e ')))
+            assert log_line.startswith('SEARCH e USING INDEX'), plan
+            for column, value in (('student_id', student_id), ('action', action)):
+                assert (f'{column}=?' in log_line) == bool(value), plan
+
+    def test_bad_cursor_starts_from_first_page(self):
+        from pagination import decode_cursor, encode_cursor
+
+        assert decode_cursor('not-a-cursor!', 2) is None
+        assert decode_cursor(encode_cursor([1, 2, 3]), 2) is None
+        assert decode_cursor(encode_cursor(['2025-01-01', 7]), 2) == ['2025-01-01', 7]
+
+
+
+class TestInventoryCache:
+    """Test snapshot reuse, invalidation and cross-connection change detection."""
+
+    @pytest.fixture
+    def cache(self, pool):
+        from inventory_cache import InventoryCache
+
+        conn = pool.acquire()
+        migrations.migrate(conn)
+        conn.executemany("INSERT INTO inventory (name, quantity) VALUES (?, ?)", [('Funnel', 8), ('Beaker', 20)])
+        conn.commit()
+        pool.release(conn)
+        cache = InventoryCache(pool.connect)
+        yield cache
+        cache.close()
+
+    def test_repeated_reads_hit(self, cache):
+        assert [name for _, name, _ in cache.items()] == ['Beaker', 'Funnel']
+        assert cache.as_dict() == {'Beaker': 20, 'Funnel': 8}
+        stats = cache.stats()
+        assert stats['misses'] == 1 and stats['hits'] == 1
+
+    def test_invalidate_reloads(self, cache):
+        version = cache.snapshot().version
+        cache.invalidate()
+        assert cache.snapshot().version == version + 1
+
+    def test_commit_from_other_connection_is_seen(self, cache, pool):
+        cache.items()
+        other = sqlite3.connect(pool.path)
+        other.execute("UPDATE inventory SET quantity=3 WHERE name='Funnel'")
+        other.commit()
+        other.close()
+        assert cache.as_dict()['Funnel'] == 3
+        assert cache.stats()['external_changes'] == 1
+
+
+class TestBalances:
+    """Test the materialized equipment_balance table against a log replay."""
+
+    @pytest.fixture
+    def conn(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / 'balances.db'))
+        migrations.migrate(conn)
+        yield conn
+        conn.close()
+
+    def record(self, conn, student_id, action, items):
+        import balances
+
+        conn.executemany("INSERT INTO equipment_log (student_id, equipment_name, action, quantity) VALUES (?, ?, ?, ?)",
+                         [(student_id, name, action, qty) for name, qty in items])
+        balances.apply(conn, student_id, action, items)
+        conn.commit()
+
+    def test_apply_matches_replay(self, conn):
+        import balances
+
+        self.record(conn, 'S1', 'borrow', [('Beaker', 2), ('Funnel', 1)])
+        self.record(conn, 'S2', 'borrow', [('Beaker', 1)])
+        self.record(conn, 'S1', 'return', [('Beaker', 5), ('Funnel', 1)])  # over-return clamps at 0
+        self.record(conn, 'S1', 'borrow', [('Beaker', 1)])
+        assert balances.by_student(conn, 'S1') == [('Beaker', 1)]
+        assert balances.by_equipment(conn, 'Beaker') == [('S1', 1), ('S2', 1)]
+        assert balances.verify(conn) == []
+
+    def test_verify_and_rebuild_fix_drift(self, conn):
+        import balances
+
+        self.record(conn, 'S1', 'borrow', [('Beaker', 2)])
+        conn.execute("UPDATE equipment_balance SET outstanding=7")
+        conn.commit()
+        assert balances.verify(conn) == [('S1', 'Beaker', 7, 2)]
+        assert balances.rebuild(conn) == 1
+        assert balances.verify(conn) == []
+
+    def test_migration_seeds_from_existing_log(self, tmp_path):
+        import balances
+
+        conn = sqlite3.connect(str(tmp_path / 'seed.db'))
+        migrations.migrate(conn, target=4)
+        conn.execute("INSERT INTO equipment_log (student_id, equipment_name, action, quantity) VALUES ('S1', 'Beaker', 'borrow', 4)")
+        conn.commit()
+        migrations.migrate(conn)
+        assert balances.by_student(conn, 'S1') == [('Beaker', 4)]
+
+
+class TestRollups:
+    """Test incremental catch-up of the usage rollup tables."""
+
+    @pytest.fixture
+    def conn(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / 'rollups.db'))
+        migrations.migrate(conn)
+        conn.execute("INSERT INTO students (student_id, name, course) VALUES ('S1', 'Ann', 'CS')")
+        conn.commit()
+        yield conn
+        conn.close()
+
+    def log(self, conn, rows):
+        conn.executemany("INSERT INTO equipment_log (student_id, equipment_name, action, timestamp, quantity) "
+                         "VALUES (?, ?, ?, ?, ?)", rows)
+        conn.commit()
+
+    def test_catch_up_is_incremental(self, conn):
+        import rollups
+
+        self.log(conn, [('S1', 'Beaker', 'borrow', '2025-01-06 09:00:00', 2)])
+        assert rollups.run_catch_up(conn) == 1
+        self.log(conn, [('S1', 'Beaker', 'borrow', '2025-01-06 15:00:00', 1),
+                        ('S9', 'Beaker', 'return', '2025-01-08 10:00:00', 1)])
+        assert rollups.run_catch_up(conn) == 2
+        assert rollups.run_catch_up(conn) == 0
+
+        assert rollups.usage(conn, 'equipment') == [('2025-01-06', 'Beaker', 'borrow', 2, 3),
+                                                    ('2025-01-08', 'Beaker', 'return', 1, 1)]
+        assert rollups.usage(conn, 'course', 'week') == [('2025-01-06', 'CS', 'borrow', 2, 3),
+                                                         ('2025-01-06', 'Unknown', 'return', 1, 1)]
+
+    def test_undated_rows_do_not_block_catch_up(self, conn):
+        import rollups
+
+        self.log(conn, [('S1', 'Beaker', 'borrow', '01/02/2025', 1),
+                        ('S1', 'Beaker', 'borrow', '2025-01-06 09:00:00', 2)])
+        assert rollups.run_catch_up(conn) == 2
+        assert rollups.usage(conn, 'equipment') == [('2025-01-06', 'Beaker', 'borrow', 1, 2)]
+
+    def test_rebuild_matches_incremental(self, conn):
+        import rollups
+
+        self.log(conn, [('S1', 'Funnel', 'borrow', '2025-02-01 09:00:00', 1)])
+        rollups.run_catch_up(conn)
+        before = rollups.usage(conn, 'equipment')
+        rollups.rebuild(conn)
+        assert rollups.usage(conn, 'equipment') == before
+
+
+class TestNameSearch:
+    """Test the trigram name index and the triggers that maintain it."""
+
+    @pytest.fixture
+    def conn(self, tmp_path):
+        conn = sqlite3.connect(str(tmp_path / 'search.db'))
+        migrations.migrate(conn)
+        conn.executemany("INSERT INTO students (student_id, name) VALUES (?, ?)",
+                         [('S1', 'Ann Beakman'), ('S2', 'Bob')])
+        conn.executemany("INSERT INTO equipment_log (student_id, equipment_name, action) VALUES (?, ?, 'borrow')",
+                         [('S1', 'Beaker'), ('S1', 'Beaker'), ('S2', 'Glass Beaker'), ('S2', 'Funnel')])
+        conn.commit()
+        yield conn
+        conn.close()
+
+    def test_ranked_substring_and_prefix_matches(self, conn):
+        import search
+
+        assert search.search(conn, 'beak', 'equipment') == [('equipment', 'Beaker', 'Beaker'),
+                                                            ('equipment', 'Glass Beaker', 'Glass Beaker')]
+        assert search.search(conn, 'beak', 'student') == [('student', 'S1', 'Ann Beakman')]
+        assert search.search(conn, 'fu') == [('equipment', 'Funnel', 'Funnel')]  # below trigram length
+
+    def test_triggers_follow_log_and_students(self, conn):
+        import search
+
+        conn.execute("DELETE FROM equipment_log WHERE equipment_name='Funnel'")
+        conn.execute("UPDATE students SET name='Bob Funnelson' WHERE student_id='S2'")
+        conn.execute("INSERT INTO equipment_log (student_id, equipment_name, action) VALUES ('S1', 'Burette', 'borrow')")
+        conn.commit()
+        assert search.search(conn, 'funnel') == [('student', 'S2', 'Bob Funnelson')]
+        assert search.search(conn, 'buret') == [('equipment', 'Burette', 'Burette')]
+        # One Beaker row remains, so the name stays indexed
+        conn.execute("DELETE FROM equipment_log WHERE id=1")
+        conn.commit()
+        assert ('equipment', 'Beaker', 'Beaker') in search.search(conn, 'beaker')
+
+    def test_admin_filter_uses_index(self, conn):
+        import search
+        from app import build_admin_log_query
+
+        filters = {'student_id': '', 'equipment': 'eake', 'action': '', 'sort': 'timestamp_desc'}
+        query, params = build_admin_log_query(filters, equipment_names=search.matching_names(conn, 'eake', 'equipment'))
+        names = sorted(row[3] for row in conn.execute(query, params))
+        assert names == ['Beaker', 'Beaker', 'Glass Beaker']
+        assert migrations.full_scans(conn, query, params) == []
+
+    @pytest.mark.parametrize('sort', ['timestamp_desc', 'timestamp_asc', 'student_id', 'action'])
+    @pytest.mark.parametrize('action', ['', 'borrow'])
+    @pytest.mark.parametrize('student_id', ['', 'S1'])
+    def test_admin_filter_pages_need_no_sort(self, conn, sort, action, student_id):
+        from app import ADMIN_LOG_MERGE_NAMES, build_admin_log_query
+
+        # Statistics from a skewed log must not talk SQLite into sorting the matches
+        conn.executemany("INSERT INTO equipment_log (student_id, equipment_name, action) VALUES (?, ?, ?)",
+                         [('S1', 'Beaker' if i % 50 else 'Prism', ('borrow', 'return')[i % 2]) for i in range(2000)])
+        migrations.update_statistics(conn, full=True)
+        filters = {'student_id': student_id, 'equipment': 'r', 'action': action, 'sort': sort}
+        for names in (['Beaker', 'Prism'], [f'Item {i}' for i in range(ADMIN_LOG_MERGE_NAMES + 1)]):
+            query, params = build_admin_log_query(filters, None, 51, names)
+            plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+            assert not [line for line in plan if line.startswith('USE TEMP B-TREE')], plan
+        query, params = build_admin_log_query(filters, None, 51, ['Beaker', 'Prism'])
+        plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+        assert len([line for line in plan if line.startswith('SEARCH e USING INDEX')]) == 2, plan
+        rows = conn.execute(query, params).fetchall()
+        unmerged, unmerged_params = build_admin_log_query(dict(filters, equipment=''))
+        expected = [row for row in conn.execute(unmerged, unmerged_params) if row[3] in ('Beaker', 'Prism')][:51]
+        assert rows == expected
@@ -0,0 +1,97 @@
+"""
+Tests for the near-duplicate frame result cache.
+
+Running tests:
+    pytest test_frame_cache.py -v
+"""
+
+import cv2
+import numpy as np
+import pytest  # type: ignore
+
+from frame_cache import DetectionCache, distance, frame_hash
+
+
+def scene(item_at=None, seed=0):
+    """A textured bench, optionally with a dark 'item' drawn at (x, y)."""
+    rng = np.random.default_rng(seed)
+    frame = np.full((240, 320, 3), 180, dtype=np.uint8)
+    cv2.rectangle(frame, (20, 150), (300, 220), (90, 120, 150), -1)
+    frame = cv2.add(frame, rng.integers(0, 6, frame.shape, dtype=np.uint8))
+    if item_at is not None:
+        x, y = item_at
+        cv2.rectangle(frame, (x, y), (x + 60, y + 80), (20, 20, 20), -1)
+    return frame
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestFrameHash:
+    """Test that the hash tolerates noise but not a new item."""
+
+    def test_retake_is_close_and_new_item_is_far(self):
+        base = frame_hash(scene(seed=1))
+        retake = frame_hash(scene(seed=2))
+        jpeg = cv2.imdecode(cv2.imencode('.jpg', scene(seed=1), [cv2.IMWRITE_JPEG_QUALITY, 70])[1], cv2.IMREAD_COLOR)
+        limit = DetectionCache().max_distance
+        assert distance(base, retake) <= limit
+        assert distance(base, frame_hash(jpeg)) <= limit
+        assert distance(base, frame_hash(scene(item_at=(130, 40), seed=2))) > 2 * limit
+
+    def test_hash_has_hash_size_squared_bits(self):
+        assert frame_hash(scene(), hash_size=8).bit_length() <= 64
+
+
+class TestDetectionCache:
+    """Test lookup, scoping, TTL, LRU eviction and stats."""
+
+    def test_hit_for_near_duplicate_from_same_kiosk_only(self):
+        cache = DetectionCache()
+        cache.store('k1', cache.key(scene(seed=1)), 'result', seconds=0.2)
+        assert cache.lookup('k1', cache.key(scene(seed=2))) == 'result'
+        assert cache.lookup('k2', cache.key(scene(seed=2))) is None
+        assert cache.lookup('k1', cache.key(scene(item_at=(130, 40)))) is None
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses']) == (1, 2)
+        assert stats['saved_inference_seconds'] == pytest.approx(0.2)
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = DetectionCache(ttl=5, clock=clock)
+        cache.store('k', 1, 'old')
+        clock.now = 6
+        assert cache.lookup('k', 1) is None
+        assert cache.stats()['expired'] == 1
+        assert cache.stats()['entries'] == 0
+
+    def test_least_recently_used_is_evicted(self):
+        cache = DetectionCache(max_entries=2, min_similarity=1.0)
+        cache.store('k', 0b0001, 'a')
+        cache.store('k', 0b0110, 'b')
+        assert cache.lookup('k', 0b0001) == 'a'   # a is now the most recent
+        cache.store('k', 0b1000, 'c')
+        assert cache.lookup('k', 0b0110) is None
+        assert cache.lookup('k', 0b0001) == 'a'
+        assert cache.stats()['evictions'] == 1
+
+    def test_closest_entry_wins(self):
+        cache = DetectionCache(min_similarity=0.9)  # up to 25 of 256 bits
+        cache.store('k', (1 << 20) - 1, 'far')
+        cache.store('k', (1 << 6) - 1, 'near')
+        assert cache.lookup('k', (1 << 8) - 1) == 'near'
+
+    def test_disabled_cache_stores_nothing(self):
+        cache = DetectionCache(max_entries=0)
+        cache.store('k', 1, 'x')
+        assert not cache.enabled
+        assert cache.lookup('k', 1) is None
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
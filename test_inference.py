@@ -0,0 +1,166 @@
+"""
+Tests for the shared inference scheduler.
+
+Running tests:
+    pytest test_inference.py -v
+"""
+
+import threading
+import time
+
+import pytest  # type: ignore
+
+from inference import BatchScheduler, ModelLoader, ModelNotReady
+from backends import BackendError, InferenceBackend, export_path, load_backend
+
+
+class RecordingModel:
+    """Fake model that tags each frame and records the batch sizes it saw."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def __call__(self, frames):
+        self.batches.append(len(frames))
+        time.sleep(self.delay)
+        return [f"result-{frame}" for frame in frames]
+
+
+def submit_concurrently(scheduler, frames):
+    results = {}
+
+    def worker(frame):
+        results[frame] = scheduler.submit(frame, timeout=5)
+
+    threads = [threading.Thread(target=worker, args=(f,)) for f in frames]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+class TestBatchScheduler:
+    """Test that concurrent frames are batched and routed back correctly."""
+
+    def test_each_caller_gets_its_own_result(self):
+        model = RecordingModel(delay=0.01)
+        scheduler = BatchScheduler(model, max_batch_size=4, max_wait_ms=50)
+        try:
+            results = submit_concurrently(scheduler, list(range(10)))
+        finally:
+            scheduler.stop()
+
+        assert results == {i: f"result-{i}" for i in range(10)}
+        assert sum(model.batches) == 10
+        assert max(model.batches) <= 4
+
+    def test_concurrent_frames_share_a_batch(self):
+        model = RecordingModel()
+        scheduler = BatchScheduler(model, max_batch_size=8, max_wait_ms=200)
+        try:
+            submit_concurrently(scheduler, list(range(8)))
+        finally:
+            scheduler.stop()
+
+        assert len(model.batches) < 8, f"Frames should be batched. Batches: {model.batches}"
+
+    def test_model_error_is_raised_in_caller(self):
+        def broken(frames):
+            raise ValueError("boom")
+
+        scheduler = BatchScheduler(broken, max_batch_size=2, max_wait_ms=1)
+        try:
+            with pytest.raises(ValueError):
+                scheduler.submit("frame", timeout=5)
+            assert scheduler.stats()['errors'] == 1
+        finally:
+            scheduler.stop()
+
+    def test_stats_report_batches(self):
+        model = RecordingModel()
+        scheduler = BatchScheduler(model, max_batch_size=4, max_wait_ms=1)
+        try:
+            scheduler.submit("a", timeout=5)
+            scheduler.submit("b", timeout=5)
+            stats = scheduler.stats()
+        finally:
+            scheduler.stop()
+
+        assert stats['frames'] == 2
+        assert stats['batches'] == 2
+        assert stats['avg_batch_size'] == 1.0
+        assert stats['batch_size_histogram'] == {'1': 2}
+        assert stats['queue_depth'] == 0
+
+
+class TestModelLoader:
+    """Test background model loading and readiness reporting."""
+
+    def test_model_not_available_until_loaded(self):
+        release = threading.Event()
+
+        def factory():
+            release.wait(5)
+            return "model"
+
+        loader = ModelLoader(factory)
+        loader.start()
+        assert not loader.ready
+        with pytest.raises(ModelNotReady):
+            loader.model
+
+        release.set()
+        assert loader.wait(5)
+        assert loader.model == "model"
+        assert loader.status()['state'] == 'ready'
+
+    def test_warmup_runs_before_ready(self):
+        warmed = []
+        loader = ModelLoader(lambda: "model", warmup=warmed.append)
+        assert loader.wait(5)
+        assert warmed == ["model"]
+
+    def test_failed_load_is_reported(self):
+        def factory():
+            raise IOError("weights missing")
+
+        loader = ModelLoader(factory)
+        assert not loader.wait(5)
+        assert loader.status()['state'] == 'failed'
+        assert "weights missing" in loader.status()['error']
+        with pytest.raises(ModelNotReady):
+            loader.model
+
+
+class TestBackends:
+    """Test backend selection and export caching paths."""
+
+    def test_export_paths_sit_next_to_weights(self):
+        assert export_path('/m/after_dsmtf.pt', 'onnx', 640) == '/m/after_dsmtf.640.onnx'
+        assert export_path('/m/after_dsmtf.pt', 'onnx', 320, int8=True) == '/m/after_dsmtf.320.int8.onnx'
+        assert export_path('/m/after_dsmtf.pt', 'openvino', 416) == '/m/after_dsmtf.416_openvino_model'
+
+    def test_unknown_backend_is_rejected(self):
+        with pytest.raises(BackendError):
+            load_backend('weights.pt', backend='tensorrt')
+
+    def test_torch_int8_is_rejected(self):
+        with pytest.raises(BackendError):
+            load_backend('weights.pt', backend='torch', int8=True)
+
+    def test_backend_passes_input_size(self):
+        calls = []
+
+        class Model:
+            names = {0: 'beaker'}
+
+            def __call__(self, frames, **kwargs):
+                calls.append(kwargs)
+                return []
+
+        backend = InferenceBackend(Model(), 'onnx', 320)
+        backend(['frame'])
+        assert calls == [{'imgsz': 320, 'verbose': False}]
+        assert backend.names == {0: 'beaker'}
@@ -10,6 +10,13 @@ Running tests:
 import pytest  # type: ignore
 import sqlite3
 import os
+import base64
+import io
+import re
+import threading
+import time
+import numpy as np
+import cv2
 
 # Get the actual database path
 DB_PATH = os.path.join(os.path.dirname(__file__), 'database.db')
@@ -30,7 +37,14 @@ except ImportError:
     sys.modules['ultralytics'] = type(sys)('ultralytics')
     sys.modules['ultralytics'].YOLO = MockYOLO
 
+import app as app_module
 from app import app
+import frame_cache
+import profiler
+from admission import AdmissionGate
+from inference import ModelLoader
+from pipeline import DetectionOptions, Letterbox
+from tiling import CameraSettings, Cameras
 
 
 @pytest.fixture
@@ -54,6 +68,10 @@ def setup_test_students():
     
     try:
         c.execute("DELETE FROM equipment_log")
+        c.execute("DELETE FROM equipment_balance")
+        c.execute("DELETE FROM usage_daily_equipment")
+        c.execute("DELETE FROM usage_daily_course")
+        c.execute("UPDATE rollup_state SET last_log_id = 0")
         c.execute("DELETE FROM students")
         c.execute("DELETE FROM inventory")
         
@@ -350,5 +368,466 @@ class TestInputValidation:
         assert b"Quantity" in response.data or b"at least 1" in response.data
 
 
+class TestHealthEndpoints:
+    """Test the liveness and readiness endpoints polled by Electron."""
+
+    def test_healthz_is_always_ok(self, client):
+        response = client.get('/healthz')
+        assert response.status_code == 200
+        assert response.get_json()['status'] == 'ok'
+
+    def test_readyz_reports_database_and_model(self, client):
+        response = client.get('/readyz')
+        body = response.get_json()
+        assert body['database'] == 'ready'
+        assert 'state' in body['model']
+        assert response.status_code == (200 if body['ready'] else 503)
+
+
+class FakeBox:
+    def __init__(self, cls_id, conf=0.9):
+        self.cls = [cls_id]
+        self.conf = [conf]
+        self.xyxy = [[1.0, 2.0, 30.0, 40.0]]
+
+
+class FakeResult:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class FakeModel:
+    """Stands in for YOLO: detects one beaker and one unmapped class per frame."""
+    names = {0: 'beaker', 1: 'unknown_thing'}
+
+    def __init__(self):
+        self.frames = 0
+        self.calls = []
+
+    def __call__(self, frames, **kwargs):
+        self.frames += len(frames)
+        self.calls.append((frames[0].shape, kwargs))
+        classes = kwargs.get('classes')
+        boxes = [FakeBox(0), FakeBox(1, 0.4)]
+        return [FakeResult([b for b in boxes if classes is None or b.cls[0] in classes]) for _ in frames]
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    loader = ModelLoader(FakeModel)
+    assert loader.wait(5)
+    monkeypatch.setattr(app_module, 'model_loader', loader)
+    app_module.frame_cache.clear()
+    return loader
+
+
+class TestBinaryDetect:
+    """Test the binary /detect upload path."""
+
+    def test_jpeg_body_returns_json_detections(self, client, fake_model):
+        setup_test_students()
+        ok, jpeg = cv2.imencode('.jpg', np.zeros((240, 320, 3), dtype=np.uint8))
+        response = client.post('/detect', data=jpeg.tobytes(), content_type='image/jpeg')
+
+        assert response.status_code == 200
+        body = response.get_json()
+        assert body['equipment'] == ['Beaker']
+        # Classes that aren't inventory items are filtered out before NMS
+        assert [d['class'] for d in body['detections']] == ['beaker']
+
+    def test_raw_rgb_body(self, client, fake_model):
+        setup_test_students()
+        raw = np.zeros((24, 32, 3), dtype=np.uint8).tobytes()
+        response = client.post('/detect', data=raw, content_type='application/octet-stream',
+                               headers={'X-Frame-Width': '32', 'X-Frame-Height': '24'})
+        assert response.status_code == 200
+        assert response.get_json()['equipment'] == ['Beaker']
+
+    def test_raw_body_with_wrong_size_is_rejected(self, client, fake_model):
+        response = client.post('/detect', data=b'\x00' * 10, content_type='application/octet-stream',
+                               headers={'X-Frame-Width': '32', 'X-Frame-Height': '24'})
+        assert response.status_code == 400
+
+    def test_model_not_ready_returns_503(self, client, monkeypatch):
+        monkeypatch.setattr(app_module, 'model_loader', ModelLoader(lambda: None))
+        monkeypatch.setattr(app_module.model_loader, 'start', lambda: None)
+        response = client.post('/detect', data=b'abc', content_type='image/jpeg')
+        assert response.status_code == 503
+        assert 'Retry-After' in response.headers
+
+
+class TestDetectionPipeline:
+    """Test letterboxing, the class filter and the model options."""
+
+    def test_model_gets_letterboxed_frame_and_inventory_classes(self, client, fake_model, monkeypatch):
+        setup_test_students()
+        monkeypatch.setattr(app_module, 'letterbox', Letterbox(640))
+        monkeypatch.setattr(app_module, 'detection_options', DetectionOptions(conf=0.5, iou=0.6, max_det=10))
+        ok, jpeg = cv2.imencode('.jpg', np.zeros((240, 320, 3), dtype=np.uint8))
+        body = client.post('/detect', data=jpeg.tobytes(), content_type='image/jpeg').get_json()
+
+        shape, kwargs = fake_model.model.calls[-1]
+        assert shape == (640, 640, 3)
+        assert kwargs == {'conf': 0.5, 'iou': 0.6, 'max_det': 10, 'classes': [0]}
+        # (1, 2, 30, 40) on the canvas: scale 2, padded 80px top and bottom
+        assert body['detections'][0]['box'] == [0.5, 0.0, 15.0, 0.0]
+
+        stats = client.get('/metrics').get_data(as_text=True)
+        for stage in ('letterbox', 'inference', 'rescale'):
+            assert f'labcv_detection_stage_seconds_count{{stage="{stage}"}}' in stats
+
+    def test_class_filter_can_be_switched_off(self, client, fake_model, monkeypatch):
+        setup_test_students()
+        monkeypatch.setattr(app_module, 'letterbox', None)
+        monkeypatch.setattr(app_module, 'detection_options', DetectionOptions(filter_classes=False))
+        ok, jpeg = cv2.imencode('.jpg', np.zeros((24, 32, 3), dtype=np.uint8))
+        body = client.post('/detect', data=jpeg.tobytes(), content_type='image/jpeg').get_json()
+
+        shape, kwargs = fake_model.model.calls[-1]
+        assert shape == (24, 32, 3)
+        assert 'classes' not in kwargs
+        assert [d['class'] for d in body['detections']] == ['beaker', 'unknown_thing']
+        assert body['detections'][1]['equipment'] is None
+
+
+class TestTiledDetection:
+    """Test that configured cameras are run tile by tile."""
+
+    def test_camera_frames_are_tiled_and_merged(self, client, fake_model, monkeypatch):
+        setup_test_students()
+        settings = CameraSettings(tile=640, overlap=0.25)
+        monkeypatch.setattr(app_module, 'cameras', Cameras({'bench-4k': settings}))
+        ok, jpeg = cv2.imencode('.jpg', np.zeros((720, 1280, 3), dtype=np.uint8))
+
+        response = client.post('/detect', data=jpeg.tobytes(), content_type='image/jpeg',
+                               headers={'X-Kiosk-Id': 'bench-4k'})
+        assert response.status_code == 200
+        assert response.get_json()['equipment'] == ['Beaker']
+        assert fake_model.model.frames == len(settings.windows(1280, 720)) == 3 * 2 + 1
+
+        # Other cameras still send the whole frame
+        client.post('/detect', data=jpeg.tobytes(), content_type='image/jpeg', headers={'X-Kiosk-Id': 'kiosk-1'})
+        assert fake_model.model.frames == 8
+        assert 'labcv_detection_stage_seconds_count{stage="merge"}' in client.get('/metrics').get_data(as_text=True)
+
+    def test_tiled_camera_retake_with_small_new_item_is_not_cached(self, client, fake_model, monkeypatch):
+        setup_test_students()
+        settings = CameraSettings(tile=1920, overlap=0.1, full_frame=False)
+        monkeypatch.setattr(app_module, 'cameras', Cameras({'bench-4k': settings}))
+        rng = np.random.default_rng(1)
+        frame = np.zeros((2160, 3840, 3), dtype=np.uint8)
+        for _ in range(40):   # a cluttered bench
+            x, y, w, h = (int(v) for v in (*rng.integers(0, [3600, 1900]), *rng.integers(150, 700, 2)))
+            cv2.rectangle(frame, (x, y), (x + w, y + h), [int(v) for v in rng.integers(0, 255, 3)], -1)
+        retake = frame.copy()
+        cv2.rectangle(retake, (1800, 1000), (1920, 1120), (255, 255, 255), -1)   # a 120px item
+        # Scaled to the cache's hash, the new item reads as the same scene
+        assert frame_cache.distance(app_module.frame_cache.key(frame), app_module.frame_cache.key(retake)) <= \
+            app_module.frame_cache.max_distance
+
+        for image in (frame, retake):
+            ok, jpeg = cv2.imencode('.jpg', image)
+            client.post('/detect', data=jpeg.tobytes(), content_type='image/jpeg', headers={'X-Kiosk-Id': 'bench-4k'})
+        assert fake_model.model.frames == 2 * len(settings.windows(3840, 2160))
+
+
+class TestFrameCacheRoutes:
+    """Test that near-duplicate captures skip the model."""
+
+    def test_repeat_capture_from_same_kiosk_is_cached(self, client, fake_model):
+        setup_test_students()
+        rng = np.random.default_rng(0)
+        frame = rng.integers(0, 255, (120, 160, 3), dtype=np.uint8)
+        ok, jpeg = cv2.imencode('.jpg', frame)
+        ok, retake = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        hits = app_module.frame_cache.stats()['hits']
+
+        first = client.post('/detect', data=jpeg.tobytes(), content_type='image/jpeg', headers={'X-Kiosk-Id': 'k1'})
+        second = client.post('/detect', data=retake.tobytes(), content_type='image/jpeg', headers={'X-Kiosk-Id': 'k1'})
+        assert first.get_json() == second.get_json()
+        assert fake_model.model.frames == 1
+        assert app_module.frame_cache.stats()['hits'] == hits + 1
+
+        client.post('/detect', data=jpeg.tobytes(), content_type='image/jpeg', headers={'X-Kiosk-Id': 'k2'})
+        assert fake_model.model.frames == 2
+        assert 'labcv_frame_cache_lookups_total{result="hit"}' in client.get('/metrics').get_data(as_text=True)
+
+
+class TestDetectAdmission:
+    """Test that saturated detection answers 429/503 and pages stay up."""
+
+    def test_saturated_detect_is_rejected_with_retry_after(self, client, fake_model, monkeypatch):
+        setup_test_students()
+        gate = AdmissionGate(concurrency=1, queue=0, queue_timeout=1)
+        monkeypatch.setattr(app_module, 'detect_gate', gate)
+        release = threading.Event()
+        holding = threading.Event()
+
+        def hold():
+            holding.set()
+            release.wait(5)
+
+        worker = threading.Thread(target=gate.run, args=(hold,))
+        worker.start()
+        assert holding.wait(5)
+        try:
+            ok, jpeg = cv2.imencode('.jpg', np.zeros((24, 32, 3), dtype=np.uint8))
+            response = client.post('/detect', data=jpeg.tobytes(), content_type='image/jpeg')
+            assert response.status_code == 429
+            assert int(response.headers['Retry-After']) >= 1
+            assert 'error' in response.get_json()
+
+            response = client.post('/process_capture', data={'image_data': 'data:image/jpeg;base64,' +
+                                                             base64.b64encode(jpeg.tobytes()).decode()})
+            assert response.status_code == 302
+            assert fake_model.model.frames == 0
+
+            assert client.get('/').status_code == 200
+            assert gate.stats()['rejected'] == 2
+        finally:
+            release.set()
+            worker.join(5)
+
+        response = client.post('/detect', data=jpeg.tobytes(), content_type='image/jpeg')
+        assert response.status_code == 200
+        text = client.get('/metrics').get_data(as_text=True)
+        assert 'labcv_detect_admissions_total{outcome="rejected"} 2' in text
+
+
+class TestMetricsEndpoint:
+    """Test /metrics and the runtime profiler toggle."""
+
+    def test_route_latency_stages_and_queries_are_exported(self, client, fake_model):
+        setup_test_students()
+        ok, jpeg = cv2.imencode('.jpg', np.zeros((24, 32, 3), dtype=np.uint8))
+        client.post('/detect', data=jpeg.tobytes(), content_type='image/jpeg')
+        client.get('/history')
+
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        text = response.get_data(as_text=True)
+        assert re.search(r'labcv_http_request_duration_seconds_count\{method="POST",route="/detect",status="200"\} \d+', text)
+        for stage in ('decode_body', 'inference', 'postprocess'):
+            assert f'labcv_detection_stage_seconds_count{{stage="{stage}"}}' in text
+        assert 'labcv_template_render_seconds_count{template="history.html"}' in text
+        queries = re.search(r'labcv_request_db_queries_sum\{route="/history"\} (\S+)', text)
+        assert queries and float(queries.group(1)) > 0
+        assert 'labcv_inference_batch_size_bucket{le="+Inf"}' in text
+        assert 'labcv_model_ready' in text
+
+    def test_profiler_toggle(self, client):
+        response = client.post('/debug/profiler', json={'action': 'start', 'interval_ms': 1})
+        try:
+            assert response.get_json()['running'] is True
+            client.get('/healthz')
+            time.sleep(0.05)
+        finally:
+            response = client.post('/debug/profiler', data={'action': 'stop'})
+        body = response.get_json()
+        assert body['running'] is False
+        assert body['samples'] > 0
+        collapsed = client.get('/debug/profiler?format=collapsed')
+        assert collapsed.mimetype == 'text/plain'
+        assert client.post('/debug/profiler', data={'action': 'reset'}).get_json()['samples'] == 0
+        assert client.post('/debug/profiler', data={'action': 'bogus'}).status_code == 400
+
+    def test_profiler_is_local_only_with_a_minimum_interval(self, client):
+        lan = {'REMOTE_ADDR': '192.168.1.20'}
+        assert client.post('/debug/profiler', json={'action': 'start'}, environ_base=lan).status_code == 403
+        assert client.get('/debug/profiler', environ_base=lan).status_code == 403
+        assert not app_module.profiler.running
+
+        response = client.post('/debug/profiler', json={'action': 'start', 'interval_ms': 0.01})
+        try:
+            assert response.get_json()['interval_ms'] == 1000.0 * profiler.MIN_INTERVAL
+        finally:
+            client.post('/debug/profiler', data={'action': 'stop'})
+
+
+class TestLogPagination:
+    """Test keyset pagination and streamed rendering of the log pages."""
+
+    def seed_logs(self, count):
+        setup_test_students()
+        conn = get_db()
+        conn.executemany("INSERT INTO equipment_log (student_id, equipment_name, action, timestamp) VALUES (?, ?, ?, ?)",
+                         [("TEST001", f"Item {i:02d}", "borrow", f"2025-01-01 10:00:{i:02d}") for i in range(count)])
+        conn.commit()
+        conn.close()
+
+    def test_history_pages_follow_next_link(self, client):
+        self.seed_logs(5)
+        first = client.get('/history?per_page=3').get_data(as_text=True)
+        assert 'Item 04' in first and 'Item 02' in first and 'Item 01' not in first
+        token = re.search(r'after=([^&"]+)', first).group(1)
+        second = client.get(f'/history?per_page=3&after={token}').get_data(as_text=True)
+        assert 'Item 01' in second and 'Item 00' in second and 'Item 02' not in second
+        assert 'Next page' not in second
+
+    def test_admin_logs_streamed_matches_buffered(self, client):
+        self.seed_logs(4)
+        buffered = client.get('/admin/logs?per_page=2')
+        streamed = client.get('/admin/logs?per_page=2&stream=1')
+        assert streamed.status_code == 200
+        for name in ('Item 03', 'Item 02'):
+            assert name in buffered.get_data(as_text=True)
+            assert name in streamed.get_data(as_text=True)
+        assert 'Next page' in streamed.get_data(as_text=True)
+
+    def test_admin_logs_offers_student_and_equipment_choices(self, client):
+        self.seed_logs(1)
+        page = client.get('/admin/logs').get_data(as_text=True)
+        students = re.search(r'<datalist id="student-choices">(.*?)</datalist>', page, re.S).group(1)
+        equipment = re.search(r'<datalist id="equipment-choices">(.*?)</datalist>', page, re.S).group(1)
+        assert re.findall(r'value="([^"]+)"', students) == ['TEST001', 'TEST002']
+        assert re.findall(r'value="([^"]+)"', equipment) == ['Beaker', 'Erlenmeyer Flask', 'Funnel',
+                                                               'Graduated Cylinder']
+
+
+class TestInventoryCacheRoutes:
+    """Test that inventory edits are visible immediately through the cache."""
+
+    def test_inventory_route_invalidates_cache(self, client):
+        setup_test_students()
+        assert 'Funnel' in app_module.get_inventory_dict()
+        conn = get_db()
+        item_id = conn.execute("SELECT id FROM inventory WHERE name='Funnel'").fetchone()[0]
+        conn.close()
+        invalidations = app_module.inventory_cache.stats()['invalidations']
+        client.post('/inventory', data={'action': 'delete', 'item_id': item_id})
+        assert app_module.inventory_cache.stats()['invalidations'] == invalidations + 1
+        assert 'Funnel' not in app_module.get_inventory_dict()
+
+
+class TestBatchedTransaction:
+    """Test the set-based, single-transaction borrow/return write."""
+
+    def test_quantity_is_stored_on_one_row(self, client):
+        setup_test_students()
+        client.post('/borrow_return', data={'student_id': 'TEST001', 'action': 'borrow',
+                                            'equipment_names': ['Beaker'], 'quantities': ['3']})
+        conn = get_db()
+        rows = conn.execute("SELECT equipment_name, quantity FROM equipment_log WHERE student_id='TEST001'").fetchall()
+        count = conn.execute("SELECT number_of_equipment FROM students WHERE student_id='TEST001'").fetchone()[0]
+        conn.close()
+        assert rows == [('Beaker', 3)]
+        assert count == 3
+
+    def test_unknown_item_rolls_back_whole_cart(self, client):
+        setup_test_students()
+        client.post('/borrow_return', data={'student_id': 'TEST001', 'action': 'borrow',
+                                            'equipment_names': ['Beaker', 'Microscope'], 'quantities': ['1', '1']})
+        conn = get_db()
+        logged = conn.execute("SELECT COUNT(*) FROM equipment_log").fetchone()[0]
+        count = conn.execute("SELECT number_of_equipment FROM students WHERE student_id='TEST001'").fetchone()[0]
+        conn.close()
+        assert logged == 0
+        assert count == 0
+
+
+class TestBalanceEndpoints:
+    """Test the outstanding-balance lookups after borrow and return."""
+
+    def post_cart(self, client, action, items):
+        client.post('/borrow_return', data={'student_id': 'TEST001', 'action': action,
+                                            'equipment_names': [n for n, _ in items],
+                                            'quantities': [str(q) for _, q in items]})
+
+    def test_balances_follow_transactions(self, client):
+        setup_test_students()
+        self.post_cart(client, 'borrow', [('Beaker', 3), ('Funnel', 1)])
+        self.post_cart(client, 'return', [('Beaker', 1), ('Funnel', 1)])
+
+        student = client.get('/balances/student/TEST001').get_json()
+        assert student['items'] == [{'equipment': 'Beaker', 'outstanding': 2}]
+        assert student['total'] == 2
+
+        beaker = client.get('/balances/equipment/Beaker').get_json()
+        assert beaker['holders'] == [{'student_id': 'TEST001', 'outstanding': 2}]
+        assert client.get('/balances/equipment/Funnel').get_json()['holders'] == []
+
+
+class TestAnalyticsEndpoint:
+    """Test the rollup-backed usage analytics."""
+
+    def test_usage_reflects_transactions(self, client):
+        setup_test_students()
+        client.post('/borrow_return', data={'student_id': 'TEST001', 'action': 'borrow',
+                                            'equipment_names': ['Beaker', 'Funnel'], 'quantities': ['2', '1']})
+        data = client.get('/analytics/usage?by=equipment&action=borrow').get_json()
+        totals = {row['equipment']: (row['entries'], row['quantity']) for row in data['rows']}
+        assert totals == {'Beaker': (1, 2), 'Funnel': (1, 1)}
+
+        weekly = client.get('/analytics/usage?by=course&period=week').get_json()
+        assert [(row['course'], row['action'], row['quantity']) for row in weekly['rows']] == [('CS101', 'borrow', 3)]
+
+    def test_reading_usage_does_not_write(self, client):
+        setup_test_students()
+        conn = get_db()
+        conn.execute("INSERT INTO equipment_log (student_id, equipment_name, action) VALUES ('TEST001', 'Beaker', 'borrow')")
+        conn.commit()
+        conn.close()
+        data = client.get('/analytics/usage').get_json()
+        assert data['rows'] == [] and data['last_log_id'] == 0
+
+    def test_rejects_unknown_dimension(self, client):
+        assert client.get('/analytics/usage?by=colour').status_code == 400
+
+    def test_undated_log_row_does_not_block_borrowing(self, client):
+        setup_test_students()
+        conn = get_db()
+        conn.execute("INSERT INTO equipment_log (student_id, equipment_name, action, timestamp) "
+                     "VALUES ('TEST001', 'Beaker', 'borrow', '01/02/2025')")
+        conn.commit()
+        conn.close()
+        response = client.post('/borrow_return', data={'student_id': 'TEST001', 'action': 'borrow',
+                                                       'equipment_names': ['Funnel'], 'quantities': ['1']})
+        assert response.status_code in (200, 302)
+        conn = get_db()
+        assert conn.execute("SELECT COUNT(*) FROM equipment_log WHERE equipment_name='Funnel'").fetchone() == (1,)
+        conn.close()
+
+
+class TestBulkEndpoints:
+    """Test the import/export endpoints and single registration."""
+
+    def test_register_inserts_student(self, client):
+        setup_test_students()
+        client.post('/register', data={'student_id': 'TEST003', 'name': 'New', 'course': 'CS', 'year_level': '1'})
+        conn = get_db()
+        row = conn.execute("SELECT name, number_of_equipment FROM students WHERE student_id='TEST003'").fetchone()
+        conn.close()
+        assert row == ('New', 0)
+
+    def test_import_then_export(self, client):
+        setup_test_students()
+        upload = io.BytesIO(b"student_id,name,course,year_level\nTEST010,Bulk One,CS,1\nTEST011,,CS,1\n")
+        report = client.post('/import/students', data={'file': (upload, 'students.csv')},
+                             content_type='multipart/form-data').get_json()
+        assert report['written'] == 1 and report['error_count'] == 1
+
+        raw = client.post('/import/inventory?format=jsonl', data=b'{"name": "Pipette", "quantity": 4}\n')
+        assert raw.get_json()['written'] == 1
+
+        exported = client.get('/export/students?format=csv')
+        assert exported.mimetype == 'text/csv'
+        assert 'TEST010,Bulk One' in exported.get_data(as_text=True)
+        assert client.get('/export/grades').status_code == 400
+
+
+class TestStreamLimits:
+    """Test that live streams can't take every server thread."""
+
+    def test_stream_clients_stay_below_thread_count(self, monkeypatch):
+        monkeypatch.setattr(app_module.stream_hub, 'max_clients', 16)
+        assert app_module.limit_stream_clients(8) == 8 - app_module.STREAM_THREAD_RESERVE
+        assert app_module.limit_stream_clients(64) == 8 - app_module.STREAM_THREAD_RESERVE
+        assert app_module.limit_stream_clients(1) == 1
+
+    def test_stream_paths_are_pinned(self):
+        assert '/stream/abc/events'.startswith(app_module.PINNED_PATHS)
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
@@ -0,0 +1,22 @@
+"""
+Tests for the borrow/return load test.
+
+Running tests:
+    pytest test_load_test.py -v
+"""
+
+import pytest  # type: ignore
+
+import load_test
+
+
+class TestLoadTest:
+    """Test that the load test records carts of every size without errors."""
+
+    def test_small_run(self, tmp_path):
+        results = load_test.run([1, 50], seconds=0.2, kiosks=2, path=str(tmp_path / 'load.db'))
+        assert [r['cart_size'] for r in results] == [1, 50]
+        for r in results:
+            assert r['transactions'] > 0
+            assert r['errors'] == 0
+            assert r['items_per_s'] == pytest.approx(r['tx_per_s'] * r['cart_size'])
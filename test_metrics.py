@@ -0,0 +1,98 @@
+"""
+Tests for the Prometheus exporter and the sampling profiler.
+
+Running tests:
+    pytest test_metrics.py -v
+"""
+
+import threading
+import time
+
+import pytest  # type: ignore
+
+import metrics
+from profiler import SamplingProfiler
+
+
+class TestHistogram:
+    """Test bucketing and the text format."""
+
+    def test_buckets_are_cumulative_and_inclusive(self):
+        h = metrics.Histogram('t_seconds', "Test.", labels=('stage',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            h.observe(value, stage='a')
+        lines = h.collect()
+        assert 't_seconds_bucket{stage="a",le="0.1"} 2' in lines
+        assert 't_seconds_bucket{stage="a",le="1.0"} 3' in lines
+        assert 't_seconds_bucket{stage="a",le="+Inf"} 4' in lines
+        assert 't_seconds_count{stage="a"} 4' in lines
+        assert lines[1] == '# TYPE t_seconds histogram'
+
+    def test_time_context_manager(self):
+        h = metrics.Histogram('t', "Test.", labels=('stage',))
+        with h.time(stage='x'):
+            time.sleep(0.002)
+        counts, total, count = h.snapshot()[('x',)]
+        assert count == 1 and total >= 0.002
+
+    def test_label_values_are_escaped(self):
+        assert metrics.format_labels([('route', 'a"b\\c')]) == '{route="a\\"b\\\\c"}'
+
+    def test_registry_renders_histograms_and_collectors(self):
+        registry = metrics.Registry()
+        registry.histogram('a_seconds', "A.").observe(0.01)
+        registry.collector(lambda: metrics.family('b_total', 'counter', "B.", [({'kind': 'x'}, 3)]))
+        text = registry.render()
+        assert 'a_seconds_count 1' in text
+        assert 'b_total{kind="x"} 3' in text
+        assert text.endswith('\n')
+
+    def test_histogram_family_from_counts(self):
+        lines = metrics.histogram_family('batch', "Sizes.", [(2, 1), (1, 3)], 5)
+        assert 'batch_bucket{le="1.0"} 3' in lines
+        assert 'batch_bucket{le="2.0"} 4' in lines
+        assert 'batch_count 4' in lines
+
+
+class TestSamplingProfiler:
+    """Test sampling, reports and start/stop."""
+
+    def test_sample_records_busy_thread(self):
+        started = threading.Event()
+        stop = []
+
+        def spin_here():
+            started.set()
+            while not stop:
+                pass
+
+        worker = threading.Thread(target=spin_here, name='spinner')
+        worker.start()
+        started.wait()
+        try:
+            profiler = SamplingProfiler()
+            for _ in range(5):
+                profiler.sample()
+        finally:
+            stop.append(True)
+            worker.join()
+        assert profiler.status()['samples'] == 5
+        assert any(line.startswith('spinner;') and 'spin_here' in line
+                   for line in profiler.collapsed().splitlines())
+        assert any('spin_here' in entry['function'] for entry in profiler.top())
+
+    def test_start_stop_reset(self):
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        time.sleep(0.05)
+        profiler.stop()
+        status = profiler.status()
+        assert not status['running']
+        assert status['samples'] > 0
+        profiler.reset()
+        assert profiler.status()['samples'] == 0
+        assert profiler.collapsed() == ''
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,68 @@
+"""
+Tests for the detection pre/postprocessing helpers.
+
+Running tests:
+    pytest test_pipeline.py -v
+"""
+
+import threading
+
+import numpy as np
+import pytest  # type: ignore
+
+from pipeline import PAD_VALUE, DetectionOptions, Letterbox, class_filter
+
+
+class TestLetterbox:
+    """Test scaling, padding, buffer reuse and mapping boxes back."""
+
+    def test_wide_frame_is_scaled_and_padded_top_and_bottom(self):
+        frame = np.full((240, 320, 3), 200, dtype=np.uint8)
+        canvas, transform = Letterbox(640)(frame)
+        assert canvas.shape == (640, 640, 3)
+        assert transform == (2.0, 0, 80, 320, 240)
+        assert (canvas[:80] == PAD_VALUE).all() and (canvas[560:] == PAD_VALUE).all()
+        assert (canvas[80:560] == 200).all()
+
+    def test_buffer_is_reused_per_shape_and_per_thread(self):
+        letterbox = Letterbox(64)
+        first, _ = letterbox(np.zeros((32, 64, 3), dtype=np.uint8))
+        second, _ = letterbox(np.full((32, 64, 3), 9, dtype=np.uint8))
+        assert second is first
+        assert (second[16:48] == 9).all() and (second[:16] == PAD_VALUE).all()
+
+        other = {}
+        thread = threading.Thread(target=lambda: other.setdefault('canvas', letterbox(
+            np.zeros((32, 64, 3), dtype=np.uint8))[0]))
+        thread.start()
+        thread.join()
+        assert other['canvas'] is not first
+
+        tall, transform = letterbox(np.zeros((128, 32, 3), dtype=np.uint8))
+        assert tall is not first
+        assert transform == (0.5, 24, 0, 32, 128)
+
+    def test_unmap_inverts_the_transform_and_clips(self):
+        _, transform = Letterbox(640)(np.zeros((240, 320, 3), dtype=np.uint8))
+        assert Letterbox.unmap((100.0, 180.0, 300.0, 380.0), transform) == (50.0, 50.0, 150.0, 150.0)
+        assert Letterbox.unmap((-10.0, 0.0, 700.0, 640.0), transform) == (0.0, 0.0, 320.0, 240.0)
+
+
+class TestDetectionOptions:
+    """Test the model keyword arguments and the class filter."""
+
+    def test_class_filter_keeps_inventory_classes(self):
+        names = {0: 'beaker', 1: 'funnel', 2: 'person', 3: 'tripod'}
+        mapping = {'beaker': 'Beaker', 'funnel': 'Funnel', 'tripod': 'Tripod'}
+        assert class_filter(names, mapping, {'Beaker': 3, 'Tripod': 1}) == [0, 3]
+        assert class_filter(names, mapping, {}) == []
+
+    def test_kwargs(self):
+        options = DetectionOptions(conf=0.4, iou=0.5, max_det=20)
+        assert options.kwargs([1]) == {'conf': 0.4, 'iou': 0.5, 'max_det': 20, 'classes': [1]}
+        assert 'classes' not in options.kwargs(None)
+        assert 'classes' not in DetectionOptions(filter_classes=False).kwargs([1])
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
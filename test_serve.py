@@ -0,0 +1,276 @@
+"""
+Tests for the production server (gunicorn, or waitress without fork).
+
+Running tests:
+    pytest test_serve.py -v
+"""
+
+import http.client
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest  # type: ignore
+
+import serve
+
+
+def pid_app(environ, start_response):
+    """Answers with the pid of the worker that handled the request."""
+    if environ['PATH_INFO'] == '/slow':
+        time.sleep(0.2)
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid()).encode()]
+
+
+# Frames posted to this process, as a stream hub would keep them
+_frames = []
+_frames_changed = threading.Condition()
+
+
+def stream_app(environ, start_response):
+    """pid_app plus a process-local frame stream under /stream/."""
+    path = environ['PATH_INFO']
+    if path == '/stream/frame':
+        body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0)).decode()
+        with _frames_changed:
+            _frames.append(body)
+            _frames_changed.notify_all()
+        start_response('202 Accepted', [('Content-Type', 'text/plain')])
+        return [environ['REMOTE_ADDR'].encode()]
+    if path == '/stream/events':
+        def events():
+            yield f"data: {os.getpid()}\n\n".encode()
+            seen = 0
+            while True:
+                with _frames_changed:
+                    _frames_changed.wait_for(lambda: len(_frames) > seen, 1.0)
+                    new = _frames[seen:]
+                seen += len(new)
+                yield b''.join(f"data: {frame}\n\n".encode() for frame in new) or b": keepalive\n\n"
+        start_response('200 OK', [('Content-Type', 'text/event-stream')])
+        return events()
+    return pid_app(environ, start_response)
+
+
+def run_master(app_name='pid_app', pinned=()):
+    """Entry point for the subprocess in TestGunicorn."""
+    config = serve.server_config()
+    config.update(port=0, workers=2, threads=4, graceful_timeout=5, pinned=pinned)
+    raise SystemExit(serve.run(globals()[app_name], config, ready=lambda port: print(f"PORT {port}", flush=True)))
+
+
+def start_master(code):
+    master = subprocess.Popen([sys.executable, '-c', 'import test_serve; ' + code],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.PIPE, text=True)
+    for line in master.stdout:
+        if line.startswith('PORT '):
+            return master, int(line.split()[1])
+    return master, None
+
+
+def stop_master(master):
+    if master.poll() is None:
+        master.kill()
+        master.wait()
+    master.stdout.close()
+
+
+def get(port, path='/'):
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=10) as response:
+        return response.read().decode()
+
+
+def post(port, path, body):
+    request = urllib.request.Request(f'http://127.0.0.1:{port}{path}', data=body.encode(), method='POST')
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status, response.read().decode()
+
+
+def read_events(response, count):
+    events = []
+    while len(events) < count:
+        line = response.readline().decode()
+        assert line, "event stream ended"
+        if line.startswith('data: '):
+            events.append(line[6:].strip())
+    return events
+
+
+def open_events(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', '/stream/events')
+    response = conn.getresponse()
+    assert response.status == 200
+    return conn, response
+
+
+@pytest.fixture
+def waitress_port():
+    """stream_app on the waitress server production mode uses on Windows."""
+    config = serve.server_config()
+    config.update(port=0, threads=1)
+    server = serve.waitress_server(stream_app, config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    yield server.effective_port
+    server.close()
+    server.task_dispatcher.shutdown()
+
+
+class TestWaitress:
+    """Test the single-process server used where os.fork is missing (Windows)."""
+
+    def test_idle_keepalive_connections_hold_no_thread(self, waitress_port):
+        idle = []
+        for _ in range(3):
+            conn = http.client.HTTPConnection('127.0.0.1', waitress_port, timeout=10)
+            conn.request('GET', '/')
+            assert conn.getresponse().read() == str(os.getpid()).encode()
+            idle.append(conn)   # kept open
+        started = time.monotonic()
+        assert get(waitress_port) == str(os.getpid())
+        assert time.monotonic() - started < 1.0
+        for conn in idle:
+            conn.close()
+
+    def test_stream_events_and_frames_meet(self, waitress_port):
+        config = serve.server_config()
+        config.update(port=0, threads=4)
+        server = serve.waitress_server(stream_app, config)
+        threading.Thread(target=server.run, daemon=True).start()
+        try:
+            conn, response = open_events(server.effective_port)
+            read_events(response, 1)
+            seen = len(_frames)
+            for i in range(5):
+                assert post(server.effective_port, '/stream/frame', f'w-{i}') == (202, '127.0.0.1')
+            events = read_events(response, seen + 5)
+            assert events[-5:] == [f'w-{i}' for i in range(5)]
+            conn.close()
+        finally:
+            server.close()
+            server.task_dispatcher.shutdown()
+
+    def test_run_without_fork_uses_waitress(self, monkeypatch):
+        servers, calls, ports = [], [], []
+        real = serve.waitress_server
+        monkeypatch.setattr(serve, 'forks', lambda: False)
+        monkeypatch.setattr(serve, 'waitress_server', lambda app, config: servers.append(real(app, config)) or servers[-1])
+        config = serve.server_config()
+        config.update(port=0, threads=2, workers=4)
+        thread = threading.Thread(target=serve.run, args=(pid_app, config), daemon=True,
+                                  kwargs={'preload': lambda: calls.append('preload'),
+                                          'post_fork': lambda: calls.append('post_fork'), 'ready': ports.append})
+        thread.start()
+        deadline = time.monotonic() + 5
+        while not ports and time.monotonic() < deadline:
+            time.sleep(0.01)
+        try:
+            assert calls == ['preload', 'post_fork']
+            assert get(ports[0]) == str(os.getpid())
+        finally:
+            servers[0].close()
+            servers[0].task_dispatcher.shutdown()
+
+    def test_config_from_environment(self, monkeypatch):
+        monkeypatch.setenv('FLASK_SERVER', 'Production')
+        monkeypatch.setenv('FLASK_WORKERS', '3')
+        monkeypatch.setenv('FLASK_THREADS', '0')
+        config = serve.server_config()
+        assert config['server'] == 'production'
+        assert config['workers'] == 3
+        assert config['threads'] == 1
+        options = serve.gunicorn_options(config)
+        assert (options['workers'], options['threads'], options['worker_class']) == (3, 1, 'gthread')
+        assert options['preload_app'] is True
+
+
+@pytest.mark.skipif(not serve.forks(), reason="gunicorn needs os.fork")
+class TestGunicorn:
+    """Test worker supervision and pinned paths under gunicorn."""
+
+    def test_restart_reload_and_graceful_stop(self):
+        master, port = start_master('test_serve.run_master()')
+        try:
+            assert port
+
+            pids = {get(port) for _ in range(10)}
+            assert pids and str(master.pid) not in pids
+
+            victim = int(next(iter(pids)))
+            os.kill(victim, signal.SIGKILL)
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                time.sleep(0.1)
+                if str(victim) not in {get(port) for _ in range(4)}:
+                    break
+            assert get(port)
+
+            before = {get(port) for _ in range(10)}
+            master.send_signal(signal.SIGHUP)
+            deadline = time.monotonic() + 10
+            after = before
+            while before & after and time.monotonic() < deadline:
+                time.sleep(0.2)
+                after = {get(port) for _ in range(10)}
+            assert not before & after
+
+            master.send_signal(signal.SIGTERM)
+            assert master.wait(15) == 0
+        finally:
+            stop_master(master)
+
+    def test_pinned_paths_are_served_by_one_worker(self):
+        master, port = start_master("test_serve.run_master('stream_app', pinned=('/stream/',))")
+        try:
+            assert port
+            deadline = time.monotonic() + 10
+            workers = set()
+            while len(workers) < 2 and time.monotonic() < deadline:
+                workers |= {get(port) for _ in range(10)}
+            assert len(workers) == 2
+
+            # Events and frames meet in one process whichever worker accepts them
+            streams = []
+            for _ in range(3):
+                conn, response = open_events(port)
+                streams.append((conn, response, read_events(response, 1)[0]))
+            assert len({pid for _, _, pid in streams}) == 1
+            assert streams[0][2] in workers
+
+            frames = [f'frame-{i}' for i in range(20)]
+            for frame in frames:
+                assert post(port, '/stream/frame', frame) == (202, '127.0.0.1')
+            for conn, response, _ in streams:
+                assert read_events(response, len(frames)) == frames
+                conn.close()
+
+            # Another worker takes over when the pinned one dies
+            os.kill(int(streams[0][2]), signal.SIGKILL)
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                try:
+                    if post(port, '/stream/frame', 'after-restart')[0] == 202:
+                        break
+                except urllib.error.HTTPError as e:
+                    assert e.code == 503
+                time.sleep(0.1)
+            conn, response = open_events(port)
+            assert read_events(response, 1)[0] != streams[0][2]
+            conn.close()
+
+            master.send_signal(signal.SIGTERM)
+            assert master.wait(15) == 0
+        finally:
+            stop_master(master)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,119 @@
+"""
+Tests for the live detection stream hub.
+
+Running tests:
+    pytest test_streaming.py -v
+"""
+
+import threading
+
+import pytest  # type: ignore
+
+from streaming import StreamHub, StreamFull
+
+
+class GatedProcessor:
+    """Processor that blocks until released, recording every frame it sees."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.seen = []
+
+    def __call__(self, frame, state):
+        self.seen.append(frame)
+        self.started.set()
+        self.gate.wait(5)
+        return {'frame': frame}
+
+
+def next_result(hub, client_id):
+    for result in hub.events(client_id, keepalive=5):
+        if result is not None:
+            return result
+
+
+class TestStreamHub:
+    """Test newest-frame-wins buffering and per-client limits."""
+
+    def test_only_newest_frame_is_processed(self):
+        processor = GatedProcessor()
+        hub = StreamHub(processor, workers=1, max_fps=0)
+        try:
+            hub.open('kiosk')
+            hub.push('kiosk', 1)
+            assert processor.started.wait(5)
+            # Frames 2..4 arrive while 1 is in flight; only 4 should survive
+            for frame in (2, 3, 4):
+                hub.push('kiosk', frame)
+            processor.gate.set()
+
+            for result in hub.events('kiosk', keepalive=5):
+                if result is not None and result['frame'] == 4:
+                    break
+        finally:
+            hub.stop()
+
+        assert processor.seen == [1, 4]
+        assert hub.stats()['dropped'] == 2
+
+    def test_state_is_kept_per_client(self):
+        def count_frames(frame, state):
+            state['frames'] = state.get('frames', 0) + 1
+            return {'frames': state['frames']}
+
+        hub = StreamHub(count_frames, workers=1, max_fps=0)
+        try:
+            hub.open('a')
+            for frame in range(3):
+                hub.push('a', frame)
+                for result in hub.events('a', keepalive=5):
+                    if result is not None and result['frames'] == frame + 1:
+                        break
+            hub.push('b', 0)
+            assert next_result(hub, 'b')['frames'] == 1
+        finally:
+            hub.stop()
+
+    def test_clients_are_served_round_robin(self):
+        processor = GatedProcessor()
+        hub = StreamHub(processor, workers=1, max_fps=0)
+        try:
+            hub.push('slow', 'slow-1')
+            assert processor.started.wait(5)
+            hub.push('slow', 'slow-2')
+            hub.push('fast', 'fast-1')
+            processor.gate.set()
+            assert next_result(hub, 'fast') is not None
+        finally:
+            hub.stop()
+
+        assert processor.seen.index('fast-1') < processor.seen.index('slow-2')
+
+    def test_rate_cap_drops_frames(self):
+        hub = StreamHub(lambda frame, state: {}, workers=1, max_fps=1)
+        try:
+            assert hub.push('kiosk', 1)
+            assert not hub.push('kiosk', 2)
+        finally:
+            hub.stop()
+
+    def test_frame_totals_survive_disconnects(self):
+        hub = StreamHub(lambda frame, state: {'frame': frame}, workers=1, max_fps=0)
+        try:
+            hub.open('kiosk')
+            hub.push('kiosk', 1)
+            assert next_result(hub, 'kiosk')['frame'] == 1
+            before = hub.stats()
+            hub.close('kiosk')
+            after = hub.stats()
+        finally:
+            hub.stop()
+        assert after['clients'] == 0
+        assert (after['received'], after['processed']) == (before['received'], before['processed']) == (1, 1)
+
+    def test_max_clients(self):
+        hub = StreamHub(lambda frame, state: {}, max_clients=1)
+        hub.open('a')
+        with pytest.raises(StreamFull):
+            hub.open('b')
@@ -0,0 +1,115 @@
+"""
+Tests for tiled / region-of-interest inference settings.
+
+Running tests:
+    pytest test_tiling.py -v
+"""
+
+import json
+
+import numpy as np
+import pytest  # type: ignore
+
+from pipeline import PAD_VALUE
+from tiling import CameraConfigError, CameraSettings, cameras_from_env, merge_boxes, tile_starts
+
+
+class TestTileGrid:
+    """Test tile placement and ROI restriction."""
+
+    def test_tiles_cover_the_frame_with_overlap(self):
+        starts = tile_starts(3840, 1280, 256)
+        assert starts[0] == 0 and starts[-1] == 3840 - 1280
+        assert all(b - a <= 1280 - 256 for a, b in zip(starts, starts[1:]))
+        assert tile_starts(640, 1280, 256) == [0]
+
+    def test_4k_frame_gets_tiles_plus_a_full_frame_pass(self):
+        settings = CameraSettings(tile=1280, overlap=0.2)
+        windows = settings.windows(3840, 2160)
+        assert len(windows) == 4 * 2 + 1
+        assert windows[-1] == (0, 0, 3840, 2160)
+        assert all(x2 - x1 <= 1280 and y2 - y1 <= 1280 for x1, y1, x2, y2 in windows[:-1])
+
+    def test_roi_skips_tiles_and_blanks_outside_pixels(self):
+        # Bottom half of the frame only
+        settings = CameraSettings(tile=1000, overlap=0.0, roi=[[0, 0.5], [1, 0.5], [1, 1], [0, 1]],
+                                  full_frame=False)
+        windows = settings.windows(2000, 2000)
+        assert windows == [(0, 1000, 1000, 2000), (1000, 1000, 2000, 2000)]
+
+        triangle = CameraSettings(roi=[[0, 0], [1, 0], [0, 1]])
+        frame = np.full((100, 100, 3), 7, dtype=np.uint8)
+        (window,) = triangle.windows(100, 100)
+        crop = triangle.crop(frame, window)
+        assert crop[5, 5, 0] == 7 and crop[95, 95, 0] == PAD_VALUE
+        assert frame[95, 95, 0] == 7   # the frame itself is untouched
+
+    def test_inactive_without_tiles_or_roi(self):
+        assert not CameraSettings().active
+        assert CameraSettings(tile=640).active
+        assert CameraSettings(roi=[[0, 0], [1, 0], [1, 1]]).active
+
+
+class TestMerge:
+    """Test merging detections across tile borders."""
+
+    def test_pieces_of_one_item_merge_and_separate_items_stay(self):
+        windows = [(0, 0, 100, 100), (80, 0, 180, 100)]   # overlap x 80-100
+        rows = [
+            (0, 0, 0.6, (90.0, 10.0, 100.0, 50.0)),    # right edge of tile 0
+            (1, 0, 0.9, (80.0, 10.0, 120.0, 50.0)),    # whole item in tile 1
+            (1, 0, 0.8, (140.0, 10.0, 170.0, 50.0)),   # another beaker
+            (0, 1, 0.7, (85.0, 10.0, 99.0, 50.0)),     # a different class on top
+        ]
+        merged = merge_boxes(rows, windows)
+        assert (0, 0.9, (80.0, 10.0, 120.0, 50.0)) in merged
+        assert len(merged) == 3
+
+    def test_overlapping_items_in_one_tile_are_kept_apart(self):
+        # Two beakers side by side at IoU ~0.33; the model's NMS kept both
+        a, b = (10.0, 10.0, 40.0, 40.0), (25.0, 10.0, 55.0, 40.0)
+        assert merge_boxes([(0, 0, 0.9, a), (0, 0, 0.8, b)], [(0, 0, 100, 100)]) == [(0, 0.9, a), (0, 0.8, b)]
+
+        roi_only = CameraSettings(roi=[[0, 0], [1, 0], [1, 1], [0, 1]])
+        windows = roi_only.windows(100, 100)
+        assert len(roi_only.merge([[(0, 0.9, a), (0, 0.8, b)]], windows, 100, 100)) == 2
+
+        # A tile and the full-frame pass each see both: still two items
+        tiled = CameraSettings(tile=60, overlap=0.5)
+        windows = tiled.windows(100, 100)
+        per_window = [[] for _ in windows]
+        per_window[0] = [(0, 0.9, a), (0, 0.8, b)]
+        per_window[-1] = [(0, 0.85, a), (0, 0.75, b)]
+        assert len(tiled.merge(per_window, windows, 100, 100)) == 2
+
+    def test_windows_are_offset_and_roi_filters_centres(self):
+        settings = CameraSettings(tile=100, overlap=0.0, roi=[[0, 0], [0.5, 0], [0.5, 1], [0, 1]],
+                                  full_frame=False)
+        windows = [(0, 0, 100, 100), (100, 0, 200, 100)]
+        per_window = [[(0, 0.9, (10.0, 10.0, 20.0, 20.0))], [(0, 0.9, (10.0, 10.0, 20.0, 20.0))]]
+        assert settings.merge(per_window, windows, 200, 100) == [(0, 0.9, (10.0, 10.0, 20.0, 20.0))]
+
+
+class TestCameraConfig:
+    """Test loading per-camera settings."""
+
+    def test_file_and_env_defaults(self, tmp_path, monkeypatch):
+        path = tmp_path / 'cameras.json'
+        path.write_text(json.dumps({'bench': {'tile': 1280, 'roi': [[0, 0], [1, 0], [1, 1]]}}))
+        monkeypatch.setenv('LABCV_CAMERAS', str(path))
+        monkeypatch.setenv('LABCV_TILE_SIZE', '960')
+        cameras = cameras_from_env()
+        assert cameras.get('bench').tile == 1280
+        assert cameras.get('kiosk-2').tile == 960
+        assert cameras.describe()['bench']['roi'] == [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0]]
+
+    def test_invalid_settings_are_reported(self, tmp_path, monkeypatch):
+        path = tmp_path / 'cameras.json'
+        path.write_text(json.dumps({'bench': {'tiles': 1280}}))
+        monkeypatch.setenv('LABCV_CAMERAS', str(path))
+        with pytest.raises(CameraConfigError, match='tiles'):
+            cameras_from_env()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
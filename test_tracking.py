@@ -0,0 +1,91 @@
+"""
+Tests for keyframe detection with tracking.
+
+Running tests:
+    pytest test_tracking.py -v
+"""
+
+import cv2
+import numpy as np
+
+from tracking import EquipmentTracker, iou_matrix
+
+
+TEXTURE = cv2.GaussianBlur(np.random.default_rng(0).integers(0, 256, (40, 40), dtype=np.uint8), (3, 3), 0)
+
+
+def textured_frame(x, y, size=40):
+    """Black frame with a textured square at (x, y) so corners can be tracked."""
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    frame[y:y + size, x:x + size] = TEXTURE[:size, :size, None]
+    return frame
+
+
+class ScriptedDetector:
+    """Returns a fixed list of detections and counts how often it is called."""
+
+    def __init__(self, detections):
+        self.detections = detections
+        self.calls = 0
+
+    def __call__(self, frame):
+        self.calls += 1
+        return [dict(d) for d in self.detections]
+
+
+def beaker_at(x, y, size=40):
+    return {'class': 'beaker', 'equipment': 'Beaker', 'confidence': 0.9,
+            'box': [x, y, x + size, y + size]}
+
+
+class TestEquipmentTracker:
+    """Test keyframe scheduling, box propagation and count smoothing."""
+
+    def test_detector_runs_only_on_keyframes(self):
+        detector = ScriptedDetector([beaker_at(50, 50)])
+        tracker = EquipmentTracker(detector, keyframe_interval=5)
+        for _ in range(10):
+            tracker.update(textured_frame(50, 50))
+
+        assert detector.calls == 2
+        assert tracker.stats()['keyframes'] == 2
+
+    def test_boxes_follow_motion_between_keyframes(self):
+        detector = ScriptedDetector([beaker_at(50, 50)])
+        tracker = EquipmentTracker(detector, keyframe_interval=10, flow_scale=1.0)
+        for step in range(4):
+            result = tracker.update(textured_frame(50 + 3 * step, 50))
+
+        x1 = result['detections'][0]['box'][0]
+        assert abs(x1 - 59) < 2, f"Box should have moved to x=59. Found: {x1}"
+
+    def test_counts_are_instance_counts(self):
+        detector = ScriptedDetector([beaker_at(10, 10), beaker_at(150, 10), beaker_at(10, 150)])
+        tracker = EquipmentTracker(detector, keyframe_interval=1)
+        result = tracker.update(textured_frame(10, 10))
+        assert result['counts'] == {'Beaker': 3}
+
+    def test_counts_are_smoothed_over_window(self):
+        detector = ScriptedDetector([beaker_at(10, 10), beaker_at(150, 10)])
+        tracker = EquipmentTracker(detector, keyframe_interval=1, max_misses=0, smoothing_window=5)
+        for _ in range(4):
+            tracker.update(textured_frame(10, 10))
+
+        # One noisy keyframe with a missing beaker shouldn't change the count
+        detector.detections = [beaker_at(10, 10)]
+        result = tracker.update(textured_frame(10, 10))
+        assert result['counts'] == {'Beaker': 2}
+
+    def test_matching_keeps_track_ids(self):
+        detector = ScriptedDetector([beaker_at(50, 50)])
+        tracker = EquipmentTracker(detector, keyframe_interval=1)
+        first = tracker.update(textured_frame(50, 50))['detections'][0]['track_id']
+        detector.detections = [beaker_at(52, 50)]
+        second = tracker.update(textured_frame(52, 50))['detections'][0]['track_id']
+        assert first == second
+
+
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10]], dtype=np.float32)
+    b = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]], dtype=np.float32)
+    np.testing.assert_allclose(iou_matrix(a, b), [[1.0, 1 / 3, 0.0]], rtol=1e-5)
@@ -0,0 +1,146 @@
+"""
+Tests for the shared-memory inference worker pool.
+
+Running tests:
+    pytest test_worker_pool.py -v
+"""
+
+import os
+import threading
+
+import numpy as np
+import pytest  # type: ignore
+
+import worker_pool
+from worker_pool import InferencePool, WorkerCrashed, WorkerError
+
+
+class EchoBox:
+    def __init__(self, cls, conf):
+        self.cls = [cls]
+        self.conf = [conf]
+        self.xyxy = [[0.0, 0.0, 1.0, 2.0]]
+
+
+class EchoResult:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class EchoModel:
+    """Reports each frame's width as the class and its first pixel as the confidence.
+
+    A frame whose first pixel is 255 kills the worker process; `classes`
+    drops boxes of other widths.
+    """
+    names = {0: 'beaker'}
+
+    def __call__(self, frames, classes=None):
+        results = []
+        for frame in frames:
+            if frame[0, 0, 0] == 255:
+                os._exit(1)
+            boxes = [EchoBox(frame.shape[1], float(frame[0, 0, 0]))]
+            results.append(EchoResult([b for b in boxes if classes is None or b.cls[0] in classes]))
+        return results
+
+
+def broken_factory():
+    raise RuntimeError("no weights")
+
+
+def frame(width, value):
+    return np.full((4, width, 3), value, dtype=np.uint8)
+
+
+@pytest.fixture
+def pool():
+    pool = InferencePool(EchoModel, workers=2, slots=2, slot_bytes=4 * 64 * 3, restart_delay=0.05).start()
+    yield pool
+    pool.close()
+
+
+class TestInferencePool:
+    """Test frame hand-off, crash recovery and startup errors."""
+
+    def test_frames_round_trip_through_shared_memory(self, pool):
+        results = pool([frame(8, 10), frame(16, 20), frame(32, 30)])
+        assert [(r.boxes[0].cls[0], r.boxes[0].conf[0]) for r in results] == [(8, 10.0), (16, 20.0), (32, 30.0)]
+        assert results[0].boxes[0].xyxy[0] == [0.0, 0.0, 1.0, 2.0]
+        assert pool.names == {0: 'beaker'}
+        assert pool.stats()['frames'] == 3
+
+    def test_concurrent_submits(self, pool):
+        seen = {}
+
+        def run(i):
+            seen[i] = pool.submit(frame(i + 1, i), timeout=30).boxes[0].cls[0]
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(12)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert seen == {i: i + 1 for i in range(12)}
+
+    def test_oversized_frame_goes_through_the_pipe(self, pool):
+        result = pool.submit(frame(200, 7))
+        assert result.boxes[0].cls[0] == 200
+
+    def test_crashed_worker_is_replaced(self, pool):
+        with pytest.raises(WorkerCrashed):
+            pool.submit(frame(8, 255), timeout=30)
+        # The surviving worker keeps serving while the other restarts
+        assert pool.submit(frame(8, 1), timeout=30).boxes[0].conf[0] == 1.0
+        deadline = 300
+        while pool.stats()['alive'] < 2 and deadline:
+            threading.Event().wait(0.05)
+            deadline -= 1
+        stats = pool.stats()
+        assert stats['alive'] == 2
+        assert stats['restarts'] == 1
+
+    def test_configured_options_reach_every_worker_including_replacements(self, pool):
+        pool.configure(classes=[8])
+        for _ in range(4):
+            results = pool([frame(8, 1), frame(16, 1)], timeout=30)
+            assert [len(r.boxes) for r in results] == [1, 0]
+
+        with pytest.raises(WorkerCrashed):
+            pool.submit(frame(8, 255), timeout=30)
+        deadline = 300
+        while pool.stats()['alive'] < 2 and deadline:
+            threading.Event().wait(0.05)
+            deadline -= 1
+        for _ in range(4):
+            assert pool.submit(frame(16, 1), timeout=30).boxes == []
+
+        pool.configure()
+        assert pool.submit(frame(16, 1), timeout=30).boxes[0].cls[0] == 16
+
+    def test_failed_model_load_raises(self):
+        with pytest.raises(WorkerError, match='no weights'):
+            InferencePool(broken_factory).start()
+
+
+class TestConfiguration:
+    """Test core assignment and environment parsing."""
+
+    def test_cores_wrap_when_short(self, monkeypatch):
+        monkeypatch.setattr(worker_pool, 'available_cores', lambda: [0, 1, 2])
+        assert worker_pool.assign_cores(2, 2) == [[0, 1], [2, 0]]
+        assert worker_pool.assign_cores(3) == [[0], [1], [2]]
+
+    def test_workers_from_env(self, monkeypatch):
+        monkeypatch.setattr(worker_pool, 'available_cores', lambda: list(range(8)))
+        monkeypatch.delenv('LABCV_INFERENCE_WORKERS', raising=False)
+        assert worker_pool.workers_from_env() == 0
+        monkeypatch.setenv('LABCV_INFERENCE_WORKERS', 'auto')
+        monkeypatch.setenv('LABCV_WORKER_CORES', '2')
+        assert worker_pool.workers_from_env() == 4
+        monkeypatch.setenv('LABCV_INFERENCE_WORKERS', '3')
+        assert worker_pool.workers_from_env() == 3
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
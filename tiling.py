@@ -0,0 +1,242 @@
+"""
+Tiled and region-of-interest inference for high-resolution cameras.
+
+Scaled down to the model's input size, a 4K overhead frame leaves a compass
+or a magnet only a few pixels wide. For cameras configured here a frame is
+instead cut into overlapping tiles at (close to) native resolution, all
+tiles go through the model as one batch and the detections are merged back
+into frame coordinates:
+
+- tiles are `tile` pixels square and overlap by `overlap` (a fraction of
+  the tile), so an item cut by one tile border lies whole in a neighbour
+- `full_frame` adds one scaled-down pass over the whole region so items
+  larger than a tile (balances, tripods) are still seen in one piece
+- same-class boxes from different windows that mostly cover each other
+  (intersection over the smaller box >= `merge_threshold`) where those
+  windows overlap are merged into their union, keeping the highest
+  confidence; boxes from one window are never merged
+- `roi` is a polygon of [x, y] points given as fractions of the frame
+  width and height. Only tiles touching it are run, pixels outside it are
+  blanked and boxes centred outside it are dropped
+
+Cameras are told apart by their kiosk id (X-Kiosk-Id, else the client
+address). LABCV_CAMERAS names a JSON file of per-camera settings, e.g.
+
+    {
+      "bench-4k": {"tile": 1280, "overlap": 0.2,
+                   "roi": [[0.05, 0.35], [0.95, 0.35], [0.95, 1.0], [0.05, 1.0]]},
+      "default": {"tile": 0}
+    }
+
+Cameras without an entry use "default", else LABCV_TILE_SIZE (0, the
+default, turns tiling off) and LABCV_TILE_OVERLAP.
+"""
+
+import json
+import math
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from pipeline import PAD_VALUE
+
+
+class CameraConfigError(ValueError):
+    """Raised for an unreadable or invalid LABCV_CAMERAS file."""
+
+
+def tile_starts(length, tile, overlap):
+    """Evenly spaced tile offsets covering `length` with at least `overlap` pixels shared."""
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+
+def intersection(a, b):
+    """The overlap of two (x1, y1, x2, y2) rectangles, or None."""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    return (x1, y1, x2, y2) if x2 > x1 and y2 > y1 else None
+
+
+def box_overlap(a, b):
+    """Intersection over the smaller box's area."""
+    shared = intersection(a, b)
+    if shared is None:
+        return 0.0
+    smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+    return (shared[2] - shared[0]) * (shared[3] - shared[1]) / smaller if smaller > 0 else 0.0
+
+
+def merge_boxes(rows, windows, threshold=0.5):
+    """Merge (window, cls, conf, xyxy) rows seen by overlapping windows, highest confidence first.
+
+    Only boxes from different windows are merged, and only where they meet
+    inside the area both windows cover: boxes from one model pass were
+    already kept apart by its NMS, so they are separate items. A merged box
+    is the union of its pieces with the highest confidence.
+    """
+    groups = []   # [cls, conf, xyxy, [(window, xyxy), ...]]
+    for window, cls, conf, xyxy in sorted(rows, key=lambda row: -row[2]):
+        for group in groups:
+            if group[0] != cls or any(w == window for w, _ in group[3]):
+                continue
+            if any(_joins(xyxy, windows[window], box, windows[w], threshold) for w, box in group[3]):
+                kept = group[2]
+                group[2] = (min(kept[0], xyxy[0]), min(kept[1], xyxy[1]),
+                            max(kept[2], xyxy[2]), max(kept[3], xyxy[3]))
+                group[3].append((window, xyxy))
+                break
+        else:
+            groups.append([cls, conf, tuple(xyxy), [(window, xyxy)]])
+    return [(cls, conf, xyxy) for cls, conf, xyxy, _ in groups]
+
+
+def _joins(a, window_a, b, window_b, threshold):
+    """Whether boxes a and b from two windows are pieces of one item."""
+    if box_overlap(a, b) < threshold:
+        return False
+    shared_area = intersection(window_a, window_b)
+    return shared_area is not None and intersection(intersection(a, b), shared_area) is not None
+
+
+class CameraSettings:
+    """How frames from one camera are cut up before inference."""
+
+    def __init__(self, tile=0, overlap=0.2, roi=None, full_frame=True, merge_threshold=0.5):
+        self.tile = max(0, int(tile))
+        self.overlap = min(max(float(overlap), 0.0), 0.9)
+        self.roi = [(float(x), float(y)) for x, y in roi] if roi else None
+        if self.roi is not None and len(self.roi) < 3:
+            raise CameraConfigError("An ROI needs at least three points.")
+        self.full_frame = bool(full_frame)
+        self.merge_threshold = float(merge_threshold)
+        self._lock = threading.Lock()
+        self._masks = {}   # (height, width) -> (mask, bounding box)
+
+    @property
+    def active(self):
+        """False when frames go to the model whole, as before."""
+        return self.tile > 0 or self.roi is not None
+
+    def region(self, width, height):
+        """(mask or None, (x1, y1, x2, y2)) of the ROI for a frame of this size."""
+        if self.roi is None:
+            return None, (0, 0, width, height)
+        with self._lock:
+            cached = self._masks.get((height, width))
+            if cached is None:
+                points = np.array([[round(x * width), round(y * height)] for x, y in self.roi], dtype=np.int32)
+                mask = np.zeros((height, width), dtype=np.uint8)
+                cv2.fillPoly(mask, [points], 255)
+                x, y, w, h = cv2.boundingRect(points)
+                x1, y1 = max(0, x), max(0, y)
+                cached = self._masks[(height, width)] = (mask, (x1, y1, min(width, x + w), min(height, y + h)))
+            return cached
+
+    def windows(self, width, height):
+        """(x1, y1, x2, y2) crops to run: the tiles touching the ROI, plus the ROI itself."""
+        mask, (rx1, ry1, rx2, ry2) = self.region(width, height)
+        if rx2 <= rx1 or ry2 <= ry1:
+            return []
+        crops = []
+        if self.tile:
+            shared = int(self.tile * self.overlap)
+            for y in tile_starts(ry2 - ry1, self.tile, shared):
+                for x in tile_starts(rx2 - rx1, self.tile, shared):
+                    crop = (rx1 + x, ry1 + y, min(rx2, rx1 + x + self.tile), min(ry2, ry1 + y + self.tile))
+                    if mask is None or mask[crop[1]:crop[3], crop[0]:crop[2]].any():
+                        crops.append(crop)
+        whole = (rx1, ry1, rx2, ry2)
+        if (self.full_frame or not self.tile) and whole not in crops:
+            crops.append(whole)
+        return crops
+
+    def crop(self, frame, window):
+        """The frame inside `window`, blanked outside the ROI (a view when nothing is blanked)."""
+        x1, y1, x2, y2 = window
+        view = frame[y1:y2, x1:x2]
+        mask, _ = self.region(frame.shape[1], frame.shape[0])
+        if mask is None:
+            return view
+        outside = mask[y1:y2, x1:x2] == 0
+        if not outside.any():
+            return view
+        view = view.copy()
+        view[outside] = PAD_VALUE
+        return view
+
+    def merge(self, per_window, windows, width, height):
+        """Merge rows detected in each window into one list in frame coordinates."""
+        mask, _ = self.region(width, height)
+        rows = []
+        for index, (window_rows, (x1, y1, _, _)) in enumerate(zip(per_window, windows)):
+            for cls, conf, (bx1, by1, bx2, by2) in window_rows:
+                rows.append((index, cls, conf, (bx1 + x1, by1 + y1, bx2 + x1, by2 + y1)))
+        rows = merge_boxes(rows, windows, self.merge_threshold)
+        if mask is not None:
+            rows = [row for row in rows
+                    if mask[min(height - 1, int((row[2][1] + row[2][3]) / 2)),
+                            min(width - 1, int((row[2][0] + row[2][2]) / 2))]]
+        return rows
+
+    def describe(self):
+        return {
+            'tile': self.tile,
+            'overlap': self.overlap,
+            'roi': [list(point) for point in self.roi] if self.roi else None,
+            'full_frame': self.full_frame,
+            'merge_threshold': self.merge_threshold,
+        }
+
+
+class Cameras:
+    """Per-camera CameraSettings with a fallback for unknown cameras."""
+
+    def __init__(self, cameras=None, default=None):
+        self.cameras = dict(cameras or {})
+        self.default = default or CameraSettings()
+
+    def get(self, camera):
+        return self.cameras.get(camera, self.default)
+
+    def describe(self):
+        body = {name: settings.describe() for name, settings in sorted(self.cameras.items())}
+        body['default'] = self.default.describe()
+        return body
+
+
+def _settings(name, entry):
+    if not isinstance(entry, dict):
+        raise CameraConfigError(f"Camera '{name}' must be an object of settings.")
+    unknown = set(entry) - {'tile', 'overlap', 'roi', 'full_frame', 'merge_threshold'}
+    if unknown:
+        raise CameraConfigError(f"Camera '{name}' has unknown settings: {', '.join(sorted(unknown))}.")
+    try:
+        return CameraSettings(**entry)
+    except (TypeError, ValueError) as e:
+        raise CameraConfigError(f"Camera '{name}': {e}") from e
+
+
+def load_cameras(path, default=None):
+    """Read a camera settings file (see the module docstring)."""
+    try:
+        with open(path) as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        raise CameraConfigError(f"Can't read camera settings from {path}: {e}") from e
+    if not isinstance(entries, dict):
+        raise CameraConfigError(f"{path} must hold an object mapping camera ids to settings.")
+    cameras = {name: _settings(name, entry) for name, entry in entries.items()}
+    return Cameras(cameras, cameras.pop('default', default))
+
+
+def cameras_from_env():
+    """Build Cameras from LABCV_CAMERAS, with LABCV_TILE_SIZE / LABCV_TILE_OVERLAP as the default."""
+    default = CameraSettings(tile=int(os.environ.get('LABCV_TILE_SIZE', '0')),
+                             overlap=float(os.environ.get('LABCV_TILE_OVERLAP', '0.2')))
+    path = os.environ.get('LABCV_CAMERAS')
+    return load_cameras(path, default) if path else Cameras(default=default)
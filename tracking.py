@@ -0,0 +1,213 @@
+"""
+Keyframe detection with lightweight tracking for live streams.
+
+Running YOLO on every streamed frame is wasteful when the bench barely
+changes between frames. EquipmentTracker runs the detector only on every
+Nth frame (a keyframe), follows the detected boxes in between with sparse
+optical flow, and smooths the per-equipment instance counts over a short
+window so they can pre-fill the quantity fields without flickering.
+"""
+
+import collections
+import time
+
+import cv2
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU between two (N, 4) and (M, 4) arrays of xyxy boxes."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    a = a[:, None, :]
+    b = b[None, :, :]
+    ix1 = np.maximum(a[..., 0], b[..., 0])
+    iy1 = np.maximum(a[..., 1], b[..., 1])
+    ix2 = np.minimum(a[..., 2], b[..., 2])
+    iy2 = np.minimum(a[..., 3], b[..., 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+class Track:
+    """One object followed across frames."""
+
+    __slots__ = ('track_id', 'cls', 'equipment', 'box', 'confidence', 'misses')
+
+    def __init__(self, track_id, detection):
+        self.track_id = track_id
+        self.cls = detection['class']
+        self.equipment = detection.get('equipment')
+        self.box = np.asarray(detection['box'], dtype=np.float32)
+        self.confidence = detection.get('confidence', 0.0)
+        self.misses = 0
+
+    def to_dict(self):
+        return {
+            'track_id': self.track_id,
+            'class': self.cls,
+            'equipment': self.equipment,
+            'confidence': self.confidence,
+            'box': [float(v) for v in self.box],
+        }
+
+
+class EquipmentTracker:
+    """Detect on keyframes, track in between and report smoothed counts.
+
+    `detect(frame)` must return a list of detection dicts with 'class',
+    'equipment' (inventory name or None), 'confidence' and 'box' (xyxy) keys,
+    i.e. the detections produced by app.detect_equipment().
+    """
+
+    def __init__(self, detect, keyframe_interval=5, iou_threshold=0.3, max_misses=1,
+                 smoothing_window=5, flow_scale=0.5):
+        self.detect = detect
+        self.keyframe_interval = max(1, int(keyframe_interval))
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.flow_scale = flow_scale
+
+        self.tracks = []
+        self._next_id = 1
+        self._prev_gray = None
+        self._frame_index = 0
+        self._history = collections.deque(maxlen=max(1, int(smoothing_window)))
+
+        self.frames = 0
+        self.keyframes = 0
+        self.detect_seconds = 0.0
+        self.track_seconds = 0.0
+
+    # ---------- Public API ----------
+    def update(self, frame):
+        """Feed the next frame; returns the smoothed counts and current tracks."""
+        keyframe = self._prev_gray is None or self._frame_index % self.keyframe_interval == 0
+
+        started = time.perf_counter()
+        gray = self._to_gray(frame)
+        if keyframe:
+            detect_started = time.perf_counter()
+            detections = self.detect(frame)
+            self.detect_seconds += time.perf_counter() - detect_started
+            self._associate(detections)
+            self.keyframes += 1
+        else:
+            self._propagate(self._prev_gray, gray)
+        self._prev_gray = gray
+        if not keyframe:
+            self.track_seconds += time.perf_counter() - started
+
+        self._frame_index += 1
+        self.frames += 1
+
+        raw_counts = collections.Counter(t.equipment for t in self.tracks if t.equipment)
+        self._history.append(raw_counts)
+        counts = self.smoothed_counts()
+        return {
+            'keyframe': keyframe,
+            'equipment': sorted(counts),
+            'counts': counts,
+            'detections': [t.to_dict() for t in self.tracks],
+            'tracking': self.stats(),
+        }
+
+    def smoothed_counts(self):
+        """Median count per equipment over the smoothing window (zeros dropped)."""
+        names = set()
+        for counts in self._history:
+            names.update(counts)
+        smoothed = {}
+        for name in names:
+            median = float(np.median([counts.get(name, 0) for counts in self._history]))
+            value = int(median + 0.5)
+            if value > 0:
+                smoothed[name] = value
+        return smoothed
+
+    def stats(self):
+        """Time actually spent versus running the detector on every frame."""
+        per_detect = self.detect_seconds / self.keyframes if self.keyframes else 0.0
+        per_frame_cost = per_detect * self.frames
+        spent = self.detect_seconds + self.track_seconds
+        saved = max(0.0, per_frame_cost - spent)
+        return {
+            'keyframe_interval': self.keyframe_interval,
+            'frames': self.frames,
+            'keyframes': self.keyframes,
+            'avg_detect_ms': per_detect * 1000.0,
+            'avg_track_ms': (self.track_seconds / (self.frames - self.keyframes) * 1000.0)
+                            if self.frames > self.keyframes else 0.0,
+            'saved_ms': saved * 1000.0,
+            'saved_pct': (saved / per_frame_cost * 100.0) if per_frame_cost else 0.0,
+        }
+
+    # ---------- Internals ----------
+    def _to_gray(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        if self.flow_scale != 1.0:
+            gray = cv2.resize(gray, None, fx=self.flow_scale, fy=self.flow_scale,
+                              interpolation=cv2.INTER_AREA)
+        return gray
+
+    def _associate(self, detections):
+        """Greedy IoU matching of keyframe detections onto existing tracks."""
+        boxes = np.array([d['box'] for d in detections], dtype=np.float32).reshape(-1, 4)
+        track_boxes = np.array([t.box for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+        ious = iou_matrix(track_boxes, boxes)
+
+        matched_tracks = set()
+        matched_dets = set()
+        if ious.size:
+            for flat in np.argsort(-ious, axis=None):
+                ti, di = np.unravel_index(flat, ious.shape)
+                if ious[ti, di] < self.iou_threshold:
+                    break
+                if ti in matched_tracks or di in matched_dets:
+                    continue
+                if self.tracks[ti].cls != detections[di]['class']:
+                    continue
+                track = self.tracks[ti]
+                track.box = boxes[di].copy()
+                track.confidence = detections[di].get('confidence', 0.0)
+                track.misses = 0
+                matched_tracks.add(ti)
+                matched_dets.add(di)
+
+        survivors = []
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+        for i, detection in enumerate(detections):
+            if i not in matched_dets:
+                survivors.append(Track(self._next_id, detection))
+                self._next_id += 1
+        self.tracks = survivors
+
+    def _propagate(self, prev_gray, gray):
+        """Shift each box by the median optical flow of corners inside it."""
+        if prev_gray is None or prev_gray.shape != gray.shape:
+            return
+        h, w = gray.shape[:2]
+        for track in self.tracks:
+            x1, y1, x2, y2 = (track.box * self.flow_scale).astype(int)
+            x1, y1 = max(x1, 0), max(y1, 0)
+            x2, y2 = min(x2, w), min(y2, h)
+            if x2 - x1 < 4 or y2 - y1 < 4:
+                continue
+            corners = cv2.goodFeaturesToTrack(prev_gray[y1:y2, x1:x2], maxCorners=20,
+                                              qualityLevel=0.01, minDistance=3)
+            if corners is None:
+                continue
+            corners = corners + np.array([x1, y1], dtype=np.float32)
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, corners, None)
+            ok = status.reshape(-1) == 1
+            if not ok.any():
+                continue
+            shift = np.median((moved - corners).reshape(-1, 2)[ok], axis=0) / self.flow_scale
+            track.box = track.box + np.array([shift[0], shift[1], shift[0], shift[1]], dtype=np.float32)
@@ -0,0 +1,477 @@
+"""
+Out-of-process inference workers fed through shared memory.
+
+With the model inside the Flask process every inference competes with the
+request threads for the GIL, and each extra server process would load its
+own copy of the weights. InferencePool moves the model into a pool of
+worker processes instead:
+
+- each worker owns a shared-memory ring of frame slots; the server copies a
+  frame straight into a free slot and sends only (id, slot, shape, dtype)
+  down a pipe, so frames are never pickled
+- a worker drains whatever requests are waiting (up to max_batch_size),
+  runs them as one model call and sends back plain (class, confidence, box)
+  tuples, which the server wraps to look like ultralytics Results
+- workers are pinned to their own cores (where the OS allows it) and run
+  LABCV_THREADS = cores per worker, so they don't fight over the CPU
+- a supervisor thread per worker notices a crash (its pipe closes), fails
+  the frames that were in flight with WorkerCrashed and starts a
+  replacement
+
+Enabled with LABCV_INFERENCE_WORKERS=<n> or `auto` (one worker per
+LABCV_WORKER_CORES cores, default 2); app.py then sends every capture and
+stream keyframe through the pool instead of the in-process scheduler.
+"""
+
+import functools
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+DEFAULT_SLOT_BYTES = 1920 * 1080 * 3   # one 1080p BGR frame
+
+
+class WorkerError(RuntimeError):
+    """Raised when a worker can't load the model or the pool isn't running."""
+
+
+class WorkerCrashed(WorkerError):
+    """Raised for frames that were in flight when their worker died."""
+
+
+# ---------- Results ----------
+class PoolBox:
+    """One detection, shaped like an ultralytics box (`cls[0]`, `conf[0]`, `xyxy[0]`)."""
+
+    __slots__ = ('cls', 'conf', 'xyxy')
+
+    def __init__(self, cls, conf, xyxy):
+        self.cls = [cls]
+        self.conf = [conf]
+        self.xyxy = [list(xyxy)]
+
+
+class PoolResult:
+    def __init__(self, rows):
+        self.boxes = [PoolBox(*row) for row in rows]
+
+
+def result_rows(result):
+    """(class, confidence, xyxy) tuples for every box in an ultralytics-style result."""
+    return [(int(box.cls[0]), float(box.conf[0]), tuple(float(v) for v in box.xyxy[0]))
+            for box in result.boxes]
+
+
+# ---------- Worker process ----------
+def _frame_view(ring, slot_bytes, slot, shape, dtype):
+    return np.ndarray(shape, dtype=dtype, buffer=ring.buf, offset=slot * slot_bytes)
+
+
+def _worker_main(factory, ring_name, slot_bytes, cores, max_batch_size, requests, results):
+    if cores:
+        os.environ['LABCV_THREADS'] = str(len(cores))
+        if hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(0, cores)
+            except OSError:
+                pass
+    ring = shared_memory.SharedMemory(name=ring_name)
+    try:
+        try:
+            model = factory()
+        except Exception as e:
+            results.send(('failed', f"{type(e).__name__}: {e}"))
+            return
+        results.send(('ready', dict(model.names), os.getpid()))
+
+        options = {}   # model call keyword arguments, see InferencePool.configure
+        stopping = False
+        while not stopping:
+            try:
+                message = requests.recv()
+            except EOFError:  # the server went away
+                break
+            if message is None:
+                break
+            if isinstance(message, dict):
+                options = message
+                continue
+            batch = [message]
+            next_options = None
+            while len(batch) < max_batch_size and requests.poll():
+                message = requests.recv()
+                if message is None:
+                    stopping = True
+                    break
+                if isinstance(message, dict):
+                    next_options = message  # applies from the next batch on
+                    break
+                batch.append(message)
+
+            frames = [payload if payload is not None else _frame_view(ring, slot_bytes, slot, shape, dtype)
+                      for _, slot, shape, dtype, payload in batch]
+            try:
+                outputs = [result_rows(r) for r in model(frames, **options)]
+                if len(outputs) != len(batch):
+                    raise RuntimeError(f"Model returned {len(outputs)} results for {len(batch)} frames.")
+                error = None
+            except Exception as e:
+                outputs = [None] * len(batch)
+                error = f"{type(e).__name__}: {e}"
+            del frames  # release the views before the ring can be closed
+            results.send(('results', [(m[0], rows) for m, rows in zip(batch, outputs)], error))
+            if next_options is not None:
+                options = next_options
+    finally:
+        ring.close()
+
+
+# ---------- Server side ----------
+class _Request:
+    __slots__ = ('id', 'slot', 'done', 'result', 'error')
+
+    def __init__(self, request_id, slot):
+        self.id = request_id
+        self.slot = slot
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Worker:
+    """Server-side handle for one worker process and its ring."""
+
+    def __init__(self, index, cores, ring, slots):
+        self.index = index
+        self.cores = cores
+        self.ring = ring
+        self.slots = slots
+        self.free_slots = list(range(slots))
+        self.pending = {}
+        self.alive = False
+        self.process = None
+        self.requests = None
+        self.results = None
+        self.supervisor = None
+        self.send_lock = threading.Lock()
+        self.frames = 0
+        self.batches = 0
+        self.errors = 0
+        self.restarts = 0
+
+
+class InferencePool:
+    """A supervised pool of inference processes.
+
+    `factory` is called in each worker to build the model; it must be
+    picklable (a module-level function or a functools.partial of one) and
+    the model must accept a list of frames (and the keyword arguments set
+    with configure()) like ultralytics does. Calling
+    the pool with a list of frames spreads them over the workers and
+    returns one result per frame, so the pool can stand in for the model.
+    """
+
+    def __init__(self, factory, workers=1, cores_per_worker=None, slots=4, slot_bytes=DEFAULT_SLOT_BYTES,
+                 max_batch_size=4, start_method='spawn', start_timeout=300.0, restart_delay=1.0):
+        self.factory = factory
+        self.workers = max(1, int(workers))
+        self.cores_per_worker = cores_per_worker
+        self.slots = max(1, int(slots))
+        self.slot_bytes = int(slot_bytes)
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.start_timeout = start_timeout
+        self.restart_delay = restart_delay
+        self._ctx = multiprocessing.get_context(start_method)
+        self._cond = threading.Condition()
+        self._ids = itertools.count()
+        self._workers = []
+        self._names = None
+        self._options = {}
+        self._closing = False
+        self._closed = threading.Event()
+
+    # ---------- Lifecycle ----------
+    def start(self):
+        """Start every worker and wait until each has loaded the model."""
+        assignments = assign_cores(self.workers, self.cores_per_worker)
+        try:
+            for index, cores in enumerate(assignments):
+                ring = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+                worker = _Worker(index, cores, ring, self.slots)
+                self._workers.append(worker)
+                self._spawn(worker)
+        except BaseException:
+            self.close()
+            raise
+        for worker in self._workers:
+            worker.supervisor = threading.Thread(target=self._supervise, args=(worker,),
+                                                 name=f'labcv-worker-{worker.index}', daemon=True)
+            worker.supervisor.start()
+        return self
+
+    def _spawn(self, worker):
+        request_reader, request_writer = self._ctx.Pipe(duplex=False)
+        result_reader, result_writer = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=_worker_main, name=f'labcv-inference-{worker.index}', daemon=True,
+            args=(self.factory, worker.ring.name, self.slot_bytes, worker.cores, self.max_batch_size,
+                  request_reader, result_writer))
+        process.start()
+        # Drop our copies of the child's ends so its death closes the pipe
+        request_reader.close()
+        result_writer.close()
+        try:
+            if not result_reader.poll(self.start_timeout):
+                raise WorkerError(f"Inference worker {worker.index} did not start within {self.start_timeout:.0f}s.")
+            try:
+                message = result_reader.recv()
+            except EOFError:
+                raise WorkerError(f"Inference worker {worker.index} exited during startup.")
+            if message[0] != 'ready':
+                raise WorkerError(f"Inference worker {worker.index} failed to load the model: {message[1]}")
+        except WorkerError:
+            process.kill()
+            process.join()
+            request_writer.close()
+            result_reader.close()
+            raise
+        with self._cond:
+            if self._options:
+                request_writer.send(self._options)
+            self._names = message[1]
+            worker.process = process
+            worker.requests = request_writer
+            worker.results = result_reader
+            worker.alive = True
+            self._cond.notify_all()
+
+    def close(self, timeout=5.0):
+        """Stop the workers and free the shared memory."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._closed.set()
+        for worker in self._workers:
+            with worker.send_lock:
+                try:
+                    if worker.requests is not None:
+                        worker.requests.send(None)
+                except (OSError, ValueError):
+                    pass
+        for worker in self._workers:
+            if worker.process is not None:
+                worker.process.join(timeout)
+                if worker.process.is_alive():
+                    worker.process.kill()
+                    worker.process.join()
+            if worker.supervisor is not None and worker.supervisor is not threading.current_thread():
+                worker.supervisor.join(timeout)
+            with worker.send_lock:
+                self._fail_pending(worker, WorkerError("Inference pool closed."))
+                for conn in (worker.requests, worker.results):
+                    if conn is not None:
+                        conn.close()
+                worker.ring.close()
+                worker.ring.unlink()
+        self._workers = []
+
+    # ---------- Supervision ----------
+    def _supervise(self, worker):
+        while True:
+            try:
+                message = worker.results.recv()
+            except (EOFError, OSError):
+                with worker.send_lock:
+                    with self._cond:
+                        worker.alive = False
+                    self._fail_pending(worker, WorkerCrashed(f"Inference worker {worker.index} exited."))
+                    worker.requests.close()
+                    worker.results.close()
+                if not self._restart(worker):
+                    return
+                continue
+            self._deliver(worker, message)
+
+    def _restart(self, worker):
+        """Keep trying to replace a dead worker. Returns False once the pool is closing."""
+        while not self._closed.wait(self.restart_delay):
+            worker.process.join()
+            try:
+                self._spawn(worker)
+            except WorkerError:
+                continue
+            worker.restarts += 1
+            return True
+        return False
+
+    def _deliver(self, worker, message):
+        _, items, error = message
+        finished = []
+        with self._cond:
+            worker.batches += 1
+            if error is not None:
+                worker.errors += 1
+            for request_id, rows in items:
+                request = worker.pending.pop(request_id, None)
+                if request is None:
+                    continue
+                if request.slot is not None:
+                    worker.free_slots.append(request.slot)
+                worker.frames += 1
+                if error is not None:
+                    request.error = WorkerError(error)
+                else:
+                    request.result = PoolResult(rows)
+                finished.append(request)
+            self._cond.notify_all()
+        for request in finished:
+            request.done.set()
+
+    def _fail_pending(self, worker, error):
+        with self._cond:
+            failed = list(worker.pending.values())
+            worker.pending.clear()
+            worker.free_slots = list(range(worker.slots))
+            self._cond.notify_all()
+        for request in failed:
+            request.error = error
+            request.done.set()
+
+    # ---------- Public API ----------
+    def _send(self, frame, deadline):
+        frame = np.ascontiguousarray(frame)
+        fits = frame.nbytes <= self.slot_bytes
+        with self._cond:
+            while True:
+                if self._closing:
+                    raise WorkerError("Inference pool is closed.")
+                alive = [w for w in self._workers if w.alive and (w.free_slots or not fits)]
+                if alive:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("No inference worker became free in time.")
+                self._cond.wait(remaining)
+            worker = max(alive, key=lambda w: (len(w.free_slots), -len(w.pending)))
+            request = _Request(next(self._ids), worker.free_slots.pop() if fits else None)
+            worker.pending[request.id] = request
+
+        with worker.send_lock:
+            if request.done.is_set():  # the worker died before we got here
+                return request
+            try:
+                if fits:
+                    _frame_view(worker.ring, self.slot_bytes, request.slot, frame.shape, frame.dtype)[...] = frame
+                    worker.requests.send((request.id, request.slot, frame.shape, frame.dtype.str, None))
+                else:
+                    # Rare: a frame bigger than a slot is pickled through the pipe
+                    worker.requests.send((request.id, None, frame.shape, frame.dtype.str, frame))
+            except (OSError, ValueError):
+                pass  # the supervisor fails the request when it sees the worker go
+        return request
+
+    def __call__(self, frames, timeout=None):
+        """Run frames through the pool; returns one result per frame, in order."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        requests = [self._send(frame, deadline) for frame in frames]
+        results = []
+        for request in requests:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not request.done.wait(remaining):
+                raise TimeoutError("Inference did not finish in time.")
+            if request.error is not None:
+                raise request.error
+            results.append(request.result)
+        return results
+
+    def configure(self, **options):
+        """Set the keyword arguments every worker passes to the model (conf, classes, ...).
+
+        Frames already queued may still run with the previous options.
+        """
+        with self._cond:
+            if options == self._options:
+                return
+            self._options = dict(options)
+            workers = [w for w in self._workers if w.alive]
+        for worker in workers:
+            with worker.send_lock:
+                try:
+                    worker.requests.send(dict(options))
+                except (OSError, ValueError):
+                    pass  # a replacement worker gets the options when it starts
+
+    def submit(self, frame, timeout=None):
+        """Run one frame and return its result (same contract as BatchScheduler.submit)."""
+        return self([frame], timeout)[0]
+
+    @property
+    def names(self):
+        return self._names
+
+    def describe(self):
+        return {'backend': 'worker_pool', 'workers': len(self._workers), 'slots': self.slots}
+
+    def stats(self):
+        with self._cond:
+            workers = [{
+                'index': w.index,
+                'pid': w.process.pid if w.process is not None else None,
+                'alive': w.alive,
+                'cores': list(w.cores or []),
+                'in_flight': len(w.pending),
+                'frames': w.frames,
+                'batches': w.batches,
+                'errors': w.errors,
+                'restarts': w.restarts,
+            } for w in self._workers]
+        return {
+            'workers': workers,
+            'alive': sum(1 for w in workers if w['alive']),
+            'in_flight': sum(w['in_flight'] for w in workers),
+            'frames': sum(w['frames'] for w in workers),
+            'restarts': sum(w['restarts'] for w in workers),
+            'slot_bytes': self.slot_bytes,
+        }
+
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def assign_cores(workers, cores_per_worker=None):
+    """Split the usable cores into one set per worker (wrapping if there are too few)."""
+    cores = available_cores()
+    per_worker = cores_per_worker or max(1, len(cores) // workers)
+    return [[cores[(i * per_worker + j) % len(cores)] for j in range(per_worker)] for i in range(workers)]
+
+
+def workers_from_env():
+    """LABCV_INFERENCE_WORKERS as a worker count; 0 keeps inference in-process."""
+    value = os.environ.get('LABCV_INFERENCE_WORKERS', '0').strip().lower()
+    if value == 'auto':
+        per_worker = int(os.environ.get('LABCV_WORKER_CORES', '2'))
+        return max(1, len(available_cores()) // max(1, per_worker))
+    return max(0, int(value or 0))
+
+
+def pool_from_env(weights, workers):
+    """Start a pool that loads `weights` with load_backend_from_env in every worker."""
+    from backends import load_backend_from_env
+
+    cores = os.environ.get('LABCV_WORKER_CORES')
+    pool = InferencePool(
+        functools.partial(load_backend_from_env, weights),
+        workers=workers,
+        cores_per_worker=int(cores) if cores else None,
+        slots=int(os.environ.get('LABCV_WORKER_SLOTS', '4')),
+        max_batch_size=int(os.environ.get('LABCV_BATCH_SIZE', '4')),
+    )
+    return pool.start()